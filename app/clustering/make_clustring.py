@@ -1,13 +1,18 @@
 import pandas as pd
 import numpy as np
 from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+from concurrent.futures import ProcessPoolExecutor
 import matplotlib.pyplot as plt
 import seaborn as sns
 from datetime import datetime
 import io
 import base64
 import os
+import logging
+import threading
+from collections import OrderedDict
 from dotenv import load_dotenv, find_dotenv
 try:
     from langchain.chat_models import ChatOpenAI
@@ -20,67 +25,160 @@ except ImportError:
     SystemMessage = None
 
 # --- データ型自動変換 ---
+
+# 列の型を判定するときに使う行数（欠損を除いた値から等間隔に抽出する）
+SCHEMA_SAMPLE_ROWS = int(os.environ.get("CLUSTER_SCHEMA_SAMPLE", "1000"))
+
+# 判定済みの列の型を保持する件数（列名と読み込み時の型の組ごと）
+SCHEMA_CACHE_SIZE = 64
+
+# ワンホットにする文字列列のユニーク数の上限（未満）
+ONEHOT_MAX_CATEGORIES = 20
+
+_schema_cache = OrderedDict()
+_schema_lock = threading.Lock()
+
+def is_date_column(col):
+    """列名から日付列かどうかを判定する（「曜日」は日付ではない）"""
+    col = str(col)
+    if "曜日" in col:
+        return False
+    return any(x in col for x in ["日", "date", "日時", "誕生日"])
+
+def _sample_values(series, n=SCHEMA_SAMPLE_ROWS):
+    values = series.dropna()
+    if len(values) > n:
+        values = values.iloc[np.linspace(0, len(values) - 1, n).astype(np.int64)]
+    return values
+
+def infer_column_kind(series, col):
+    """
+    列の値の一部から型を判定する
+    戻り値: numeric / age / date_parts / category（文字列）/ None（使えない列）
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "age" if "誕" in str(col) or "birth" in str(col).lower() else "date_parts"
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return "numeric"
+    sample = _sample_values(series)
+    if sample.empty:
+        return None
+    if is_date_column(col) and pd.to_datetime(sample, errors="coerce").notna().any():
+        return "age" if "誕" in str(col) or "birth" in str(col).lower() else "date_parts"
+    # 抽出した値がすべて数値に変換できれば数値列とする
+    if pd.to_numeric(sample, errors="coerce").notna().all():
+        return "numeric"
+    if pd.api.types.is_string_dtype(series) or isinstance(series.dtype, pd.CategoricalDtype):
+        return "category"
+    return None
+
+def infer_schema(df):
+    """
+    各列の型を判定する（列名と読み込み時の型が同じファイルは前回の判定結果を使う）
+    戻り値: [(型, 列名)]
+    """
+    signature = tuple((str(col), str(dtype)) for col, dtype in df.dtypes.items())
+    with _schema_lock:
+        schema = _schema_cache.get(signature)
+        if schema is not None:
+            _schema_cache.move_to_end(signature)
+            return schema
+    schema = [(kind, col) for col in df.columns if (kind := infer_column_kind(df[col], col)) is not None]
+    with _schema_lock:
+        _schema_cache[signature] = schema
+        while len(_schema_cache) > SCHEMA_CACHE_SIZE:
+            _schema_cache.popitem(last=False)
+    logging.info(f"列の型を判定: {dict((col, kind) for kind, col in schema)}")
+    return schema
+
+def _log_coerced(values, converted, col, kind):
+    """
+    変換できずに欠損になった値の件数をログに出す
+    型は抽出した値（またはキャッシュした前回の判定）だけで決めるため、抽出外の値が変換できないことがある
+    """
+    n_coerced = int((converted.isna() & values.notna()).sum())
+    if n_coerced:
+        logging.warning(f"列 {col} の {n_coerced} / {len(values)} 件の値を{kind}に変換できず欠損として扱います")
+    return converted
+
+def to_numeric_column(values, col):
+    if pd.api.types.is_numeric_dtype(values):
+        return values
+    return _log_coerced(values, pd.to_numeric(values, errors="coerce"), col, "数値")
+
+def to_datetime_column(values, col):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    return _log_coerced(values, pd.to_datetime(values, errors="coerce"), col, "日付")
+
 def preprocess_df(df):
-    # 日付型変換
-    for col in df.columns:
-        if any(x in col for x in ["日", "date", "日時", "誕生日"]):
-            try:
-                df[col] = pd.to_datetime(df[col], errors="coerce")
-            except Exception:
-                pass
-    # 数値型変換
-    for col in df.select_dtypes(include=[object]).columns:
-        try:
-            df[col] = pd.to_numeric(df[col], errors="ignore")
-        except Exception:
-            pass
+    """判定した型に従って日付列・数値列を1回ずつ変換する"""
+    for kind, col in infer_schema(df):
+        if kind in ("age", "date_parts"):
+            df[col] = to_datetime_column(df[col], col)
+        elif kind == "numeric":
+            df[col] = to_numeric_column(df[col], col)
     return df
 
-# 柔軟な前処理（型ごとに処理）
-def flexible_preprocess(df):
-    import pandas as pd
-    import numpy as np
-    from datetime import datetime
-    df = preprocess_df(df)
-    feature_cols = []
-    for col in df.columns:
-        col_data = df[col]
-        # 全欠損は除外
-        if bool(col_data.isnull().all()):
+def age_in_years(dates, now=None):
+    """生年月日から満年数（365日単位）を求める"""
+    now = pd.Timestamp(now or datetime.now())
+    return (now - dates).dt.days // 365
+
+def infer_feature_spec(frame):
+    """
+    特徴量の作り方を決める（型は infer_schema、ワンホットのカテゴリは frame の値から決める）
+    ストリーミング時はチャンクごとにワンホットの列などが変わらないよう、先頭チャンクで決めた定義を全チャンクで使う
+    戻り値: [(種類, 列名, カテゴリ一覧)]  種類は numeric / age / date_parts / onehot
+    """
+    spec = []
+    for kind, col in infer_schema(frame):
+        if kind != "category":
+            spec.append((kind, col, None))
             continue
-        # 数値型
-        if pd.api.types.is_numeric_dtype(col_data):
-            feature_cols.append(col)
-        # 日付型
-        elif pd.api.types.is_datetime64_any_dtype(col_data):
-            # 年齢や曜日などに変換
-            if "誕" in col or "birth" in col.lower():
-                df[f"{col}_年齢"] = col_data.apply(lambda x: (datetime.now() - x).days // 365 if pd.notnull(x) else np.nan)
-                feature_cols.append(f"{col}_年齢")
+        categories = frame[col].dropna().unique()
+        if len(categories) < ONEHOT_MAX_CATEGORIES:
+            spec.append(("onehot", col, sorted(categories.tolist(), key=str)))
+    return spec
+
+def apply_feature_spec(chunk, spec):
+    """
+    データを特徴量の定義に従って列ごとに1回で変換する（欠損はそのまま残す）
+    定義の型に変換できなかった値は欠損にし、その件数をログに出す
+    """
+    features = {}
+    now = pd.Timestamp(datetime.now())
+    for kind, col, categories in spec:
+        if kind == "numeric":
+            features[col] = to_numeric_column(chunk[col], col)
+        elif kind in ("age", "date_parts"):
+            dates = to_datetime_column(chunk[col], col)
+            if kind == "age":
+                features[f"{col}_年齢"] = age_in_years(dates, now)
             else:
-                df[f"{col}_年"] = col_data.dt.year
-                df[f"{col}_月"] = col_data.dt.month
-                df[f"{col}_日"] = col_data.dt.day
-                feature_cols += [f"{col}_年", f"{col}_月", f"{col}_日"]
-        # カテゴリ/文字列型
-        elif pd.api.types.is_string_dtype(col_data) or pd.api.types.is_categorical_dtype(col_data):
-            # ユニーク値が少なければワンホット
-            if col_data.nunique() < 20:
-                dummies = pd.get_dummies(col_data, prefix=col, dummy_na=True)
-                df = pd.concat([df, dummies], axis=1)
-                feature_cols += list(dummies.columns)
-            # それ以外は除外
-    # 最終的な特徴量のみ抽出
-    df = df[feature_cols]
+                features[f"{col}_年"] = dates.dt.year
+                features[f"{col}_月"] = dates.dt.month
+                features[f"{col}_日"] = dates.dt.day
+        else:
+            values = chunk[col]
+            for category in categories:
+                features[f"{col}_{category}"] = (values == category).astype(np.float64)
+            features[f"{col}_nan"] = values.isnull().astype(np.float64)
+    return pd.DataFrame(features, index=chunk.index).astype(np.float64)
+
+# 柔軟な前処理（型ごとに処理）
+def flexible_preprocess(df, spec=None):
+    features = apply_feature_spec(df, spec if spec is not None else infer_feature_spec(df))
+    # 全欠損は除外
+    features = features.loc[:, features.notna().any()]
     # NaN補完
-    df = df.fillna(df.mean(numeric_only=True))
-    return df
+    return features.fillna(features.mean())
 
 # --- 特徴量作成 ---
 def create_features(df):
     # 年齢
     if "誕生日" in df.columns:
-        df["年齢"] = df["誕生日"].apply(lambda x: (datetime.now() - x).days // 365 if pd.notnull(x) else np.nan)
+        df["年齢"] = age_in_years(df["誕生日"])
     # 性別
     if "性別区分" in df.columns:
         df["性別"] = df["性別区分"].apply(lambda x: "男性" if isinstance(x, str) and ("1:男性" in x or "男" in x) else "女性")
@@ -125,15 +223,22 @@ def run_kmeans(agg_df, n_clusters=4):
 
 # --- LLMでクラスタ名付け ---
 def name_clusters(agg_df, features):
+    # クラスタごとの特徴量の平均から名前を付ける
+    profiles = agg_df.groupby("クラスタ")[features].mean()
+    cluster_names = name_cluster_profiles(profiles)
+    agg_df["クラスタ名"] = agg_df["クラスタ"].map(lambda x: cluster_names[str(x)])
+    return agg_df, cluster_names
+
+def name_cluster_profiles(profiles):
+    """クラスタ番号ごとの特徴量の代表値（行: クラスタ番号, 列: 特徴量）からクラスタ名を付ける"""
     load_dotenv(find_dotenv("../.env"))
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
     cluster_names = {}
     # LLMが使えない場合やAPIキーがない場合はダミー名
     if not (ChatOpenAI and PromptTemplate and HumanMessage and SystemMessage and OPENAI_API_KEY):
-        for cluster_id in sorted(pd.Series(agg_df["クラスタ"]).unique()):
+        for cluster_id in sorted(profiles.index):
             cluster_names[str(cluster_id)] = f"クラスタ{cluster_id}"
-        agg_df["クラスタ名"] = agg_df["クラスタ"].map(lambda x: cluster_names[str(x)])
-        return agg_df, cluster_names
+        return cluster_names
     llm = ChatOpenAI(model="gpt-4", temperature=0.7, openai_api_key=OPENAI_API_KEY)
     prompt_template = PromptTemplate(
         input_variables=["features"],
@@ -144,13 +249,8 @@ def name_clusters(agg_df, features):
 """
     )
     cluster_descriptions = []
-    for cluster_id in sorted(pd.Series(agg_df["クラスタ"]).unique()):
-        sub = agg_df[agg_df["クラスタ"] == cluster_id][features]
-        desc = sub.mean()
-        if isinstance(desc, pd.Series):
-            desc = desc.round(2).to_dict()
-        else:
-            desc = round(float(desc), 2)
+    for cluster_id in sorted(profiles.index):
+        desc = profiles.loc[cluster_id].round(2).to_dict()
         cluster_descriptions.append((cluster_id, desc))
     for cluster_id, desc in cluster_descriptions:
         prompt = prompt_template.format(features=desc)
@@ -163,13 +263,16 @@ def name_clusters(agg_df, features):
             cluster_names[str(cluster_id)] = response.content.strip()
         except Exception:
             cluster_names[str(cluster_id)] = f"クラスタ{cluster_id}"
-    agg_df["クラスタ名"] = agg_df["クラスタ"].map(lambda x: cluster_names[str(x)])
-    return agg_df, cluster_names
+    return cluster_names
 
 # --- レーダーチャート用データ生成 ---
 def get_radar_chart_data(df, features, cluster_label_col="クラスタ名"):
     # クラスタごとに特徴量の平均値を計算（実数値のまま）
     cluster_summary = df.groupby(cluster_label_col)[features].mean()
+    return radar_chart_from_summary(cluster_summary)
+
+def radar_chart_from_summary(cluster_summary):
+    """クラスタごとの特徴量の平均（行: クラスタ名, 列: 特徴量）からレーダーチャート用データを作成"""
     # min-max正規化
     norm_summary = cluster_summary.copy()
     for metric in cluster_summary.columns:
@@ -189,8 +292,83 @@ def get_radar_chart_data(df, features, cluster_label_col="クラスタ名"):
         data.append(row)
     return data
 
+# --- クラスタ数の自動選択 ---
+
+# クラスタ数を自動選択する際の既定の候補範囲（両端を含む）
+DEFAULT_K_RANGE = (3, 10)
+
+# シルエット係数を計算する行数の上限（全行だと O(n²) になるため抽出する）
+SILHOUETTE_SAMPLE_SIZE = int(os.environ.get("CLUSTER_SILHOUETTE_SAMPLE", "5000"))
+
+_worker_state = None
+
+def _init_worker(X_scaled, sample_idx):
+    global _worker_state
+    _worker_state = (X_scaled, sample_idx)
+
+def _fit_k_task(k):
+    X_scaled, sample_idx = _worker_state
+    return _fit_k(X_scaled, sample_idx, k)
+
+def _fit_k(X_scaled, sample_idx, k):
+    """クラスタ数 k の KMeans を学習し、(k, ラベル, inertia, 抽出行のシルエット係数, 重心) を返す"""
+    model = KMeans(n_clusters=k, random_state=42, n_init='auto').fit(X_scaled)
+    labels = model.labels_
+    sample_labels = labels[sample_idx]
+    silhouette = float(silhouette_score(X_scaled[sample_idx], sample_labels)) if len(np.unique(sample_labels)) > 1 else float("nan")
+    return k, labels, float(model.inertia_), silhouette, model.cluster_centers_
+
+def sweep_k(X_scaled, k_range=DEFAULT_K_RANGE, n_jobs=1, sample_size=SILHOUETTE_SAMPLE_SIZE):
+    """
+    クラスタ数の候補ごとに KMeans を学習して評価する（スケーリング済みの特徴量を全候補で共有）
+    n_jobs > 1 のときは候補を複数プロセスで並列に学習する
+    シルエット係数は全候補で同じ抽出行を使い、最大の k（同値なら小さい k）を推奨する
+    戻り値: (推奨の k, [{"k", "inertia", "silhouette"}], {k: ラベル}, {k: 重心})
+    """
+    k_min, k_max = k_range
+    k_values = [k for k in range(max(k_min, 2), k_max + 1) if k < len(X_scaled)]
+    if not k_values:
+        raise ValueError(f"クラスタ数の候補がありません（行数 {len(X_scaled)}）")
+    rng = np.random.default_rng(42)
+    sample_idx = np.sort(rng.choice(len(X_scaled), min(sample_size, len(X_scaled)), replace=False))
+
+    if n_jobs <= 1 or len(k_values) == 1:
+        results = [_fit_k(X_scaled, sample_idx, k) for k in k_values]
+    else:
+        # 特徴量はワーカーの初期化時に1回だけ渡す
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(k_values)), initializer=_init_worker, initargs=(X_scaled, sample_idx)) as executor:
+            results = list(executor.map(_fit_k_task, k_values))
+
+    scores = [{"k": k, "inertia": inertia, "silhouette": silhouette} for k, _, inertia, silhouette, _ in results]
+    candidates = {k: labels for k, labels, _, _, _ in results}
+    centers = {k: center for k, _, _, _, center in results}
+    valid = [score for score in scores if not np.isnan(score["silhouette"])]
+    recommended = max(valid, key=lambda score: (score["silhouette"], -score["k"]))["k"] if valid else k_values[0]
+    logging.info(f"クラスタ数の自動選択: 推奨 k={recommended}, 候補 {k_values}")
+    return recommended, scores, candidates, centers
+
+def k_range_from_form(form):
+    """
+    リクエストのフォーム値からクラスタ数の候補範囲を作成する
+    n_clusters が "auto" のときだけ (k_min, k_max) を返し、それ以外は None
+    """
+    if str(form.get("n_clusters", "")).lower() != "auto":
+        return None
+    k_min = int(form.get("k_min", str(DEFAULT_K_RANGE[0])))
+    k_max = int(form.get("k_max", str(DEFAULT_K_RANGE[1])))
+    if k_min < 2 or k_max < k_min:
+        raise ValueError("k_minは2以上、k_maxはk_min以上を指定してください")
+    return k_min, k_max
+
 # --- メイン処理関数 ---
-def cluster_main(df, n_clusters=4, selected_columns=None):
+def cluster_main(df, n_clusters=4, selected_columns=None, k_range=None, n_jobs=1, spec=None, init_centroids=None, cluster_names=None):
+    """
+    顧客データをクラスタリングする
+    spec: 特徴量の定義（保存済みモデルと同じ変換を使う場合に指定）
+    init_centroids: 前回の重心（元の尺度, 列は特徴量）。特徴量が一致すれば KMeans をそこから開始する（ウォームスタート）
+    cluster_names: ウォームスタート時に引き継ぐクラスタ名（LLM で付け直さない）
+    戻り値の model は assign 用に保存する学習結果（特徴量の定義・補完値・スケーリング・重心・クラスタ名）
+    """
     try:
         import logging
         logging.info(f"クラスタリング開始: {len(df)} 行, {len(df.columns)} 列")
@@ -199,7 +377,10 @@ def cluster_main(df, n_clusters=4, selected_columns=None):
         if selected_columns is not None:
             df = df[selected_columns]
 
-        df = flexible_preprocess(df)
+        if spec is None:
+            spec = infer_feature_spec(df)
+        df = flexible_preprocess(df, spec=spec)
+        fill_values = df.mean()
         logging.info(f"前処理完了: {len(df)} 行, {len(df.columns)} 列")
 
         # 特徴量リスト
@@ -210,13 +391,43 @@ def cluster_main(df, n_clusters=4, selected_columns=None):
         X_scaled = scaler.fit_transform(df[features])
         logging.info(f"スケーリング完了: {X_scaled.shape}")
 
-        df["クラスタ"] = KMeans(n_clusters=n_clusters, random_state=42, n_init='auto').fit_predict(X_scaled)
-        logging.info("K-means完了")
+        k_sweep = None
+        warm_start = init_centroids is not None and list(init_centroids.columns) == features
+        if init_centroids is not None and not warm_start:
+            logging.info("特徴量が前回のモデルと異なるため、ウォームスタートせずに学習します")
+        if warm_start:
+            # 前回の重心を今回のスケーリングに合わせてから開始する
+            n_clusters = len(init_centroids)
+            kmeans = KMeans(n_clusters=n_clusters, init=scaler.transform(init_centroids), n_init=1).fit(X_scaled)
+            df["クラスタ"] = kmeans.labels_
+            centers = kmeans.cluster_centers_
+            n_iter = int(kmeans.n_iter_)
+        elif k_range is not None:
+            # クラスタ数の候補をまとめて学習し、推奨の k の結果を使う
+            n_clusters, scores, candidates, sweep_centers = sweep_k(X_scaled, k_range=k_range, n_jobs=n_jobs)
+            df["クラスタ"] = candidates[n_clusters]
+            centers = sweep_centers[n_clusters]
+            n_iter = None
+            k_sweep = {
+                "recommended_k": n_clusters,
+                "scores": scores,
+                "candidate_labels": {str(k): labels.tolist() for k, labels in candidates.items()}
+            }
+        else:
+            kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init='auto').fit(X_scaled)
+            df["クラスタ"] = kmeans.labels_
+            centers = kmeans.cluster_centers_
+            n_iter = int(kmeans.n_iter_)
+        logging.info(f"K-means完了: 反復 {n_iter}, ウォームスタート {warm_start}")
 
-        # LLMでクラスタ名付け
-        logging.info("LLMクラスタ名付け開始")
-        df, cluster_names = name_clusters(df, features)
-        logging.info("LLMクラスタ名付け完了")
+        if warm_start and cluster_names is not None and len(cluster_names) == n_clusters:
+            # 重心の番号は前回と対応するため、クラスタ名を引き継ぐ
+            df["クラスタ名"] = df["クラスタ"].map(lambda x: cluster_names[str(x)])
+        else:
+            # LLMでクラスタ名付け
+            logging.info("LLMクラスタ名付け開始")
+            df, cluster_names = name_clusters(df, features)
+            logging.info("LLMクラスタ名付け完了")
 
         # レーダーチャートデータ生成
         logging.info("レーダーチャートデータ生成開始")
@@ -224,11 +435,26 @@ def cluster_main(df, n_clusters=4, selected_columns=None):
         logging.info("レーダーチャートデータ生成完了")
 
         logging.info("クラスタリング処理完了")
-        return {
+        result = {
             "agg_df": df,
             "cluster_names": cluster_names,
-            "radar_chart_data": radar_chart_data
+            "radar_chart_data": radar_chart_data,
+            "model": {
+                "spec": spec,
+                "features": features,
+                "fill_values": fill_values.to_numpy(dtype=np.float64),
+                "scaler_mean": scaler.mean_,
+                "scaler_scale": scaler.scale_,
+                "centroids": centers,
+                "cluster_names": cluster_names,
+                "n_rows": len(df),
+                "n_iter": n_iter,
+                "warm_start": warm_start
+            }
         }
+        if k_sweep is not None:
+            result["k_sweep"] = k_sweep
+        return result
 
     except Exception as e:
         import logging
@@ -237,3 +463,158 @@ def cluster_main(df, n_clusters=4, selected_columns=None):
         logging.error(f"エラー詳細: {type(e).__name__}")
         logging.error(f"スタックトレース: {traceback.format_exc()}")
         raise
+
+# --- ストリーミングクラスタリング（MiniBatchKMeans） ---
+
+# 1回に読み込む行数
+CLUSTER_CHUNKSIZE = int(os.environ.get("CLUSTER_CHUNKSIZE", "200000"))
+
+# MiniBatchKMeans のミニバッチの行数
+CLUSTER_BATCH_SIZE = int(os.environ.get("CLUSTER_BATCH_SIZE", "4096"))
+
+# 返却する agg_df のプレビュー行数（全件はダウンロード用 CSV に書き出す）
+CLUSTER_PREVIEW_ROWS = 1000
+
+def iter_table_chunks(file_path, filename, chunksize=CLUSTER_CHUNKSIZE, usecols=None):
+    """CSV は chunksize 行ずつ読み込む（Excel は分割して読めないため全体を読んでから分割する）"""
+    if filename and filename.endswith(".csv"):
+        yield from pd.read_csv(file_path, chunksize=chunksize, usecols=usecols)
+        return
+    df = pd.read_excel(file_path, usecols=usecols)
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start:start + chunksize]
+
+def _batches(X, batch_size):
+    for start in range(0, len(X), batch_size):
+        yield X[start:start + batch_size]
+
+def cluster_main_streaming(file_path, filename, n_clusters=4, selected_columns=None,
+                           chunksize=CLUSTER_CHUNKSIZE, output_path=None, epochs=1,
+                           spec=None, init_centroids=None, cluster_names=None):
+    """
+    ファイルをチャンクごとに読み込んでクラスタリングする（全体をメモリに載せない）
+    1回目: StandardScaler.partial_fit で平均・分散を求める
+    2回目: MiniBatchKMeans.partial_fit で重心を求める（epochs 回繰り返す）
+    3回目: クラスタを割り当て、output_path に書き出しながらクラスタごとの合計を集計する
+    クラスタ名は重心（元の尺度に戻した値）、レーダーチャートはクラスタごとの平均から作成する
+    spec, init_centroids, cluster_names は cluster_main と同じ（ウォームスタート時は MiniBatchKMeans を前回の重心から開始する）
+    戻り値: cluster_main と同じ形式（agg_df は先頭 CLUSTER_PREVIEW_ROWS 行）+ n_rows, centroids
+    """
+    try:
+        logging.info(f"ストリーミングクラスタリング開始: {filename}, チャンク {chunksize} 行")
+        def chunks():
+            return iter_table_chunks(file_path, filename, chunksize=chunksize, usecols=selected_columns)
+
+        first = next(chunks(), None)
+        if first is None or first.empty:
+            raise ValueError("データがありません")
+        if spec is None:
+            spec = infer_feature_spec(first)
+        if not spec:
+            raise ValueError("クラスタリングに使える列がありません")
+
+        # 1回目: スケーリングの統計量（欠損は無視される）
+        scaler = StandardScaler()
+        n_rows = 0
+        for chunk in chunks():
+            scaler.partial_fit(apply_feature_spec(chunk, spec).to_numpy())
+            n_rows += len(chunk)
+        features = list(apply_feature_spec(first.head(1), spec).columns)
+        # 欠損は列全体の平均で補完する（flexible_preprocess の fillna(mean) と同じ）
+        fill_values = np.nan_to_num(scaler.mean_)
+        if n_rows < n_clusters:
+            raise ValueError(f"行数({n_rows})がクラスタ数({n_clusters})より少ないです")
+        logging.info(f"スケーリング統計量計算完了: {n_rows} 行, 特徴量 {features}")
+
+        def scaled(chunk):
+            X = apply_feature_spec(chunk, spec).to_numpy()
+            X = np.where(np.isnan(X), fill_values, X)
+            return X, scaler.transform(X)
+
+        # 2回目: 重心
+        warm_start = init_centroids is not None and list(init_centroids.columns) == features
+        if init_centroids is not None and not warm_start:
+            logging.info("特徴量が前回のモデルと異なるため、ウォームスタートせずに学習します")
+        if warm_start:
+            n_clusters = len(init_centroids)
+            kmeans = MiniBatchKMeans(n_clusters=n_clusters, init=scaler.transform(init_centroids.to_numpy()),
+                                     random_state=42, batch_size=CLUSTER_BATCH_SIZE, n_init=1)
+        else:
+            kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, batch_size=CLUSTER_BATCH_SIZE, n_init=3)
+        pending = None
+        for _ in range(epochs):
+            for chunk in chunks():
+                _, X_scaled = scaled(chunk)
+                for batch in _batches(X_scaled, CLUSTER_BATCH_SIZE):
+                    # 初回はクラスタ数以上の行がそろってから初期化する
+                    if pending is not None:
+                        batch = np.vstack([pending, batch])
+                        pending = None
+                    if not hasattr(kmeans, "cluster_centers_") and len(batch) < n_clusters:
+                        pending = batch
+                        continue
+                    kmeans.partial_fit(batch)
+        if pending is not None:
+            kmeans.partial_fit(pending)
+        logging.info(f"MiniBatchKMeans 完了: ウォームスタート {warm_start}")
+
+        # クラスタ名は重心を元の尺度に戻した値から付ける（ウォームスタート時は前回の名前を引き継ぐ）
+        centroids = pd.DataFrame(scaler.inverse_transform(kmeans.cluster_centers_), columns=features)
+        if not (warm_start and cluster_names is not None and len(cluster_names) == n_clusters):
+            cluster_names = name_cluster_profiles(centroids)
+
+        # 3回目: 割り当て・書き出し・クラスタごとの集計
+        counts = np.zeros(n_clusters)
+        sums = np.zeros((n_clusters, len(features)))
+        preview = []
+        preview_rows = 0
+        for i, chunk in enumerate(chunks()):
+            X, X_scaled = scaled(chunk)
+            labels = kmeans.predict(X_scaled)
+            counts += np.bincount(labels, minlength=n_clusters)
+            np.add.at(sums, labels, X)
+            labeled = pd.DataFrame(X, columns=features, index=chunk.index)
+            labeled["クラスタ"] = labels
+            labeled["クラスタ名"] = [cluster_names[str(label)] for label in labels]
+            if output_path is not None:
+                labeled.to_csv(output_path, mode="w" if i == 0 else "a", header=(i == 0), index=False,
+                               encoding="utf-8-sig" if i == 0 else "utf-8")
+            if preview_rows < CLUSTER_PREVIEW_ROWS:
+                preview.append(labeled.head(CLUSTER_PREVIEW_ROWS - preview_rows))
+                preview_rows += len(preview[-1])
+        logging.info("クラスタ割り当て完了")
+
+        # 同じ名前のクラスタはまとめて平均する（get_radar_chart_data と同じ）
+        names = [cluster_names[str(c)] for c in range(n_clusters)]
+        sum_by_name = pd.DataFrame(sums, columns=features).groupby(names).sum()
+        count_by_name = pd.Series(counts).groupby(names).sum()
+        summary = sum_by_name.div(count_by_name.replace(0, np.nan), axis=0)
+        radar_chart_data = radar_chart_from_summary(summary)
+
+        logging.info("ストリーミングクラスタリング処理完了")
+        return {
+            "agg_df": pd.concat(preview) if preview else pd.DataFrame(columns=features + ["クラスタ", "クラスタ名"]),
+            "cluster_names": cluster_names,
+            "radar_chart_data": radar_chart_data,
+            "n_rows": n_rows,
+            "cluster_sizes": {str(c): int(counts[c]) for c in range(n_clusters)},
+            "centroids": centroids.round(4).to_dict(orient="records"),
+            "model": {
+                "spec": spec,
+                "features": features,
+                "fill_values": fill_values,
+                "scaler_mean": scaler.mean_,
+                "scaler_scale": scaler.scale_,
+                "centroids": kmeans.cluster_centers_,
+                "cluster_names": cluster_names,
+                "n_rows": n_rows,
+                "n_iter": None,
+                "warm_start": warm_start
+            }
+        }
+
+    except Exception as e:
+        import traceback
+        logging.error(f"ストリーミングクラスタリングエラー: {str(e)}")
+        logging.error(f"スタックトレース: {traceback.format_exc()}")
+        raise
@@ -0,0 +1,187 @@
+import os
+import re
+import json
+import tempfile
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from .make_clustring import apply_feature_spec
+
+# 学習済みクラスタリングモデルの保存先
+CLUSTER_MODEL_DIR = os.environ.get("CLUSTER_MODEL_DIR", os.path.join(tempfile.gettempdir(), "cluster_models"))
+
+# 割り当て時に一度に距離を計算する行数（行数 × クラスタ数の距離行列のメモリ使用量の調整用）
+ASSIGN_BATCH_ROWS = int(os.environ.get("CLUSTER_ASSIGN_BATCH_ROWS", "100000"))
+
+# メモリ上に保持する読み込み済みモデルの件数（モデルIDごと）
+CLUSTER_MODEL_CACHE_MAX = int(os.environ.get("CLUSTER_MODEL_CACHE_MAX", "16"))
+
+_MODEL_ID_PATTERN = re.compile(r'^[\w\-]+$')
+
+# モデルごとの排他ロック
+_model_locks = {}
+_model_locks_guard = threading.Lock()
+
+# 読み込み済みモデルのメモリキャッシュ（最近使ったものから CLUSTER_MODEL_CACHE_MAX 件）
+_loaded_models = OrderedDict()
+_loaded_models_lock = threading.Lock()
+
+class ClusterModel:
+    """
+    学習済みのクラスタリングモデル（再学習せずに新しい行へクラスタを割り当てる）
+    - spec: 特徴量の定義（infer_feature_spec の戻り値）
+    - features / fill_values: 特徴量の列と欠損の補完値（学習データの平均）
+    - scaler_mean / scaler_scale: StandardScaler の平均・標準偏差
+    - centroids: スケーリング後の空間での重心
+    - cluster_names: クラスタ番号（文字列）→ クラスタ名
+    """
+    def __init__(self, spec, features, fill_values, scaler_mean, scaler_scale, centroids, cluster_names,
+                 n_rows=0, created_at=None, updated_at=None, n_fits=1):
+        self.spec = [tuple(item) for item in spec]
+        self.features = list(features)
+        self.fill_values = np.asarray(fill_values, dtype=np.float64)
+        self.scaler_mean = np.asarray(scaler_mean, dtype=np.float64)
+        self.scaler_scale = np.asarray(scaler_scale, dtype=np.float64)
+        self.centroids = np.asarray(centroids, dtype=np.float64)
+        self.cluster_names = {str(k): v for k, v in cluster_names.items()}
+        self.n_rows = int(n_rows)
+        self.created_at = created_at or datetime.now().isoformat()
+        self.updated_at = updated_at or self.created_at
+        self.n_fits = int(n_fits)
+
+    @classmethod
+    def from_result(cls, model, previous=None):
+        """cluster_main / cluster_main_streaming の戻り値の model から作成（previous があれば作成日時を引き継ぐ）"""
+        return cls(
+            model["spec"], model["features"], model["fill_values"], model["scaler_mean"], model["scaler_scale"],
+            model["centroids"], model["cluster_names"], n_rows=model["n_rows"],
+            created_at=previous.created_at if previous is not None else None,
+            updated_at=datetime.now().isoformat(),
+            n_fits=previous.n_fits + 1 if previous is not None else 1
+        )
+
+    @property
+    def n_clusters(self):
+        return len(self.centroids)
+
+    def centroids_original(self):
+        """重心を元の尺度に戻した表（ウォームスタートの初期値に使う）"""
+        return pd.DataFrame(self.centroids * self.scaler_scale + self.scaler_mean, columns=self.features)
+
+    def transform(self, df):
+        """学習時と同じ定義で特徴量を作り、補完・スケーリングした配列を返す"""
+        missing = [col for _, col, _ in self.spec if col not in df.columns]
+        if missing:
+            raise ValueError(f"モデルの学習に使った列がありません: {', '.join(map(str, missing))}")
+        features = apply_feature_spec(df, self.spec).reindex(columns=self.features)
+        X = features.to_numpy(dtype=np.float64)
+        X = np.where(np.isnan(X), self.fill_values, X)
+        return (X - self.scaler_mean) / self.scaler_scale
+
+    def assign(self, df, batch_size=ASSIGN_BATCH_ROWS):
+        """
+        最も近い重心のクラスタを割り当てる
+        戻り値: (クラスタ番号の配列, 重心までの距離の配列)
+        """
+        X = self.transform(df)
+        centroid_norms = (self.centroids ** 2).sum(axis=1)
+        labels = np.empty(len(X), dtype=np.int64)
+        distances = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), batch_size):
+            block = X[start:start + batch_size]
+            # ||x - c||² = ||x||² - 2 x·c + ||c||²
+            d2 = (block ** 2).sum(axis=1)[:, None] - 2.0 * block @ self.centroids.T + centroid_norms
+            nearest = d2.argmin(axis=1)
+            labels[start:start + batch_size] = nearest
+            distances[start:start + batch_size] = np.sqrt(np.maximum(d2[np.arange(len(block)), nearest], 0.0))
+        return labels, distances
+
+    def label_names(self, labels):
+        names = np.array([self.cluster_names.get(str(c), f"クラスタ{c}") for c in range(self.n_clusters)], dtype=object)
+        return names[labels]
+
+    def summary(self):
+        return {
+            "n_clusters": self.n_clusters,
+            "features": self.features,
+            "cluster_names": self.cluster_names,
+            "centroids": self.centroids_original().round(4).to_dict(orient="records"),
+            "n_rows": self.n_rows,
+            "n_fits": self.n_fits,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        }
+
+    def save(self, path):
+        meta = {
+            "spec": self.spec,
+            "features": self.features,
+            "cluster_names": self.cluster_names,
+            "n_rows": self.n_rows,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "n_fits": self.n_fits
+        }
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                fill_values=self.fill_values,
+                scaler_mean=self.scaler_mean,
+                scaler_scale=self.scaler_scale,
+                centroids=self.centroids,
+                meta=np.array(json.dumps(meta, ensure_ascii=False, default=str))
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            return cls(
+                meta["spec"], meta["features"], data["fill_values"], data["scaler_mean"], data["scaler_scale"],
+                data["centroids"], meta["cluster_names"], n_rows=meta["n_rows"],
+                created_at=meta["created_at"], updated_at=meta["updated_at"], n_fits=meta["n_fits"]
+            )
+
+def cluster_model_path(model_id):
+    if not _MODEL_ID_PATTERN.match(model_id or ''):
+        raise ValueError(f"無効なモデルIDです: {model_id}")
+    return os.path.join(CLUSTER_MODEL_DIR, f"{model_id}.npz")
+
+def cluster_model_lock(model_id):
+    with _model_locks_guard:
+        return _model_locks.setdefault(model_id, threading.Lock())
+
+def _cache_model(model_id, model):
+    """読み込み済みモデルを保持する（古いものから削除）"""
+    with _loaded_models_lock:
+        _loaded_models[model_id] = model
+        _loaded_models.move_to_end(model_id)
+        while len(_loaded_models) > CLUSTER_MODEL_CACHE_MAX:
+            _loaded_models.popitem(last=False)
+
+def load_cluster_model(model_id):
+    """保存済みのモデルを読み込む（存在しなければ None）"""
+    with _loaded_models_lock:
+        model = _loaded_models.get(model_id)
+        if model is not None:
+            _loaded_models.move_to_end(model_id)
+            return model
+    path = cluster_model_path(model_id)
+    if not os.path.exists(path):
+        return None
+    model = ClusterModel.load(path)
+    _cache_model(model_id, model)
+    return model
+
+def save_cluster_model(model_id, model):
+    os.makedirs(CLUSTER_MODEL_DIR, exist_ok=True)
+    path = cluster_model_path(model_id)
+    # 書き込み途中のファイルを読まないよう一時ファイル経由で置き換える
+    tmp_path = path + ".tmp"
+    model.save(tmp_path)
+    os.replace(tmp_path, path)
+    _cache_model(model_id, model)
+    logging.info(f"クラスタリングモデル保存完了: {path}")
@@ -0,0 +1,272 @@
+import os
+import operator
+import threading
+import logging
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# メモリ上に保持するクラスタリング結果の件数（結果IDごと）
+RESULT_STORE_MAX = int(os.environ.get("CLUSTER_RESULT_STORE_MAX", "8"))
+
+# 1ページの既定の行数と上限
+RESULT_PAGE_SIZE = 100
+RESULT_MAX_PAGE_SIZE = 10000
+
+# ファイルに書き出した結果を読むときのチャンク行数
+RESULT_READ_CHUNKSIZE = int(os.environ.get("CLUSTER_RESULT_CHUNKSIZE", "200000"))
+
+# ファイルに書き出した結果で、絞り込み・並べ替えに使った列をメモリに保持する列数（結果ごと）
+RESULT_COLUMN_CACHE_MAX = int(os.environ.get("CLUSTER_RESULT_COLUMN_CACHE", "4"))
+
+# フィルタの演算子（filter=列名:演算子:値）
+FILTER_OPERATORS = ("eq", "ne", "lt", "le", "gt", "ge", "contains")
+
+_COMPARISONS = {
+    "eq": operator.eq, "ne": operator.ne,
+    "lt": operator.lt, "le": operator.le,
+    "gt": operator.gt, "ge": operator.ge
+}
+
+_results = OrderedDict()
+_latest_result_id = None
+_result_lock = threading.Lock()
+
+class ClusterResult:
+    """
+    クラスタリング結果の列指向の表と、クラスタ名 → 行番号の索引
+    クラスタでの絞り込みは索引の行番号だけを参照し、表全体を走査しない
+    """
+    def __init__(self, frame, label_col="クラスタ名"):
+        self.frame = frame.reset_index(drop=True)
+        self.label_col = label_col
+        if label_col in self.frame.columns:
+            self.label_index = {
+                str(label): np.asarray(rows, dtype=np.int64)
+                for label, rows in self.frame.groupby(label_col, sort=False).indices.items()
+            }
+        else:
+            self.label_index = {}
+
+    @property
+    def n_rows(self):
+        return len(self.frame)
+
+    @property
+    def columns(self):
+        return [str(col) for col in self.frame.columns]
+
+    def cluster_sizes(self):
+        """クラスタ名ごとの行数"""
+        return {label: int(len(rows)) for label, rows in self.label_index.items()}
+
+    def _check_column(self, col):
+        if col not in self.columns:
+            raise ValueError(f"列が見つかりません: {col}")
+
+    def _values(self, col, rows):
+        """rows の行の col 列（0 始まりの連番インデックス）"""
+        self._check_column(col)
+        return self.frame[col].iloc[rows].reset_index(drop=True)
+
+    def _take(self, rows, columns=None):
+        """rows の順に並べた行"""
+        page = self.frame.iloc[rows]
+        return page[columns] if columns else page
+
+    def _iter_frames(self, rows, columns=None):
+        yield self._take(rows, columns)
+
+    def _filter_mask(self, values, op, value):
+        if op == "contains":
+            return values.astype(str).str.contains(value, regex=False).to_numpy()
+        if pd.api.types.is_numeric_dtype(values):
+            try:
+                value = float(value)
+            except ValueError:
+                raise ValueError(f"数値の列には数値を指定してください: {values.name}")
+        else:
+            values = values.astype(str)
+        return _COMPARISONS[op](values, value).to_numpy()
+
+    def _select(self, clusters=None, filters=(), sort=None, ascending=True):
+        """条件に合う行番号（並べ替え済み）"""
+        if clusters:
+            parts = [self.label_index.get(str(label), np.empty(0, dtype=np.int64)) for label in clusters]
+            rows = np.sort(np.concatenate(parts))
+        else:
+            rows = np.arange(self.n_rows)
+        for col, op, value in filters:
+            rows = rows[self._filter_mask(self._values(col, rows), op, value)]
+        if sort is not None:
+            keys = self._values(sort, rows)
+            order = keys.sort_values(ascending=ascending, kind="stable", na_position="last").index.to_numpy()
+            rows = rows[order]
+        return rows
+
+    def query(self, clusters=None, filters=(), sort=None, ascending=True, columns=None, offset=0, limit=RESULT_PAGE_SIZE):
+        """
+        絞り込み・並べ替え・列の選択をしたページ
+        clusters: クラスタ名のリスト（索引で行番号を取り出す）
+        filters: [(列名, 演算子, 値)]
+        limit: None なら offset 以降の全行
+        戻り値: (条件に合う行数, ページの DataFrame)
+        """
+        for col in columns or ():
+            self._check_column(col)
+        rows = self._select(clusters, filters, sort, ascending)
+        page = rows[offset:] if limit is None else rows[offset:offset + limit]
+        return len(rows), self._take(page, columns)
+
+    def write_csv(self, path, clusters=None, filters=(), sort=None, ascending=True, columns=None, offset=0, limit=None):
+        """条件に合う行を CSV に書き出す（ファイルの結果は全行をメモリに載せずに書き出す）"""
+        for col in columns or ():
+            self._check_column(col)
+        rows = self._select(clusters, filters, sort, ascending)
+        rows = rows[offset:] if limit is None else rows[offset:offset + limit]
+        first = True
+        for frame in self._iter_frames(rows, columns):
+            frame.to_csv(path, mode="w" if first else "a", header=first, index=False,
+                         encoding="utf-8-sig" if first else "utf-8")
+            first = False
+        if first:
+            pd.DataFrame(columns=columns or self.columns).to_csv(path, index=False, encoding="utf-8-sig")
+        return len(rows)
+
+class ClusterResultFile(ClusterResult):
+    """
+    ファイル（CSV）に書き出したクラスタリング結果
+    メモリにはクラスタ名 → 行番号の索引と、絞り込み・並べ替えに使った列（RESULT_COLUMN_CACHE_MAX 列まで）を持ち、
+    ページの行はその都度ファイルから読む
+    ストリーミングでクラスタリングした結果を、全件をメモリに載せずにページ単位で返すために使う
+    """
+    def __init__(self, path, label_col="クラスタ名", chunksize=RESULT_READ_CHUNKSIZE):
+        self.path = path
+        self.label_col = label_col
+        self.chunksize = chunksize
+        self._columns = [str(col) for col in self._read(nrows=0).columns]
+        parts = {}
+        n_rows = 0
+        for chunk in self._read(usecols=[label_col if label_col in self._columns else self._columns[0]], chunksize=chunksize):
+            if label_col in chunk.columns:
+                for label, rows in chunk.groupby(label_col, sort=False).indices.items():
+                    parts.setdefault(str(label), []).append(np.asarray(rows, dtype=np.int64) + n_rows)
+            n_rows += len(chunk)
+        self._n_rows = n_rows
+        self.label_index = {label: np.concatenate(rows) for label, rows in parts.items()}
+        self._column_cache = OrderedDict()
+        self._column_lock = threading.Lock()
+
+    @property
+    def n_rows(self):
+        return self._n_rows
+
+    @property
+    def columns(self):
+        return self._columns
+
+    def _read(self, **kwargs):
+        return pd.read_csv(self.path, encoding="utf-8-sig", **kwargs)
+
+    def _column(self, col):
+        """col 列の全行（一度読んだ列は保持し、次のリクエストではファイルを読み直さない）"""
+        with self._column_lock:
+            values = self._column_cache.get(col)
+            if values is not None:
+                self._column_cache.move_to_end(col)
+                return values
+        values = self._read(usecols=[col])[col]
+        with self._column_lock:
+            self._column_cache[col] = values
+            while len(self._column_cache) > RESULT_COLUMN_CACHE_MAX:
+                self._column_cache.popitem(last=False)
+        return values
+
+    def _values(self, col, rows):
+        self._check_column(col)
+        return self._column(col).iloc[rows].reset_index(drop=True)
+
+    def _iter_sorted(self, rows, columns):
+        """昇順の行番号の行をチャンクごとに読み出す"""
+        start = 0
+        for chunk in self._read(usecols=columns, chunksize=self.chunksize):
+            end = start + len(chunk)
+            lo, hi = np.searchsorted(rows, [start, end])
+            if hi > lo:
+                yield chunk.iloc[rows[lo:hi] - start]
+            start = end
+            if hi >= len(rows):
+                break
+
+    def _take(self, rows, columns=None):
+        order = np.argsort(rows, kind="stable")
+        frames = list(self._iter_sorted(rows[order], columns))
+        page = pd.concat(frames) if frames else self._read(usecols=columns, nrows=0)
+        # 読み出した順（行番号の昇順）から rows の順に並べ直す
+        inverse = np.empty(len(order), dtype=np.int64)
+        inverse[order] = np.arange(len(order))
+        return page.iloc[inverse][columns or self.columns]
+
+    def _iter_frames(self, rows, columns=None):
+        if np.all(rows[1:] >= rows[:-1]):
+            yield from self._iter_sorted(rows, columns)
+            return
+        for start in range(0, len(rows), self.chunksize):
+            yield self._take(rows[start:start + self.chunksize], columns)
+
+def result_query_from_args(args):
+    """
+    リクエストのクエリ文字列から query の引数を作成する
+    cluster（複数可）, filter=列名:演算子:値（複数可）, sort, order=asc|desc, columns=列,列, offset, limit
+    """
+    filters = []
+    for item in args.getlist("filter"):
+        parts = item.split(":", 2)
+        if len(parts) != 3 or parts[1] not in FILTER_OPERATORS:
+            raise ValueError(f"filterは 列名:演算子:値 の形式で、演算子は {', '.join(FILTER_OPERATORS)} のいずれかを指定してください")
+        filters.append(tuple(parts))
+    order = args.get("order", "asc")
+    if order not in ("asc", "desc"):
+        raise ValueError("orderは asc または desc を指定してください")
+    offset = int(args.get("offset", "0"))
+    limit = int(args.get("limit", str(RESULT_PAGE_SIZE)))
+    if offset < 0 or not 1 <= limit <= RESULT_MAX_PAGE_SIZE:
+        raise ValueError(f"offsetは0以上、limitは1〜{RESULT_MAX_PAGE_SIZE}を指定してください")
+    columns = [col for col in args.get("columns", "").split(",") if col]
+    return {
+        "clusters": args.getlist("cluster"),
+        "filters": filters,
+        "sort": args.get("sort") or None,
+        "ascending": order == "asc",
+        "columns": columns or None,
+        "offset": offset,
+        "limit": limit
+    }
+
+def register_cluster_result(result_id, frame):
+    """結果IDのクラスタリング結果を保持する（古いものから削除）"""
+    return _register(result_id, ClusterResult(frame))
+
+def register_cluster_result_file(result_id, path):
+    """ファイルに書き出したクラスタリング結果を、索引だけメモリに載せて保持する"""
+    return _register(result_id, ClusterResultFile(path))
+
+def _register(result_id, result):
+    global _latest_result_id
+    with _result_lock:
+        _results[result_id] = result
+        _results.move_to_end(result_id)
+        _latest_result_id = result_id
+        while len(_results) > RESULT_STORE_MAX:
+            _results.popitem(last=False)
+    logging.info(f"クラスタリング結果登録: {result_id} ({result.n_rows} 行, {len(result.label_index)} クラスタ)")
+    return result
+
+def get_cluster_result(result_id=None):
+    """結果IDのクラスタリング結果（省略時は最後に登録した結果, なければ None）"""
+    with _result_lock:
+        result_id = result_id or _latest_result_id
+        result = _results.get(result_id)
+        if result is not None:
+            _results.move_to_end(result_id)
+    return result
@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify, session, send_file
 import pandas as pd
-from .make_clustring import cluster_main
+from .make_clustring import cluster_main, cluster_main_streaming, k_range_from_form, iter_table_chunks, CLUSTER_CHUNKSIZE, CLUSTER_PREVIEW_ROWS
+from .result_store import register_cluster_result, register_cluster_result_file, get_cluster_result, result_query_from_args
+from .model_store import ClusterModel, load_cluster_model, save_cluster_model, cluster_model_lock, cluster_model_path
 import logging
 import io
 import tempfile
@@ -8,6 +10,7 @@ import os
 from datetime import datetime
 import time
 import traceback
+import uuid
 import copy
 import numpy as np
 import json
@@ -25,10 +28,6 @@ logger = logging.getLogger(__name__)
 
 clustering_bp = Blueprint("clustering", __name__)
 
-# クラスタリング結果を保存するグローバル変数
-clustering_results = {}
-last_agg_df = None  # グローバル変数を初期化
-
 # --- NaN, inf, pd.NA, None, pd.NaT などを再帰的にNoneへ変換する共通関数 ---
 def nan_to_none(obj):
     if obj is None or obj is pd.NA or obj is pd.NaT:
@@ -147,46 +146,82 @@ def cluster_api():
         temp_file_path = temp_file.name
 
         try:
-            if filename and isinstance(filename, str) and filename.endswith(".csv"):
-                df = pd.read_csv(temp_file_path)
-            else:
-                df = pd.read_excel(temp_file_path)
-            n_clusters = int(request.form.get("n_clusters", 4))
+            # n_clusters=auto のときは k_min〜k_max の候補から自動選択する
+            try:
+                k_range = k_range_from_form(request.form)
+            except ValueError as e:
+                return jsonify(nan_to_none({"error": str(e)})), 400
+            n_clusters = 4 if k_range is not None else int(request.form.get("n_clusters", 4))
+            n_jobs = int(request.form.get("n_jobs", "1"))
             selected_columns = request.form.get("selected_columns")
             if selected_columns:
-                import json
                 selected_columns = json.loads(selected_columns)
-                df = df[selected_columns]
-            # クラスタリング実行
-            result = cluster_main(df, n_clusters=n_clusters)
-            # agg_dfをlist of dictで返す
-            agg_df = result["agg_df"]
-            if hasattr(agg_df, 'to_dict'):
-                agg_df = agg_df.to_dict(orient='records')
-
-            # last_agg_dfにも同じ変換を適用
-            global last_agg_df
-            last_agg_df = agg_df
+            streaming = request.form.get("streaming", "false").lower() in ("true", "1")
+            if streaming and k_range is not None:
+                return jsonify(nan_to_none({"error": "ストリーミングモードではクラスタ数の自動選択は使えません"})), 400
 
-            # radar_chart_dataのNaNも変換
-            radar_chart_data = nan_to_none(result["radar_chart_data"])
-
-            # 結果を保存（ダウンロード用）
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            result_filename = f"clustering_result_{timestamp}.csv"
+            # 学習結果は model_id ごとに保存し、warm_start のときは保存済みの重心から学習を始める
+            model_id = request.form.get("model_id") or f"model_{uuid.uuid4().hex}"
+            warm_start = request.form.get("warm_start", "false").lower() in ("true", "1")
+            try:
+                cluster_model_path(model_id)
+            except ValueError as e:
+                return jsonify(nan_to_none({"error": str(e)})), 400
+            previous_model = None
+            warm_options = {}
+            if warm_start:
+                if k_range is not None:
+                    return jsonify(nan_to_none({"error": "ウォームスタートではクラスタ数の自動選択は使えません"})), 400
+                previous_model = load_cluster_model(model_id)
+                if previous_model is None:
+                    return jsonify(nan_to_none({"error": "モデルが見つかりません"})), 404
+                warm_options = {
+                    "spec": previous_model.spec,
+                    "init_centroids": previous_model.centroids_original(),
+                    "cluster_names": previous_model.cluster_names
+                }
+
+            # 同じ秒に実行した結果が上書きされないよう、結果IDとファイル名は uuid にする
+            result_id = uuid.uuid4().hex
+            result_filename = f"clustering_result_{result_id}.csv"
             file_path = os.path.join(tempfile.gettempdir(), result_filename)
 
-            # DataFrameに戻して保存
-            result_df = pd.DataFrame(agg_df)
-            result_df.to_csv(file_path, index=False, encoding='utf-8-sig')
+            if streaming:
+                # チャンクごとに読み込んで MiniBatchKMeans で学習し、全件の結果は CSV に書き出す
+                chunksize = int(request.form.get("chunksize", str(CLUSTER_CHUNKSIZE)))
+                result = cluster_main_streaming(
+                    temp_file_path, filename, n_clusters=n_clusters, selected_columns=selected_columns or None,
+                    chunksize=chunksize, output_path=file_path, **warm_options
+                )
+            else:
+                if filename and isinstance(filename, str) and filename.endswith(".csv"):
+                    df = pd.read_csv(temp_file_path)
+                else:
+                    df = pd.read_excel(temp_file_path)
+                if selected_columns:
+                    df = df[selected_columns]
+                # クラスタリング実行
+                result = cluster_main(df, n_clusters=n_clusters, k_range=k_range, n_jobs=n_jobs, **warm_options)
+
+            with cluster_model_lock(model_id):
+                save_cluster_model(model_id, ClusterModel.from_result(result["model"], previous=previous_model))
 
-            # 結果をグローバル変数に保存
-            clustering_results[result_filename] = {
-                'data': result_df,
-                'cluster_names': result["cluster_names"],
-                'radar_chart_data': radar_chart_data,
-                'filename': result_filename
-            }
+            # radar_chart_dataのNaNも変換
+            radar_chart_data = nan_to_none(result["radar_chart_data"])
+
+            # 全件は結果IDごとのストアに保持し、レスポンスには先頭のページだけを含める
+            # ストリーミング時は書き出し済みのファイルを索引だけメモリに載せて参照する（全件は読み込まない）
+            if streaming:
+                stored = register_cluster_result_file(result_id, file_path)
+                cluster_counts = {}
+                for cluster, size in result["cluster_sizes"].items():
+                    name = result["cluster_names"][cluster]
+                    cluster_counts[name] = cluster_counts.get(name, 0) + size
+            else:
+                result["agg_df"].to_csv(file_path, index=False, encoding='utf-8-sig')
+                stored = register_cluster_result(result_id, result["agg_df"])
+                cluster_counts = stored.cluster_sizes()
+            agg_df = safe_df_to_dict(result["agg_df"].head(CLUSTER_PREVIEW_ROWS))
 
             # 返却直前にNaN混入チェック
             try:
@@ -203,12 +238,28 @@ def cluster_api():
                 print('agg_df:', agg_df)
                 print('download_filename:', result_filename)
 
-            return jsonify(nan_to_none({
+            response = {
                 "cluster_names": result["cluster_names"],
                 "radar_chart_data": radar_chart_data,
                 "agg_df": agg_df,
-                "download_filename": result_filename
-            }))
+                "download_filename": result_filename,
+                "result_id": result_id,
+                "n_rows": stored.n_rows,
+                "columns": stored.columns,
+                "cluster_counts": cluster_counts,
+                "model_id": model_id,
+                "warm_start": result["model"]["warm_start"],
+                "n_iter": result["model"]["n_iter"]
+            }
+            if "k_sweep" in result:
+                response["k_sweep"] = result["k_sweep"]
+            if streaming:
+                response.update({
+                    "streaming": True,
+                    "cluster_sizes": result["cluster_sizes"],
+                    "centroids": result["centroids"]
+                })
+            return jsonify(nan_to_none(response))
         finally:
             # 一時ファイルを削除
             if os.path.exists(temp_file_path):
@@ -217,32 +268,152 @@ def cluster_api():
         logger.error(f"クラスタリングAPIエラー: {str(e)}")
         return jsonify(nan_to_none({"error": str(e)})), 500
 
+@clustering_bp.route("/api/cluster/<model_id>/model", methods=["GET"])
+def get_cluster_model(model_id):
+    """保存済みクラスタリングモデルの概要（特徴量・クラスタ名・元の尺度の重心）"""
+    try:
+        model = load_cluster_model(model_id)
+        if model is None:
+            return jsonify(nan_to_none({"error": "モデルが見つかりません"})), 404
+        return jsonify(nan_to_none({"model_id": model_id, **model.summary()}))
+    except ValueError as e:
+        return jsonify(nan_to_none({"error": str(e)})), 400
+    except Exception as e:
+        logger.error(f"クラスタリングモデル取得エラー: {str(e)}")
+        return jsonify(nan_to_none({"error": str(e)})), 500
+
+@clustering_bp.route("/api/cluster/<model_id>/assign", methods=["POST"])
+def assign_clusters(model_id):
+    """
+    保存済みモデルで新しい行にクラスタを割り当てる（再学習しない）
+    - JSON {"rows": [...]}: 行ごとのクラスタ番号・クラスタ名・重心までの距離を返す
+    - ファイル: チャンクごとに割り当てて元の列に結果を付けた CSV を書き出す
+    """
+    try:
+        model = load_cluster_model(model_id)
+        if model is None:
+            return jsonify(nan_to_none({"error": "モデルが見つかりません"})), 404
+        start_time = time.time()
+
+        if "file" not in request.files:
+            data = request.get_json(silent=True) or {}
+            rows = data.get("rows")
+            if not isinstance(rows, list):
+                return jsonify({"error": "ファイルまたは rows が必要です"}), 400
+            df = pd.DataFrame(rows)
+            labels, distances = model.assign(df)
+            return jsonify(nan_to_none({
+                "model_id": model_id,
+                "n_rows": len(df),
+                "labels": labels.tolist(),
+                "cluster_names": model.label_names(labels).tolist(),
+                "distances": distances.tolist(),
+                "processing_time": time.time() - start_time
+            }))
+
+        file = request.files["file"]
+        filename = file.filename
+        chunksize = int(request.form.get("chunksize", str(CLUSTER_CHUNKSIZE)))
+        temp_file = tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.csv')
+        file.save(temp_file)
+        temp_file.close()
+        try:
+            result_filename = f"clustering_assign_{model_id}_{uuid.uuid4().hex}.csv"
+            file_path = os.path.join(tempfile.gettempdir(), result_filename)
+            counts = np.zeros(model.n_clusters, dtype=np.int64)
+            n_rows = 0
+            preview = None
+            for i, chunk in enumerate(iter_table_chunks(temp_file.name, filename, chunksize=chunksize)):
+                labels, distances = model.assign(chunk)
+                chunk = chunk.assign(クラスタ=labels, クラスタ名=model.label_names(labels), 重心距離=distances)
+                chunk.to_csv(file_path, mode="w" if i == 0 else "a", header=(i == 0), index=False,
+                             encoding="utf-8-sig" if i == 0 else "utf-8")
+                counts += np.bincount(labels, minlength=model.n_clusters)
+                n_rows += len(chunk)
+                if preview is None:
+                    preview = safe_df_to_dict(chunk.head(20))
+            processing_time = time.time() - start_time
+            logger.info(f"クラスタ割り当て完了: {model_id}, {n_rows} 行, {processing_time:.2f}秒")
+            return jsonify(nan_to_none({
+                "model_id": model_id,
+                "n_rows": n_rows,
+                "cluster_sizes": {str(c): int(counts[c]) for c in range(model.n_clusters)},
+                "cluster_names": model.cluster_names,
+                "preview": preview or [],
+                "download_filename": result_filename,
+                "processing_time": processing_time
+            }))
+        finally:
+            if os.path.exists(temp_file.name):
+                os.unlink(temp_file.name)
+    except ValueError as e:
+        return jsonify(nan_to_none({"error": str(e)})), 400
+    except Exception as e:
+        logger.error(f"クラスタ割り当てエラー: {str(e)}")
+        return jsonify(nan_to_none({"error": str(e)})), 500
+
+@clustering_bp.route("/api/cluster/results/<result_id>", methods=["GET"])
+def get_cluster_results(result_id):
+    """
+    クラスタリング結果のページ（クラスタ・条件での絞り込み、並べ替え、列の選択）
+    format=csv のときは条件に合う全行を CSV で返す
+    """
+    try:
+        result = get_cluster_result(result_id)
+        if result is None:
+            return jsonify(nan_to_none({"error": "クラスタリング結果が見つかりません。再度クラスタリングを実行してください。"})), 404
+        query = result_query_from_args(request.args)
+        if request.args.get("format") == "csv":
+            # 条件に合う全行は一時ファイルに書き出して返す（ファイルの結果は全行をメモリに載せない）
+            query.update({"offset": 0, "limit": None})
+            download_name = f"{result_id}_selected.csv"
+            file_path = os.path.join(tempfile.gettempdir(), download_name)
+            result.write_csv(file_path, **query)
+            return send_file(file_path, mimetype='text/csv', as_attachment=True, download_name=download_name)
+        total, page = result.query(**query)
+        return jsonify(nan_to_none({
+            "result_id": result_id,
+            "total": total,
+            "offset": query["offset"],
+            "limit": query["limit"],
+            "columns": [str(col) for col in page.columns],
+            "data": safe_df_to_dict(page)
+        }))
+    except ValueError as e:
+        return jsonify(nan_to_none({"error": str(e)})), 400
+    except Exception as e:
+        logger.error(f"クラスタリング結果取得エラー: {str(e)}")
+        return jsonify(nan_to_none({"error": str(e)})), 500
+
+@clustering_bp.route("/api/cluster/results/<result_id>/summary", methods=["GET"])
+def get_cluster_results_summary(result_id):
+    """クラスタリング結果の行数・列・クラスタごとの行数"""
+    result = get_cluster_result(result_id)
+    if result is None:
+        return jsonify(nan_to_none({"error": "クラスタリング結果が見つかりません。再度クラスタリングを実行してください。"})), 404
+    return jsonify(nan_to_none({
+        "result_id": result_id,
+        "n_rows": result.n_rows,
+        "columns": result.columns,
+        "cluster_counts": result.cluster_sizes()
+    }))
+
 # クラスタ抽出API
 @clustering_bp.route("/api/cluster/select", methods=["POST"])
 def cluster_select():
     try:
-        # クラスタ名を受け取る
-        data = request.get_json()
+        # クラスタ名を受け取る（result_id 省略時は最後のクラスタリング結果、limit 省略時はクラスタの全行）
+        data = request.get_json() or {}
         cluster_name = data.get("cluster_name")
-        # セッションやグローバルでagg_dfを保持していない場合、都度ファイルアップロードが必要
-        # ここでは一時的にグローバル変数でagg_dfを保持する例（本番はセッションやDB推奨）
-        # グローバル変数を初期化
-        if 'last_agg_df' not in globals():
-            global last_agg_df
-            last_agg_df = None
-
-        if last_agg_df is None:
+        result_id = data.get("result_id")
+        result = get_cluster_result(result_id)
+        if result is None:
             return jsonify({"error": "クラスタリングデータがありません。再度クラスタリングを実行してください。"}), 400
-        filtered = [row for row in last_agg_df if row.get("クラスタ名") == cluster_name]
-        # filteredの各行のNaNをNoneに変換
-        filtered = nan_to_none(filtered)
-        # 返却直前にNaN混入チェック
-        try:
-            json.dumps({"data": filtered}, ensure_ascii=False, allow_nan=False)
-        except Exception as e:
-            print('JSON変換エラー:', e)
-            print('filtered:', filtered)
-        return jsonify(nan_to_none({"data": filtered}))
+        offset = int(data.get("offset", 0))
+        limit = int(data["limit"]) if data.get("limit") is not None else None
+        # クラスタ名 → 行番号の索引から取り出す
+        total, page = result.query(clusters=[cluster_name], offset=offset, limit=limit)
+        return jsonify(nan_to_none({"data": safe_df_to_dict(page), "total": total}))
     except Exception as e:
         logger.error(f"クラスタ抽出APIエラー: {str(e)}")
         return jsonify(nan_to_none({"error": str(e)})), 500
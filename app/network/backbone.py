@@ -0,0 +1,85 @@
+import logging
+import numpy as np
+
+def disparity_filter_mask(graph, alpha):
+    """
+    ディスパリティ・フィルタ（Serrano et al.）
+    ノード i の辺 ij の正規化重み p = w_ij / s_i について α_ij = (1 - p)^(k_i - 1) を求め、
+    どちらかの端点で α_ij < alpha となる辺を残す（次数1のノードの辺は残す）
+    """
+    n = graph.n_nodes
+    weight = graph.weight
+    strength = np.bincount(graph.src, weights=weight, minlength=n) + np.bincount(graph.dst, weights=weight, minlength=n)
+    degree = np.bincount(graph.src, minlength=n) + np.bincount(graph.dst, minlength=n)
+
+    def significant(ends):
+        k = degree[ends]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            p = np.where(strength[ends] > 0, weight / strength[ends], 0.0)
+        return (k <= 1) | (np.power(1.0 - p, np.maximum(k - 1, 0)) < alpha)
+
+    return significant(graph.src) | significant(graph.dst)
+
+def top_k_mask(graph, k):
+    """各ノードで重みが上位 k 本の辺を残す（どちらかの端点で上位なら残す）"""
+    n_edges = graph.n_edges
+    tails = np.concatenate([graph.src, graph.dst])
+    weights = np.concatenate([graph.weight, graph.weight])
+    edge_ids = np.concatenate([np.arange(n_edges), np.arange(n_edges)])
+    # ノードごとに重みの降順に並べ、ノード内の順位を求める
+    order = np.lexsort((-weights, tails))
+    sorted_tails = tails[order]
+    group_start = np.searchsorted(sorted_tails, sorted_tails, side='left')
+    rank = np.arange(len(order)) - group_start
+    keep = np.zeros(n_edges, dtype=bool)
+    keep[edge_ids[order][rank < k]] = True
+    return keep
+
+def extract_backbone(graph, alpha=None, top_k=None, min_lift=None):
+    """
+    ネットワークの骨格を抽出する（指定したフィルタをすべて満たす辺だけを残す）
+    alpha: ディスパリティ・フィルタの有意水準
+    top_k: ノードごとに残す辺の本数
+    min_lift: 残す辺の lift の下限
+    ノードは辺がなくなっても残す
+    戻り値: (骨格のグラフ, {"edges_before", "edges_after", "removed_edges", "removed_by"})
+    """
+    keep = np.ones(graph.n_edges, dtype=bool)
+    removed_by = {}
+    filters = [
+        ("min_lift", min_lift, lambda: graph.weight >= min_lift),
+        ("disparity", alpha, lambda: disparity_filter_mask(graph, alpha)),
+        ("top_k", top_k, lambda: top_k_mask(graph, int(top_k)))
+    ]
+    for name, value, make_mask in filters:
+        if value is None:
+            continue
+        mask = make_mask()
+        removed_by[name] = int((keep & ~mask).sum())
+        keep &= mask
+
+    info = {
+        "alpha": alpha,
+        "top_k": top_k,
+        "min_lift": min_lift,
+        "edges_before": int(graph.n_edges),
+        "edges_after": int(keep.sum()),
+        "removed_edges": int((~keep).sum()),
+        "removed_by": removed_by
+    }
+    if removed_by:
+        logging.info(f"ネットワーク骨格抽出: {info['edges_before']} → {info['edges_after']} 辺 ({removed_by})")
+    return graph.with_edges(keep), info
+
+def backbone_options_from_form(form):
+    """リクエストのフォーム値から骨格抽出のオプションを作成（未指定のフィルタは使わない）"""
+    options = {
+        "alpha": float(form["backbone_alpha"]) if form.get("backbone_alpha") else None,
+        "top_k": int(form["backbone_top_k"]) if form.get("backbone_top_k") else None,
+        "min_lift": float(form["backbone_min_lift"]) if form.get("backbone_min_lift") else None
+    }
+    if options["alpha"] is not None and not 0 < options["alpha"] <= 1:
+        raise ValueError("backbone_alphaは0より大きく1以下の値を指定してください")
+    if options["top_k"] is not None and options["top_k"] < 1:
+        raise ValueError("backbone_top_kは1以上を指定してください")
+    return options
@@ -0,0 +1,179 @@
+import os
+import math
+import random
+import logging
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy import sparse
+from scipy.sparse import csgraph
+
+# ノード数がこれを超えたら auto モードで近似計算に切り替える
+BETWEENNESS_APPROX_THRESHOLD = int(os.environ.get("BETWEENNESS_APPROX_THRESHOLD", "500"))
+
+# 近似計算で使うピボット（始点）数
+BETWEENNESS_PIVOTS = int(os.environ.get("BETWEENNESS_PIVOTS", "128"))
+
+# 誤差上限の信頼度（全ノード同時に成り立つ確率）
+BETWEENNESS_CONFIDENCE = 0.95
+
+BETWEENNESS_MODES = ("auto", "exact", "approx")
+
+# ピボット数の下限（1ピボットではピボット自身の推定値が 0/0 になる）
+BETWEENNESS_MIN_PIVOTS = 2
+
+# 始点ブロックの作業配列に使うメモリの上限（プロセスごと, MB）
+BETWEENNESS_MEMORY_BUDGET_MB = int(os.environ.get("BETWEENNESS_MEMORY_BUDGET_MB", "128"))
+
+# 1回の最短経路計算でまとめて処理する始点数の上限
+_SOURCE_BLOCK = 128
+
+# 始点ブロック×辺の float64 配列が同時に存在する最大数（dist_tail, tight, σ/δ の一時配列など）
+_ARC_ARRAYS = 7
+
+# 最短経路上の辺かどうかを判定する際の相対誤差
+_TIGHT_RTOL = 1e-9
+
+def betweenness_error_bound(n_nodes, k, confidence=BETWEENNESS_CONFIDENCE):
+    """
+    k 個のピボットで推定した正規化媒介中心性の誤差上限（Hoeffding の不等式 + 全ノードの和集合上界）
+    1ピボットあたりの寄与は [0, n/(n-1)] に収まるため
+    ε = n/(n-1) * sqrt(ln(2n/δ) / 2k)  の誤差が確率 1-δ で全ノード同時に成り立つ
+    """
+    if k >= n_nodes or n_nodes <= 2:
+        return 0.0
+    value_range = n_nodes / (n_nodes - 1)
+    delta = 1.0 - confidence
+    return value_range * math.sqrt(math.log(2 * n_nodes / delta) / (2 * k))
+
+def resolve_betweenness_mode(n_nodes, mode="auto", k=None, threshold=BETWEENNESS_APPROX_THRESHOLD):
+    """
+    計算方法を決める
+    戻り値: ("exact", None) または ("approx", ピボット数)
+    """
+    if mode not in BETWEENNESS_MODES:
+        raise ValueError(f"無効な媒介中心性モードです: {mode}")
+    k = int(k) if k is not None else BETWEENNESS_PIVOTS
+    if k < BETWEENNESS_MIN_PIVOTS:
+        raise ValueError(f"betweenness_kは{BETWEENNESS_MIN_PIVOTS}以上を指定してください")
+    if mode == "exact" or (mode == "auto" and n_nodes <= threshold):
+        return "exact", None
+    if k >= n_nodes:
+        return "exact", None
+    return "approx", k
+
+def source_block_size(n_arcs):
+    """作業配列（始点ブロック×辺）がメモリ上限に収まる始点ブロックの大きさ"""
+    budget = BETWEENNESS_MEMORY_BUDGET_MB * 1024 * 1024
+    return int(min(_SOURCE_BLOCK, max(1, budget // (8 * _ARC_ARRAYS * max(n_arcs, 1)))))
+
+def source_dependencies(adjacency, tails, heads, lengths, sources, target_weights=None):
+    """
+    sources の各始点からの依存度（Brandes）の合計を返す
+    最短距離は csgraph.dijkstra で求め、最短経路 DAG 上の経路数・依存度は
+    始点ブロック×辺の配列演算を DAG の深さ分だけ繰り返して求める
+    tails, heads, lengths: 両方向の有向辺
+    target_weights: 終点ごとの重み（指定時は重み 0 の終点への最短経路を数えない）
+    """
+    n = adjacency.shape[0]
+    n_arcs = len(tails)
+    head_weights = 1.0 if target_weights is None else np.asarray(target_weights, dtype=np.float64)[heads]
+    arc_ids = np.arange(n_arcs)
+    # 辺 → 終点 / 始点 への足し込み行列
+    to_head = sparse.csr_matrix((np.ones(n_arcs), (arc_ids, heads)), shape=(n_arcs, n))
+    to_tail = sparse.csr_matrix((np.ones(n_arcs), (arc_ids, tails)), shape=(n_arcs, n))
+
+    total = np.zeros(n)
+    sources = np.asarray(sources, dtype=np.int64)
+    block_size = source_block_size(n_arcs)
+    for start in range(0, len(sources), block_size):
+        block = sources[start:start + block_size]
+        rows = np.arange(len(block))
+        dist = csgraph.dijkstra(adjacency, directed=False, indices=block)
+        dist_tail = dist[:, tails]
+        tight = np.isfinite(dist_tail) & np.isclose(dist_tail + lengths, dist[:, heads], rtol=_TIGHT_RTOL, atol=0)
+
+        # 最短経路数 σ
+        sigma = np.zeros((len(block), n))
+        sigma[rows, block] = 1.0
+        while True:
+            new_sigma = np.asarray((np.where(tight, sigma[:, tails], 0.0)) @ to_head)
+            new_sigma[rows, block] = 1.0
+            if np.array_equal(new_sigma, sigma):
+                break
+            sigma = new_sigma
+
+        # 依存度 δ(v) = Σ_{v→w} σ(v)/σ(w) (重み(w) + δ(w))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            coeff = np.where(tight, sigma[:, tails] / sigma[:, heads], 0.0)
+        delta = np.zeros((len(block), n))
+        while True:
+            new_delta = np.asarray((coeff * (head_weights + delta[:, heads])) @ to_tail)
+            if np.array_equal(new_delta, delta):
+                break
+            delta = new_delta
+        delta[rows, block] = 0.0
+        total += delta.sum(axis=0)
+    return total
+
+_worker_state = None
+
+def _init_worker(data, indices, indptr, shape, tails, heads, lengths):
+    global _worker_state
+    adjacency = sparse.csr_matrix((data, indices, indptr), shape=shape)
+    _worker_state = (adjacency, tails, heads, lengths)
+
+def _dependencies_task(sources):
+    adjacency, tails, heads, lengths = _worker_state
+    return source_dependencies(adjacency, tails, heads, lengths, sources)
+
+def parallel_source_dependencies(adjacency, tails, heads, lengths, sources, n_jobs=1):
+    """
+    始点を複数プロセスに分割して依存度を計算し、最後に合計する
+    グラフは CSR の配列と辺の配列だけをワーカーに1回渡す
+    """
+    if n_jobs <= 1 or len(sources) <= _SOURCE_BLOCK:
+        return source_dependencies(adjacency, tails, heads, lengths, sources)
+    # 始点ブロックが小さくなりすぎない範囲でワーカー数の数倍に分割（負荷の偏りを抑える）
+    n_batches = min(n_jobs * 4, max(len(sources) // 32, n_jobs))
+    batches = np.array_split(np.asarray(sources, dtype=np.int64), n_batches)
+    initargs = (adjacency.data, adjacency.indices, adjacency.indptr, adjacency.shape, tails, heads, lengths)
+    total = np.zeros(adjacency.shape[0])
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=initargs) as executor:
+        for partial in executor.map(_dependencies_task, batches):
+            total += partial
+    return total
+
+def compute_betweenness(graph, mode="auto", k=None, seed=42, threshold=BETWEENNESS_APPROX_THRESHOLD, n_jobs=1):
+    """
+    媒介中心性（正規化）を計算する
+    近似モードでは k 個のピボットからの最短経路だけを数える（Brandes-Pich のサンプリング）
+    n_jobs: 始点を分割して計算するプロセス数
+    戻り値: (ノード順の媒介中心性配列, {"mode", "k", "error_bound", "confidence"})
+    """
+    n = graph.n_nodes
+    resolved, pivots = resolve_betweenness_mode(n, mode=mode, k=k, threshold=threshold)
+    if pivots:
+        sources = np.array(random.Random(seed).sample(range(n), pivots), dtype=np.int64)
+    else:
+        sources = np.arange(n, dtype=np.int64)
+
+    tails, heads, lengths = graph.arcs()
+    betweenness = parallel_source_dependencies(graph.distance_matrix(), tails, heads, lengths, sources, n_jobs=n_jobs)
+
+    # networkx と同じ正規化（始点に選んだノードは自分自身を始点にできない分を補正）
+    if n > 2:
+        if pivots:
+            scale = np.full(n, 1.0 / (pivots * (n - 2)))
+            scale[sources] = 1.0 / ((pivots - 1) * (n - 2))
+        else:
+            scale = 1.0 / ((n - 1) * (n - 2))
+        betweenness = betweenness * scale
+    info = {
+        "mode": resolved,
+        "k": pivots,
+        "error_bound": betweenness_error_bound(n, pivots) if pivots else 0.0,
+        "confidence": BETWEENNESS_CONFIDENCE
+    }
+    if resolved == "approx":
+        logging.info(f"媒介中心性を近似計算: {n} ノード, ピボット {pivots}, 誤差上限 {info['error_bound']:.4f}")
+    return betweenness, info
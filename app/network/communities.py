@@ -0,0 +1,150 @@
+import os
+import time
+import logging
+import numpy as np
+from scipy import sparse
+from networkx.algorithms import community
+
+# コミュニティ検出の方式（greedy: 貪欲法によるモジュラリティ最大化, louvain: Louvain 法）
+COMMUNITY_ENGINES = ("greedy", "louvain")
+DEFAULT_COMMUNITY_ENGINE = os.environ.get("NETWORK_COMMUNITY_ENGINE", "greedy")
+
+# Louvain 法の局所移動を打ち切る1周あたりのモジュラリティ改善量
+_LOUVAIN_MIN_GAIN = 1e-7
+
+def modularity(adjacency, labels, resolution=1.0):
+    """重み付き無向グラフ（対称な CSR 隣接行列）のモジュラリティ"""
+    two_m = adjacency.sum()
+    if two_m == 0:
+        return 0.0
+    n_comms = int(labels.max()) + 1 if len(labels) else 0
+    membership = sparse.csr_matrix((np.ones(len(labels)), (np.arange(len(labels)), labels)), shape=(len(labels), n_comms))
+    internal = (membership.T @ adjacency @ membership).diagonal()
+    strength = np.asarray(adjacency.sum(axis=1)).ravel()
+    comm_strength = np.bincount(labels, weights=strength, minlength=n_comms)
+    return float(internal.sum() / two_m - resolution * np.sum((comm_strength / two_m) ** 2))
+
+def _local_moving(adjacency, resolution, rng):
+    """
+    各ノードを隣接コミュニティのうちモジュラリティが最も増えるものへ移す（Louvain の第1段階）
+    戻り値: コミュニティ番号（0 からの連番）
+    """
+    n = adjacency.shape[0]
+    indptr, indices, data = adjacency.indptr, adjacency.indices, adjacency.data
+    strength = np.asarray(adjacency.sum(axis=1)).ravel()
+    two_m = strength.sum()
+    labels = np.arange(n)
+    comm_strength = strength.copy()
+
+    while True:
+        total_gain = 0.0
+        for i in rng.permutation(n):
+            neighbors = indices[indptr[i]:indptr[i + 1]]
+            weights = data[indptr[i]:indptr[i + 1]]
+            not_self = neighbors != i
+            comms, inverse = np.unique(labels[neighbors[not_self]], return_inverse=True)
+            k_in = np.bincount(inverse, weights=weights[not_self], minlength=len(comms))
+
+            current = labels[i]
+            comm_strength[current] -= strength[i]
+            penalty = resolution * strength[i] / two_m
+            gains = k_in - penalty * comm_strength[comms]
+            pos = np.searchsorted(comms, current)
+            in_current = pos < len(comms) and comms[pos] == current
+            current_gain = (k_in[pos] if in_current else 0.0) - penalty * comm_strength[current]
+
+            best = current
+            if len(comms):
+                j = int(np.argmax(gains))
+                if gains[j] > current_gain + 1e-12:
+                    best = comms[j]
+                    total_gain += gains[j] - current_gain
+            labels[i] = best
+            comm_strength[best] += strength[i]
+        if total_gain / two_m <= _LOUVAIN_MIN_GAIN:
+            break
+    _, labels = np.unique(labels, return_inverse=True)
+    return labels
+
+def louvain_communities(adjacency, resolution=1.0, seed=42):
+    """
+    Louvain 法によるコミュニティ検出（局所移動 → コミュニティの縮約 を改善がなくなるまで繰り返す）
+    adjacency: 対称な CSR 隣接行列（重み付き）
+    戻り値: ノードごとのコミュニティ番号
+    """
+    n = adjacency.shape[0]
+    labels = np.arange(n)
+    if n == 0 or adjacency.sum() == 0:
+        return labels
+    rng = np.random.default_rng(seed)
+    current = sparse.csr_matrix(adjacency, dtype=np.float64)
+    while True:
+        level_labels = _local_moving(current, resolution, rng)
+        n_comms = int(level_labels.max()) + 1
+        labels = level_labels[labels]
+        if n_comms == current.shape[0]:
+            break
+        membership = sparse.csr_matrix(
+            (np.ones(len(level_labels)), (np.arange(len(level_labels)), level_labels)),
+            shape=(len(level_labels), n_comms)
+        )
+        current = (membership.T @ current @ membership).tocsr()
+    return labels
+
+def _order_by_size(labels):
+    """コミュニティ番号を大きい順に振り直す（貪欲法の結果と同じ並び）"""
+    sizes = np.bincount(labels)
+    order = np.argsort(-sizes, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return rank[labels]
+
+def greedy_communities(graph, resolution=1.0):
+    """貪欲法によるモジュラリティ最大化（networkx）のコミュニティ番号"""
+    G = graph.to_networkx()
+    communities = list(community.greedy_modularity_communities(G, weight="weight", resolution=resolution))
+    index = {name: i for i, name in enumerate(graph.nodes)}
+    groups = np.zeros(graph.n_nodes, dtype=np.int64)
+    for cid, members in enumerate(communities):
+        groups[[index[m] for m in members]] = cid
+    return groups
+
+def community_options_from_form(form):
+    """リクエストのフォーム値からコミュニティ検出のオプションを作成"""
+    engine = form.get("community_engine", DEFAULT_COMMUNITY_ENGINE)
+    if engine not in COMMUNITY_ENGINES:
+        raise ValueError(f"community_engineは {', '.join(COMMUNITY_ENGINES)} のいずれかを指定してください")
+    resolution = float(form.get("community_resolution", "1.0"))
+    if resolution <= 0:
+        raise ValueError("community_resolutionは正の値を指定してください")
+    return {
+        "community_engine": engine,
+        "resolution": resolution,
+        "seed": int(form.get("community_seed", "42"))
+    }
+
+def detect_communities(graph, engine=DEFAULT_COMMUNITY_ENGINE, resolution=1.0, seed=42):
+    """
+    コミュニティ検出
+    戻り値: (ノード順のコミュニティ番号, {"engine", "resolution", "seed", "n_communities", "modularity", "seconds"})
+    """
+    if engine not in COMMUNITY_ENGINES:
+        raise ValueError(f"無効なコミュニティ検出方式です: {engine}")
+    start = time.perf_counter()
+    if graph.n_nodes == 0:
+        groups = np.zeros(0, dtype=np.int64)
+    elif engine == "louvain":
+        groups = _order_by_size(louvain_communities(graph.adjacency, resolution=resolution, seed=seed))
+    else:
+        groups = greedy_communities(graph, resolution=resolution)
+    seconds = time.perf_counter() - start
+    info = {
+        "engine": engine,
+        "resolution": resolution,
+        "seed": seed if engine == "louvain" else None,
+        "n_communities": int(groups.max()) + 1 if len(groups) else 0,
+        "modularity": modularity(graph.adjacency, groups, resolution=resolution) if len(groups) else 0.0,
+        "seconds": seconds
+    }
+    logging.info(f"コミュニティ検出完了: {engine}, {info['n_communities']} コミュニティ, {seconds:.3f}秒")
+    return groups, info
@@ -1,6 +1,5 @@
-import networkx as nx
 import pandas as pd
-from networkx.algorithms import community
+from .graph_metrics import build_rules_network
 import logging
 import tempfile
 import os
@@ -8,7 +7,7 @@ from dotenv import load_dotenv, find_dotenv
 OPENAI_API_KEY = os.getenv(find_dotenv("../.env"))
 from langchain.chat_models import ChatOpenAI
 
-def create_network_json(file_path):
+def create_network_json(file_path, betweenness_mode="auto", betweenness_k=None, n_jobs=1, community_options=None, backbone_options=None, layout_options=None):
     try:
         # 一時ファイルにコピーしてから読み込み
         with tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.csv' if file_path.endswith('.csv') else '.xlsx') as temp_file:
@@ -38,89 +37,16 @@ def create_network_json(file_path):
         if df.empty:
             raise ValueError("有効なデータがありません")
 
-                # 店舗ごとの利用金額情報を取得（存在する場合）
-        shop_revenue = {}
-        if 'antecedent_revenue' in df.columns and 'consequent_revenue' in df.columns:
-            for _, row in df.iterrows():
-                antecedent = str(row["antecedents"]).strip()
-                consequent = str(row["consequents"]).strip()
-                antecedent_revenue = float(row.get("antecedent_revenue", 0) or 0)
-                consequent_revenue = float(row.get("consequent_revenue", 0) or 0)
-
-                if antecedent not in shop_revenue:
-                    shop_revenue[antecedent] = antecedent_revenue
-                if consequent not in shop_revenue:
-                    shop_revenue[consequent] = consequent_revenue
-
-        # グラフの構築
-        G = nx.Graph()
-        for _, row in df.iterrows():
-            source = str(row["antecedents"]).strip()
-            target = str(row["consequents"]).strip()
-            weight = float(row["lift"])
-
-            if source and target and source != target:
-                G.add_edge(source, target, weight=weight)
-
-        if len(G.nodes()) == 0:
+        # グラフの構築・中心性指標・コミュニティ検出（疎行列で1回だけ計算）
+        graph, _, data = build_rules_network(
+            df, betweenness_mode=betweenness_mode, betweenness_k=betweenness_k, n_jobs=n_jobs,
+            backbone=backbone_options, layout=layout_options, **(community_options or {})
+        )
+        if graph.n_nodes == 0:
             raise ValueError("有効なノードがありません")
 
-        # 中心性指標の計算
-        try:
-            betweenness = nx.betweenness_centrality(G, weight="weight", normalized=True)
-        except:
-            betweenness = nx.betweenness_centrality(G, normalized=True)
-
-        try:
-            degree = nx.degree_centrality(G)
-        except:
-            degree = {node: 0 for node in G.nodes()}
-
-        try:
-            closeness = nx.closeness_centrality(G, distance="weight")
-        except:
-            closeness = nx.closeness_centrality(G)
-
-        try:
-            eigenvector = nx.eigenvector_centrality_numpy(G, weight="weight")
-        except:
-            eigenvector = {node: 0 for node in G.nodes()}
-
-        # コミュニティ検出
-        try:
-            communities = list(community.greedy_modularity_communities(G, weight="weight"))
-        except:
-            # フォールバック: 重みなしでコミュニティ検出
-            communities = list(community.greedy_modularity_communities(G))
-
-        node_community = {n: cid for cid, com in enumerate(communities) for n in com}
-
-        # ノードデータの作成
-        nodes = [
-            {
-                "id": n,
-                "betweenness": float(betweenness.get(n, 0)),
-                "degree": float(degree.get(n, 0)),
-                "closeness": float(closeness.get(n, 0)),
-                "eigenvector": float(eigenvector.get(n, 0)),
-                "group": int(node_community.get(n, 0)),
-                "revenue": float(shop_revenue.get(n, 0))
-            }
-            for n in G.nodes()
-        ]
-
-        # リンクデータの作成
-        links = [
-            {
-                "source": u,
-                "target": v,
-                "value": float(d.get("weight", 1))
-            }
-            for u, v, d in G.edges(data=True)
-        ]
-
-        logging.info(f"Network created successfully: {len(nodes)} nodes, {len(links)} links, {len(list(communities))} communities")
-        return {"nodes": nodes, "links": links}
+        logging.info(f"Network created successfully: {len(data['nodes'])} nodes, {len(data['links'])} links, {len(set(n['group'] for n in data['nodes']))} communities")
+        return data
 
     except Exception as e:
         logging.error(f"Error in create_network_json: {str(e)}")
@@ -0,0 +1,156 @@
+import io
+import csv
+import math
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+
+# ネットワークのエクスポート形式と MIME タイプ・拡張子
+EXPORT_FORMATS = {
+    "gexf": ("application/gexf+xml", "gexf"),
+    "graphml": ("application/graphml+xml", "graphml"),
+    "gephi_csv": ("application/zip", "zip")
+}
+
+# 1回に送る行数（行ごとに生成し、この行数ずつまとめて送る）
+_ROWS_PER_CHUNK = 1000
+
+# 座標として出力する属性（GEXF では viz:position にする）
+_POSITION_KEYS = ("x", "y")
+
+def _attribute_columns(graph_index):
+    """出力するノード属性 [(名前, 整数かどうか, 配列)]"""
+    return [
+        (key, values.dtype.kind in "iu", values)
+        for key, values in graph_index.attributes.items()
+        if values.dtype.kind in "iuf"
+    ]
+
+def _format_value(value, is_int):
+    return str(int(value)) if is_int else repr(float(value))
+
+def _is_missing(value):
+    return isinstance(value, float) and math.isnan(value)
+
+def _chunked(lines):
+    """行をまとめて文字列のチャンクにする"""
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= _ROWS_PER_CHUNK:
+            yield "".join(buffer)
+            buffer = []
+    if buffer:
+        yield "".join(buffer)
+
+def _gexf_lines(graph_index):
+    graph = graph_index.graph
+    columns = [c for c in _attribute_columns(graph_index) if c[0] not in _POSITION_KEYS]
+    has_position = all(key in graph_index.attributes for key in _POSITION_KEYS)
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<gexf xmlns="http://www.gexf.net/1.2draft" xmlns:viz="http://www.gexf.net/1.2draft/viz" version="1.2">\n'
+    yield '<graph mode="static" defaultedgetype="undirected">\n<attributes class="node">\n'
+    for i, (key, is_int, _) in enumerate(columns):
+        yield f'<attribute id="{i}" title={quoteattr(key)} type="{"integer" if is_int else "double"}"/>\n'
+    yield '</attributes>\n<nodes>\n'
+    for node_id, name in enumerate(graph.nodes.tolist()):
+        values = "".join(
+            f'<attvalue for="{i}" value="{_format_value(values[node_id], is_int)}"/>'
+            for i, (_, is_int, values) in enumerate(columns)
+            if not _is_missing(values[node_id].item())
+        )
+        position = ""
+        if has_position:
+            x, y = graph_index.attributes["x"][node_id], graph_index.attributes["y"][node_id]
+            position = f'<viz:position x="{float(x)!r}" y="{float(y)!r}" z="0.0"/>'
+        yield f'<node id="{node_id}" label={quoteattr(str(name))}><attvalues>{values}</attvalues>{position}</node>\n'
+    yield '</nodes>\n<edges>\n'
+    for edge_id, (u, v, w) in enumerate(zip(graph.src.tolist(), graph.dst.tolist(), graph.weight.tolist())):
+        yield f'<edge id="{edge_id}" source="{u}" target="{v}" weight="{w!r}"/>\n'
+    yield '</edges>\n</graph>\n</gexf>\n'
+
+def _graphml_lines(graph_index):
+    graph = graph_index.graph
+    columns = _attribute_columns(graph_index)
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+    yield '<key id="label" for="node" attr.name="label" attr.type="string"/>\n'
+    for i, (key, is_int, _) in enumerate(columns):
+        yield f'<key id="d{i}" for="node" attr.name={quoteattr(key)} attr.type="{"long" if is_int else "double"}"/>\n'
+    yield '<key id="weight" for="edge" attr.name="weight" attr.type="double"/>\n'
+    yield '<graph edgedefault="undirected">\n'
+    for node_id, name in enumerate(graph.nodes.tolist()):
+        values = "".join(
+            f'<data key="d{i}">{_format_value(values[node_id], is_int)}</data>'
+            for i, (_, is_int, values) in enumerate(columns)
+            if not _is_missing(values[node_id].item())
+        )
+        yield f'<node id="n{node_id}"><data key="label">{escape(str(name))}</data>{values}</node>\n'
+    for u, v, w in zip(graph.src.tolist(), graph.dst.tolist(), graph.weight.tolist()):
+        yield f'<edge source="n{u}" target="n{v}"><data key="weight">{w!r}</data></edge>\n'
+    yield '</graph>\n</graphml>\n'
+
+def _csv_line(row):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(row)
+    return buffer.getvalue()
+
+def _gephi_node_lines(graph_index):
+    """Gephi のノード表（Id, Label, 指標の列）"""
+    columns = _attribute_columns(graph_index)
+    yield _csv_line(["Id", "Label"] + [key for key, _, _ in columns])
+    for node_id, name in enumerate(graph_index.graph.nodes.tolist()):
+        row = [name, name]
+        for _, is_int, values in columns:
+            value = values[node_id].item()
+            row.append("" if _is_missing(value) else _format_value(value, is_int))
+        yield _csv_line(row)
+
+def _gephi_edge_lines(graph_index):
+    """Gephi のエッジ表（Source, Target, Type, Weight）"""
+    graph = graph_index.graph
+    names = graph.nodes
+    yield _csv_line(["Source", "Target", "Type", "Weight"])
+    for u, v, w in zip(graph.src.tolist(), graph.dst.tolist(), graph.weight.tolist()):
+        yield _csv_line([names[u], names[v], "Undirected", repr(w)])
+
+class _ChunkSink(io.RawIOBase):
+    """ZipFile の出力を受け取り、送信するまで溜めておく（シーク不可のストリームとして扱わせる）"""
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def _gephi_zip_chunks(graph_index):
+    """nodes.csv / edges.csv を ZIP にまとめながら少しずつ送る"""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, lines in (("nodes.csv", _gephi_node_lines(graph_index)), ("edges.csv", _gephi_edge_lines(graph_index))):
+            with archive.open(name, "w", force_zip64=True) as member:
+                for chunk in _chunked(lines):
+                    member.write(chunk.encode("utf-8"))
+                    data = sink.drain()
+                    if data:
+                        yield data
+    yield sink.drain()
+
+def export_network(graph_index, fmt):
+    """
+    ネットワークを指定形式で少しずつ生成する（文書全体をメモリ上に作らない）
+    戻り値: バイト列のチャンクのジェネレータ
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"formatは {', '.join(EXPORT_FORMATS)} のいずれかを指定してください")
+    if fmt == "gephi_csv":
+        return _gephi_zip_chunks(graph_index)
+    lines = _gexf_lines(graph_index) if fmt == "gexf" else _graphml_lines(graph_index)
+    return (chunk.encode("utf-8") for chunk in _chunked(lines))
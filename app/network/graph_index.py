@@ -0,0 +1,156 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from scipy.sparse import csgraph
+from .graph_metrics import SparseGraph, degree_centrality, closeness_centrality, network_json
+from .centrality import compute_betweenness
+
+# メモリ上に保持するグラフインデックスの件数（処理IDごと）
+GRAPH_INDEX_MAX = int(os.environ.get("NETWORK_GRAPH_INDEX_MAX", "16"))
+
+# エゴネットワークの深さの上限
+EGO_MAX_DEPTH = 5
+
+_graph_indexes = OrderedDict()
+_index_lock = threading.Lock()
+
+class GraphIndex:
+    """
+    処理済みネットワークの検索用インデックス
+    - graph: SparseGraph（CSR 隣接行列）
+    - index: 店舗名 → ノード番号
+    - attributes: ノード順の指標の配列（betweenness, degree, group, revenue, x, y など）
+    - meta: 指標の計算方法（媒介中心性の近似の有無など）
+    """
+    def __init__(self, graph, attributes, meta=None):
+        self.graph = graph
+        self.index = pd.Index(graph.nodes)
+        self.attributes = attributes
+        self.meta = meta or {}
+
+    @classmethod
+    def from_network_json(cls, data):
+        """ネットワーク JSON（ノード・リンクの辞書）からインデックスを作成"""
+        nodes = data.get("nodes", [])
+        links = data.get("links", [])
+        names = np.array([node["id"] for node in nodes], dtype=object)
+        index = pd.Index(names)
+        src = index.get_indexer([link["source"] for link in links])
+        dst = index.get_indexer([link["target"] for link in links])
+        weight = np.array([link.get("value") for link in links], dtype=np.float64)
+        ok = (src >= 0) & (dst >= 0)
+        graph = SparseGraph(names, np.minimum(src, dst)[ok], np.maximum(src, dst)[ok], weight[ok])
+        keys = [key for key in (nodes[0].keys() if nodes else []) if key != "id"]
+        attributes = {
+            key: pd.to_numeric(pd.Series([node.get(key) for node in nodes]), errors='coerce').to_numpy()
+            for key in keys
+        }
+        return cls(graph, attributes, meta=data.get("meta"))
+
+    def node_id(self, name):
+        """店舗名のノード番号（見つからなければ None）"""
+        pos = self.index.get_indexer([name])[0]
+        return int(pos) if pos >= 0 else None
+
+    def ego_nodes(self, center, depth, min_lift=None):
+        """
+        center から depth ホップ以内のノード番号とホップ数
+        min_lift 指定時は lift がそれ未満の辺をたどらない
+        """
+        graph = self.graph
+        if min_lift is not None:
+            graph = graph.with_edges(graph.weight >= min_lift)
+        hops = csgraph.dijkstra(graph.adjacency, directed=False, unweighted=True, indices=center, limit=depth + 0.5)
+        node_ids = np.flatnonzero(np.isfinite(hops))
+        # 中心からの距離順（同じ距離ではノード番号順）に並べる
+        node_ids = node_ids[np.argsort(hops[node_ids], kind='stable')]
+        return graph, node_ids, hops[node_ids].astype(np.int64)
+
+    def subgraph_json(self, graph, node_ids, extra=None, meta=None):
+        """
+        部分グラフのネットワーク JSON（全体での指標に加え、部分グラフ内で計算した local_* 指標を付ける）
+        """
+        sub = graph.subgraph(node_ids)
+        local_betweenness, _ = compute_betweenness(sub, mode="auto")
+        metrics = {
+            "betweenness": self.attributes.get("betweenness", np.zeros(self.graph.n_nodes))[node_ids],
+            "degree": self.attributes.get("degree", np.zeros(self.graph.n_nodes))[node_ids],
+            "closeness": self.attributes.get("closeness", np.zeros(self.graph.n_nodes))[node_ids],
+            "eigenvector": self.attributes.get("eigenvector", np.zeros(self.graph.n_nodes))[node_ids],
+            "group": self.attributes.get("group", np.zeros(self.graph.n_nodes, dtype=np.int64))[node_ids]
+        }
+        revenue = self.attributes.get("revenue")
+        shop_revenue = dict(zip(sub.nodes.tolist(), revenue[node_ids].tolist())) if revenue is not None else None
+        positions = None
+        if "x" in self.attributes and "y" in self.attributes:
+            positions = np.column_stack([self.attributes["x"][node_ids], self.attributes["y"][node_ids]]).astype(np.float64)
+        data = network_json(sub, metrics, shop_revenue=shop_revenue, meta=meta, positions=positions)
+        local = {
+            "local_betweenness": local_betweenness,
+            "local_degree": degree_centrality(sub),
+            "local_closeness": closeness_centrality(sub)
+        }
+        local.update(extra or {})
+        for i, node in enumerate(data["nodes"]):
+            for key, values in local.items():
+                node[key] = values[i].item()
+        return data
+
+def register_graph_index(process_id, data):
+    """処理IDのネットワーク JSON からインデックスを作成して保持する（古いものから削除）"""
+    try:
+        graph_index = GraphIndex.from_network_json(data)
+    except Exception as e:
+        logging.warning(f"グラフインデックス作成エラー: {process_id}: {e}")
+        return None
+    with _index_lock:
+        _graph_indexes[process_id] = graph_index
+        _graph_indexes.move_to_end(process_id)
+        while len(_graph_indexes) > GRAPH_INDEX_MAX:
+            _graph_indexes.popitem(last=False)
+    logging.info(f"グラフインデックス登録: {process_id} ({graph_index.graph.n_nodes} ノード, {graph_index.graph.n_edges} 辺)")
+    return graph_index
+
+def get_graph_index(process_id):
+    """処理IDのインデックス（なければ None）"""
+    with _index_lock:
+        graph_index = _graph_indexes.get(process_id)
+        if graph_index is not None:
+            _graph_indexes.move_to_end(process_id)
+    return graph_index
+
+def ego_network(graph_index, shop, depth=2, min_lift=None):
+    """
+    店舗 shop の depth ホップ以内のエゴネットワーク
+    戻り値: ネットワーク JSON（各ノードに hops, local_* 指標）。店舗がなければ None
+    """
+    start = time.perf_counter()
+    center = graph_index.node_id(shop)
+    if center is None:
+        return None
+    graph, node_ids, hops = graph_index.ego_nodes(center, depth, min_lift=min_lift)
+    meta = {"center": shop, "depth": depth, "min_lift": min_lift}
+    data = graph_index.subgraph_json(graph, node_ids, extra={"hops": hops}, meta=meta)
+    meta.update({"n_nodes": len(data["nodes"]), "n_links": len(data["links"]), "seconds": time.perf_counter() - start})
+    return data
+
+def induced_subgraph(graph_index, shops, min_lift=None):
+    """
+    指定した店舗どうしの部分グラフ
+    戻り値: (ネットワーク JSON, 見つからなかった店舗名のリスト)
+    """
+    start = time.perf_counter()
+    positions = graph_index.index.get_indexer(shops)
+    missing = [shop for shop, pos in zip(shops, positions) if pos < 0]
+    node_ids = pd.unique(positions[positions >= 0])
+    graph = graph_index.graph
+    if min_lift is not None:
+        graph = graph.with_edges(graph.weight >= min_lift)
+    meta = {"shops": len(shops), "min_lift": min_lift, "missing": missing}
+    data = graph_index.subgraph_json(graph, node_ids, meta=meta)
+    meta.update({"n_nodes": len(data["nodes"]), "n_links": len(data["links"]), "seconds": time.perf_counter() - start})
+    return data, missing
@@ -0,0 +1,270 @@
+import logging
+import numpy as np
+import pandas as pd
+import networkx as nx
+from scipy import sparse
+from scipy.sparse import csgraph
+from scipy.sparse.linalg import eigsh
+from .centrality import compute_betweenness
+from .communities import detect_communities, DEFAULT_COMMUNITY_ENGINE
+from .backbone import extract_backbone
+from .layout import compute_layout, LAYOUT_ITERATIONS
+
+# 固有ベクトル中心性を密行列の固有値分解で求めるノード数の上限
+_DENSE_EIGEN_MAX_NODES = 64
+
+# 近さ中心性の最短距離をまとめて計算する始点数
+_CLOSENESS_BLOCK = 256
+
+class SparseGraph:
+    """
+    店舗ネットワーク（無向・重み付き）を CSR 隣接行列で保持する
+    - nodes: ノード名（ルールに最初に出現した順）
+    - src, dst, weight: 無向辺（src < dst のノード番号）と重み（lift）
+    """
+    def __init__(self, nodes, src, dst, weight):
+        self.nodes = np.asarray(nodes, dtype=object)
+        self.src = np.asarray(src, dtype=np.int64)
+        self.dst = np.asarray(dst, dtype=np.int64)
+        self.weight = np.asarray(weight, dtype=np.float64)
+        n = len(self.nodes)
+        self.adjacency = sparse.csr_matrix(
+            (np.concatenate([self.weight, self.weight]),
+             (np.concatenate([self.src, self.dst]), np.concatenate([self.dst, self.src]))),
+            shape=(n, n)
+        )
+        # 重みが正の有限値でない場合は重みなしの最短経路にする
+        self.weighted = bool(np.all(np.isfinite(self.weight)) and np.all(self.weight > 0))
+
+    @property
+    def n_nodes(self):
+        return len(self.nodes)
+
+    @property
+    def n_edges(self):
+        return len(self.src)
+
+    @classmethod
+    def from_edges(cls, sources, targets, weights):
+        """
+        辺の配列からグラフを作成（空の名前・自己ループは除外）
+        同じ店舗の組が複数回出現した場合は最後の重みを使う
+        """
+        sources = pd.Series(sources, dtype=object).reset_index(drop=True)
+        targets = pd.Series(targets, dtype=object).reset_index(drop=True)
+        weights = np.asarray(weights, dtype=np.float64)
+        ok = (
+            sources.notna() & targets.notna()
+            & (sources.fillna('') != '') & (targets.fillna('') != '')
+            & (sources != targets)
+        ).to_numpy()
+        sources, targets, weights = sources[ok].to_numpy(), targets[ok].to_numpy(), weights[ok]
+
+        # ノード番号は出現順（始点, 終点, 始点, ... の順）
+        interleaved = np.empty(2 * len(sources), dtype=object)
+        interleaved[0::2] = sources
+        interleaved[1::2] = targets
+        codes, nodes = pd.factorize(interleaved)
+        a, b = codes[0::2].astype(np.int64), codes[1::2].astype(np.int64)
+        lo, hi = np.minimum(a, b), np.maximum(a, b)
+
+        # 無向辺の重複を除く（順序は最初の出現、重みは最後の出現）
+        keys = lo * max(len(nodes), 1) + hi
+        _, first = np.unique(keys, return_index=True)
+        _, last_rev = np.unique(keys[::-1], return_index=True)
+        last = len(keys) - 1 - last_rev
+        order = np.argsort(first, kind='stable')
+        first, last = first[order], last[order]
+        # ノード順・隣接ノードの追加順に並べる（networkx の辺の列挙順と同じ）
+        order = np.argsort(lo[first], kind='stable')
+        first, last = first[order], last[order]
+        return cls(np.asarray(nodes, dtype=object), lo[first], hi[first], weights[last])
+
+    @classmethod
+    def from_rules(cls, rules):
+        """アソシエーションルール（antecedents, consequents, lift）からグラフを作成"""
+        if len(rules) == 0:
+            return cls(np.empty(0, dtype=object), [], [], [])
+        sources = rules["antecedents"].map(lambda x: str(x).strip() if pd.notnull(x) else None)
+        targets = rules["consequents"].map(lambda x: str(x).strip() if pd.notnull(x) else None)
+        weights = pd.to_numeric(rules["lift"], errors='coerce').to_numpy(dtype=np.float64)
+        return cls.from_edges(sources, targets, weights)
+
+    def with_edges(self, mask):
+        """mask の辺だけを残したグラフ（ノードはそのまま）"""
+        return SparseGraph(self.nodes, self.src[mask], self.dst[mask], self.weight[mask])
+
+    def subgraph(self, node_ids):
+        """node_ids のノード（この順に番号を振り直す）と、両端がその中にある辺だけのグラフ"""
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        renumber = np.full(self.n_nodes, -1, dtype=np.int64)
+        renumber[node_ids] = np.arange(len(node_ids))
+        src, dst = renumber[self.src], renumber[self.dst]
+        keep = (src >= 0) & (dst >= 0)
+        lo, hi = np.minimum(src[keep], dst[keep]), np.maximum(src[keep], dst[keep])
+        return SparseGraph(self.nodes[node_ids], lo, hi, self.weight[keep])
+
+    def arcs(self):
+        """両方向の有向辺 (始点, 終点, 長さ)"""
+        lengths = self.weight if self.weighted else np.ones(self.n_edges)
+        return (
+            np.concatenate([self.src, self.dst]),
+            np.concatenate([self.dst, self.src]),
+            np.concatenate([lengths, lengths])
+        )
+
+    def distance_matrix(self):
+        """最短経路計算用の隣接行列（重みなしの場合は全辺の長さ 1）"""
+        if self.weighted:
+            return self.adjacency
+        tails, heads, lengths = self.arcs()
+        return sparse.csr_matrix((lengths, (tails, heads)), shape=(self.n_nodes, self.n_nodes))
+
+    def to_networkx(self):
+        G = nx.Graph()
+        G.add_nodes_from(self.nodes.tolist())
+        G.add_weighted_edges_from(zip(self.nodes[self.src].tolist(), self.nodes[self.dst].tolist(), self.weight.tolist()))
+        return G
+
+def degree_centrality(graph):
+    n = graph.n_nodes
+    if n <= 1:
+        return np.ones(n)
+    degree = np.bincount(graph.src, minlength=n) + np.bincount(graph.dst, minlength=n)
+    return degree / (n - 1)
+
+def closeness_centrality(graph, indices=None):
+    """
+    近さ中心性（到達可能なノード数で補正、networkx の wf_improved と同じ）
+    indices: 計算するノード番号（省略時は全ノード）。戻り値は indices の順
+    """
+    n = graph.n_nodes
+    indices = np.arange(n) if indices is None else np.asarray(indices, dtype=np.int64)
+    closeness = np.zeros(len(indices))
+    if n <= 1:
+        return closeness
+    adjacency = graph.distance_matrix()
+    for start in range(0, len(indices), _CLOSENESS_BLOCK):
+        block = indices[start:start + _CLOSENESS_BLOCK]
+        dist = csgraph.dijkstra(adjacency, directed=False, indices=block)
+        reachable = np.isfinite(dist)
+        n_reach = reachable.sum(axis=1) - 1
+        total = np.where(reachable, dist, 0.0).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            closeness[start:start + len(block)] = np.where(total > 0, n_reach / total * n_reach / (n - 1), 0.0)
+    return closeness
+
+def eigenvector_centrality(graph):
+    """
+    固有ベクトル中心性（重み付き隣接行列の最大固有値の固有ベクトル）
+    非連結なグラフでは一意に定まらないため 0 とする
+    """
+    n = graph.n_nodes
+    if n == 0:
+        return np.zeros(0)
+    n_components, _ = csgraph.connected_components(graph.adjacency, directed=False)
+    if n_components > 1 or not np.all(np.isfinite(graph.weight)):
+        return np.zeros(n)
+    try:
+        if n <= _DENSE_EIGEN_MAX_NODES:
+            _, vectors = np.linalg.eigh(graph.adjacency.toarray())
+            largest = vectors[:, -1]
+        else:
+            _, vectors = eigsh(graph.adjacency, k=1, which='LA')
+            largest = vectors[:, 0]
+    except Exception as e:
+        logging.warning(f"固有ベクトル中心性の計算に失敗しました: {e}")
+        return np.zeros(n)
+    norm = np.sign(largest.sum()) * np.linalg.norm(largest)
+    return largest / norm if norm else np.zeros(n)
+
+def node_metrics(graph, betweenness_mode="auto", betweenness_k=None, n_jobs=1,
+                 community_engine=DEFAULT_COMMUNITY_ENGINE, resolution=1.0, seed=42):
+    """
+    ノード順に揃えた中心性指標・コミュニティ番号の配列
+    戻り値: ({"betweenness", "degree", "closeness", "eigenvector", "group"},
+             {"betweenness": 近似の情報, "community": 検出方式・所要時間})
+    """
+    betweenness, betweenness_info = compute_betweenness(graph, mode=betweenness_mode, k=betweenness_k, n_jobs=n_jobs)
+    groups, community_info = detect_communities(graph, engine=community_engine, resolution=resolution, seed=seed)
+    metrics = {
+        "betweenness": betweenness,
+        "degree": degree_centrality(graph),
+        "closeness": closeness_centrality(graph),
+        "eigenvector": eigenvector_centrality(graph),
+        "group": groups
+    }
+    return metrics, {"betweenness": betweenness_info, "community": community_info}
+
+def rule_shop_revenue(rules):
+    """ルールの antecedent_revenue / consequent_revenue から店舗ごとの利用金額（最初の出現）"""
+    if 'antecedent_revenue' not in rules.columns or 'consequent_revenue' not in rules.columns:
+        return {}
+    names = np.empty(2 * len(rules), dtype=object)
+    names[0::2] = rules["antecedents"].map(lambda x: str(x).strip()).to_numpy()
+    names[1::2] = rules["consequents"].map(lambda x: str(x).strip()).to_numpy()
+    revenue = np.empty(2 * len(rules), dtype=np.float64)
+    revenue[0::2] = pd.to_numeric(rules["antecedent_revenue"], errors='coerce').fillna(0).to_numpy()
+    revenue[1::2] = pd.to_numeric(rules["consequent_revenue"], errors='coerce').fillna(0).to_numpy()
+    series = pd.Series(revenue, index=names)
+    series = series[~series.index.duplicated(keep='first')]
+    return series.to_dict()
+
+def network_json(graph, metrics, shop_revenue=None, meta=None, positions=None):
+    """ノード・リンクの JSON（D3 用）を作成（positions があればノードに x, y を付ける）"""
+    shop_revenue = shop_revenue or {}
+    names = graph.nodes.tolist()
+    nodes = [
+        {
+            "id": name,
+            "betweenness": float(b),
+            "degree": float(d),
+            "closeness": float(c),
+            "eigenvector": float(e),
+            "group": int(g),
+            "revenue": float(shop_revenue.get(name, 0))
+        }
+        for name, b, d, c, e, g in zip(
+            names, metrics["betweenness"], metrics["degree"], metrics["closeness"],
+            metrics["eigenvector"], metrics["group"]
+        )
+    ]
+    if positions is not None:
+        for node, (x, y) in zip(nodes, positions.tolist()):
+            node["x"] = x
+            node["y"] = y
+    links = [
+        {"source": names[u], "target": names[v], "value": float(w)}
+        for u, v, w in zip(graph.src.tolist(), graph.dst.tolist(), graph.weight.tolist())
+    ]
+    result = {"nodes": nodes, "links": links}
+    if meta is not None:
+        result["meta"] = meta
+    return result
+
+def build_rules_network(rules, betweenness_mode="auto", betweenness_k=None, n_jobs=1,
+                        community_engine=DEFAULT_COMMUNITY_ENGINE, resolution=1.0, seed=42, backbone=None, layout=None):
+    """
+    アソシエーションルールからネットワークを作成（グラフ作成・指標計算は1回だけ）
+    backbone: 骨格抽出のオプション（alpha, top_k, min_lift）。指定時は骨格のグラフで指標を計算する
+    layout: レイアウト計算のオプション（enabled, iterations, seed）。既定ではコミュニティを初期配置にして座標を計算する
+    戻り値: (SparseGraph, ノード指標の配列, ネットワーク JSON)
+    """
+    graph = SparseGraph.from_rules(rules)
+    if graph.n_nodes == 0:
+        return graph, {}, {"nodes": [], "links": []}
+    backbone_info = None
+    if backbone and any(v is not None for v in backbone.values()):
+        graph, backbone_info = extract_backbone(graph, **backbone)
+    metrics, meta = node_metrics(
+        graph, betweenness_mode=betweenness_mode, betweenness_k=betweenness_k, n_jobs=n_jobs,
+        community_engine=community_engine, resolution=resolution, seed=seed
+    )
+    if backbone_info is not None:
+        meta["backbone"] = backbone_info
+    layout = dict({"enabled": True, "iterations": LAYOUT_ITERATIONS, "seed": 42}, **(layout or {}))
+    positions = None
+    if layout["enabled"]:
+        positions, meta["layout"] = compute_layout(graph, metrics["group"], iterations=layout["iterations"], seed=layout["seed"])
+    data = network_json(graph, metrics, shop_revenue=rule_shop_revenue(rules), meta=meta, positions=positions)
+    return graph, metrics, data
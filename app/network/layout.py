@@ -0,0 +1,172 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# 力学モデル（Fruchterman-Reingold）の反復回数
+LAYOUT_ITERATIONS = int(os.environ.get("NETWORK_LAYOUT_ITERATIONS", "100"))
+
+# ノード数がこれを超えたら斥力をランダムに選んだノードだけで近似する
+LAYOUT_EXACT_REPULSION_MAX = int(os.environ.get("NETWORK_LAYOUT_EXACT_REPULSION_MAX", "1000"))
+
+# メモリ上に保持するレイアウトの件数
+LAYOUT_CACHE_SIZE = int(os.environ.get("NETWORK_LAYOUT_CACHE_SIZE", "32"))
+
+# 近似時に斥力を計算する相手のノード数
+_REPULSION_SAMPLE = 500
+
+# 斥力の計算でまとめて処理するノード対の数（メモリ使用量の調整用）
+_PAIR_BLOCK = 2_000_000
+
+# 原点へ引き寄せる力の強さ（非連結な部分が離れすぎないようにする）
+_GRAVITY = 0.05
+
+# 出力座標での辺の平均の長さ（d3-force のリンク距離の既定値と同じ）
+_LINK_DISTANCE = 30.0
+
+_layout_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def initial_positions(groups, rng):
+    """
+    コミュニティごとにまとめた初期配置
+    コミュニティの中心を円周上に並べ、所属ノードを中心の周りにランダムに散らす
+    """
+    n = len(groups)
+    n_comms = int(groups.max()) + 1 if n else 0
+    sizes = np.bincount(groups, minlength=n_comms)
+    angles = 2 * np.pi * np.arange(n_comms) / max(n_comms, 1)
+    # コミュニティ数が1つなら中心は原点
+    radius = np.sqrt(n) if n_comms > 1 else 0.0
+    centers = radius * np.column_stack([np.cos(angles), np.sin(angles)])
+    spread = 0.5 * np.sqrt(sizes[groups])
+    theta = rng.uniform(0, 2 * np.pi, n)
+    r = spread * np.sqrt(rng.uniform(0, 1, n))
+    return centers[groups] + np.column_stack([r * np.cos(theta), r * np.sin(theta)])
+
+def _repulsion(pos, targets, scale):
+    """各ノードが targets のノードから受ける斥力 k²/d（理想距離 k = 1）の合計"""
+    n = len(pos)
+    x, y = pos[:, 0], pos[:, 1]
+    tx, ty = x[targets], y[targets]
+    disp = np.empty_like(pos)
+    block = max(1, _PAIR_BLOCK // max(len(targets), 1))
+    for start in range(0, n, block):
+        dx = x[start:start + block, None] - tx
+        dy = y[start:start + block, None] - ty
+        inv = dx * dx
+        inv += dy * dy
+        np.maximum(inv, 1e-6, out=inv)
+        np.reciprocal(inv, out=inv)
+        disp[start:start + block, 0] = (dx * inv).sum(axis=1)
+        disp[start:start + block, 1] = (dy * inv).sum(axis=1)
+    return disp * scale
+
+def force_layout(graph, groups, iterations=LAYOUT_ITERATIONS, seed=42):
+    """
+    Fruchterman-Reingold の力学モデルによるノード座標（全ノードの力を配列演算でまとめて計算）
+    引力は辺の重み（lift を平均 1 に正規化）に比例させる
+    戻り値: (ノード順の座標 (n, 2), 斥力を近似したかどうか)
+    """
+    n = graph.n_nodes
+    if n <= 1:
+        return np.zeros((n, 2)), False
+    rng = np.random.default_rng(seed)
+    pos = initial_positions(np.asarray(groups, dtype=np.int64), rng)
+
+    src, dst = graph.src, graph.dst
+    weight = graph.weight if graph.weighted else np.ones(graph.n_edges)
+    if len(weight):
+        weight = weight / weight.mean()
+    approximate = n > LAYOUT_EXACT_REPULSION_MAX
+    all_nodes = np.arange(n)
+
+    temperature = 0.1 * np.sqrt(n)
+    cooling = temperature / (iterations + 1)
+    for _ in range(iterations):
+        if approximate:
+            targets = rng.choice(n, _REPULSION_SAMPLE, replace=False)
+            disp = _repulsion(pos, targets, n / _REPULSION_SAMPLE)
+        else:
+            disp = _repulsion(pos, all_nodes, 1.0)
+
+        # 引力 d²/k（辺の両端に逆向きに足し込む）
+        delta = pos[src] - pos[dst]
+        dist = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+        pull = delta * (dist * weight)[:, None]
+        for axis in range(2):
+            disp[:, axis] -= np.bincount(src, weights=pull[:, axis], minlength=n)
+            disp[:, axis] += np.bincount(dst, weights=pull[:, axis], minlength=n)
+        disp -= _GRAVITY * pos
+
+        # 移動量は温度で頭打ちにする
+        length = np.maximum(np.sqrt(np.einsum('ij,ij->i', disp, disp)), 1e-9)
+        pos += disp * (np.minimum(length, temperature) / length)[:, None]
+        temperature -= cooling
+    return pos, approximate
+
+def scale_positions(graph, pos):
+    """辺の平均の長さが _LINK_DISTANCE になるよう重心を原点にして拡大する"""
+    if len(pos) == 0:
+        return pos
+    pos = pos - pos.mean(axis=0)
+    if graph.n_edges:
+        delta = pos[graph.src] - pos[graph.dst]
+        typical = np.sqrt(np.einsum('ij,ij->i', delta, delta)).mean()
+    else:
+        typical = np.sqrt(np.einsum('ij,ij->i', pos, pos)).mean()
+    return pos * (_LINK_DISTANCE / typical) if typical > 0 else pos
+
+def _layout_key(graph, groups, iterations, seed):
+    digest = hashlib.sha256()
+    digest.update(f"{iterations}:{seed}:{LAYOUT_EXACT_REPULSION_MAX}\n".encode('utf-8'))
+    digest.update("\n".join(map(str, graph.nodes.tolist())).encode('utf-8'))
+    for array in (graph.src, graph.dst, graph.weight, np.asarray(groups, dtype=np.int64)):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+def layout_options_from_form(form):
+    """リクエストのフォーム値からレイアウト計算のオプションを作成"""
+    iterations = int(form.get("layout_iterations", str(LAYOUT_ITERATIONS)))
+    if iterations < 0:
+        raise ValueError("layout_iterationsは0以上を指定してください")
+    return {
+        "enabled": form.get("layout", "true").lower() in ("true", "1"),
+        "iterations": iterations,
+        "seed": int(form.get("layout_seed", "42"))
+    }
+
+def compute_layout(graph, groups, iterations=LAYOUT_ITERATIONS, seed=42):
+    """
+    ノード座標を計算する（同じグラフ・コミュニティ・パラメータの結果はメモリ上のキャッシュから返す）
+    戻り値: (ノード順の座標 (n, 2), {"algorithm", "iterations", "seed", "approximate", "seconds", "cached"})
+    """
+    key = _layout_key(graph, groups, iterations, seed)
+    with _cache_lock:
+        cached = _layout_cache.get(key)
+        if cached is not None:
+            _layout_cache.move_to_end(key)
+    if cached is not None:
+        pos, info = cached
+        return pos.copy(), dict(info, cached=True)
+
+    start = time.perf_counter()
+    pos, approximate = force_layout(graph, groups, iterations=iterations, seed=seed)
+    pos = scale_positions(graph, pos)
+    info = {
+        "algorithm": "fruchterman_reingold",
+        "iterations": iterations,
+        "seed": seed,
+        "approximate": approximate,
+        "seconds": time.perf_counter() - start,
+        "cached": False
+    }
+    with _cache_lock:
+        _layout_cache[key] = (pos, info)
+        while len(_layout_cache) > LAYOUT_CACHE_SIZE:
+            _layout_cache.popitem(last=False)
+    logging.info(f"ネットワークレイアウト計算完了: {graph.n_nodes} ノード, {iterations} 回, {info['seconds']:.3f}秒")
+    return pos.copy(), info
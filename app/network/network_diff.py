@@ -0,0 +1,131 @@
+import time
+import numpy as np
+import pandas as pd
+
+# 順位変化を比較できる指標
+DIFF_METRICS = ("betweenness", "degree", "closeness", "eigenvector")
+
+# 変化の一覧で返す既定の件数（0 なら全件）
+DIFF_DEFAULT_LIMIT = 200
+
+def _node_frame(graph_index, metric):
+    """ノード名・コミュニティ・指標・指標の順位（降順, 同値は最小順位）の表"""
+    n = graph_index.graph.n_nodes
+    values = graph_index.attributes.get(metric, np.zeros(n))
+    frame = pd.DataFrame({
+        "id": graph_index.graph.nodes,
+        "group": graph_index.attributes.get("group", np.zeros(n, dtype=np.int64)),
+        "value": values
+    })
+    frame["rank"] = frame["value"].rank(ascending=False, method="min")
+    return frame
+
+def _edge_frame(graph_index):
+    """辺を (店舗名の小さい方, 大きい方, lift) の表にする（2つのネットワークで同じ辺が同じキーになる）"""
+    graph = graph_index.graph
+    u = pd.Series(graph.nodes[graph.src], dtype=object)
+    v = pd.Series(graph.nodes[graph.dst], dtype=object)
+    swap = (u > v).to_numpy()
+    return pd.DataFrame({
+        "source": np.where(swap, v, u),
+        "target": np.where(swap, u, v),
+        "lift": graph.weight
+    })
+
+def _columns(frame, columns, limit):
+    """表を列ごとのリストにする（limit 件まで）"""
+    if limit:
+        frame = frame.head(limit)
+    return {column: frame[column].tolist() for column in columns}
+
+def match_communities(groups_before, groups_after):
+    """
+    変更後のコミュニティ番号を、共通ノードが最も多く重なる変更前のコミュニティ番号に対応付ける
+    戻り値: 変更後の番号 → 変更前の番号 の Series
+    """
+    overlap = pd.DataFrame({"before": groups_before, "after": groups_after}).value_counts()
+    overlap = overlap.reset_index(name="count").sort_values(["after", "count", "before"], ascending=[True, False, True])
+    best = overlap.drop_duplicates("after")
+    return pd.Series(best["before"].to_numpy(), index=best["after"].to_numpy())
+
+def diff_networks(before, after, metric="betweenness", limit=DIFF_DEFAULT_LIMIT):
+    """
+    2つの処理済みネットワーク（GraphIndex）の差分
+    - edges: 追加・削除された辺、両方にある辺の lift の変化（変化の大きい順）
+    - nodes: 追加・削除されたノード、metric の順位の変化（変化の大きい順）、コミュニティが変わったノード
+    戻り値: 列ごとのリストにまとめた差分
+    """
+    if metric not in DIFF_METRICS:
+        raise ValueError(f"metricは {', '.join(DIFF_METRICS)} のいずれかを指定してください")
+    start = time.perf_counter()
+
+    # 辺の差分（店舗名の組で外部結合）
+    edges = _edge_frame(before).merge(
+        _edge_frame(after), on=["source", "target"], how="outer", suffixes=("_before", "_after"), indicator=True
+    )
+    added_edges = edges[edges["_merge"] == "right_only"].sort_values("lift_after", ascending=False)
+    removed_edges = edges[edges["_merge"] == "left_only"].sort_values("lift_before", ascending=False)
+    common_edges = edges[edges["_merge"] == "both"].copy()
+    common_edges["delta"] = common_edges["lift_after"] - common_edges["lift_before"]
+    changed_edges = common_edges[common_edges["delta"] != 0]
+    changed_edges = changed_edges.iloc[np.argsort(-changed_edges["delta"].abs().to_numpy(), kind="stable")]
+
+    # ノードの差分（店舗名で外部結合）
+    nodes = _node_frame(before, metric).merge(
+        _node_frame(after, metric), on="id", how="outer", suffixes=("_before", "_after"), indicator=True
+    )
+    added_nodes = nodes[nodes["_merge"] == "right_only"]
+    removed_nodes = nodes[nodes["_merge"] == "left_only"]
+    common = nodes[nodes["_merge"] == "both"].copy()
+    # 外部結合で float になった番号・順位を整数に戻す
+    for column in ("group_before", "group_after", "rank_before", "rank_after"):
+        common[column] = common[column].astype(np.int64)
+    common["rank_change"] = common["rank_before"] - common["rank_after"]
+    rank_changes = common[common["rank_change"] != 0]
+    rank_changes = rank_changes.iloc[np.argsort(-rank_changes["rank_change"].abs().to_numpy(), kind="stable")]
+
+    # コミュニティ番号は実行ごとに異なるため、重なりの最も大きいコミュニティに対応付けてから比較する
+    group_before = common["group_before"].to_numpy()
+    group_after = common["group_after"].to_numpy()
+    if len(common):
+        common["group_after_matched"] = match_communities(group_before, group_after).reindex(group_after).to_numpy()
+    else:
+        common["group_after_matched"] = pd.Series(dtype=np.int64)
+    reassigned = common[common["group_after_matched"] != common["group_before"]]
+
+    edge_union = len(edges)
+    summary = {
+        "metric": metric,
+        "nodes_before": int(before.graph.n_nodes),
+        "nodes_after": int(after.graph.n_nodes),
+        "edges_before": int(before.graph.n_edges),
+        "edges_after": int(after.graph.n_edges),
+        "added_nodes": len(added_nodes),
+        "removed_nodes": len(removed_nodes),
+        "added_edges": len(added_edges),
+        "removed_edges": len(removed_edges),
+        "changed_edges": len(changed_edges),
+        "reassigned_nodes": len(reassigned),
+        "edge_jaccard": len(common_edges) / edge_union if edge_union else 1.0,
+        "mean_lift_delta": float(common_edges["delta"].mean()) if len(common_edges) else 0.0,
+        "limit": limit,
+        "seconds": time.perf_counter() - start
+    }
+    return {
+        "summary": summary,
+        "edges": {
+            "added": _columns(added_edges.rename(columns={"lift_after": "lift"}), ["source", "target", "lift"], limit),
+            "removed": _columns(removed_edges.rename(columns={"lift_before": "lift"}), ["source", "target", "lift"], limit),
+            "changed": _columns(changed_edges, ["source", "target", "lift_before", "lift_after", "delta"], limit)
+        },
+        "nodes": {
+            "added": added_nodes["id"].tolist()[:limit or None],
+            "removed": removed_nodes["id"].tolist()[:limit or None],
+            "rank_changes": _columns(
+                rank_changes, ["id", "rank_before", "rank_after", "rank_change", "value_before", "value_after"], limit
+            ),
+            "community_changes": _columns(
+                reassigned, ["id", "group_before", "group_after", "group_after_matched"], limit
+            )
+        }
+    }
@@ -0,0 +1,122 @@
+import json
+import struct
+import numpy as np
+import pandas as pd
+
+# ネットワーク JSON の返却形式
+# dict: ノード・リンクごとの辞書（従来の形式）
+# columnar: 列ごとの配列、リンクはノード配列の添字
+# binary: columnar の数値列を型付き配列のまま連結したバイト列
+NETWORK_FORMATS = ("dict", "columnar", "binary")
+
+NETWORK_BINARY_MIMETYPE = "application/octet-stream"
+
+# バイナリ形式の先頭（マジックナンバー, 形式のバージョン）
+_BINARY_MAGIC = b"NETB"
+_BINARY_VERSION = 1
+
+# 整数で送るノードの列（それ以外の数値列は float32）
+_NODE_INT_COLUMNS = ("group",)
+
+def network_format_from_args(args):
+    """クエリパラメータ format から返却形式を決める"""
+    fmt = args.get("format", "dict")
+    if fmt not in NETWORK_FORMATS:
+        raise ValueError(f"formatは {', '.join(NETWORK_FORMATS)} のいずれかを指定してください")
+    return fmt
+
+def columnar_network(data):
+    """
+    ノード・リンクの辞書のリストを列ごとの配列に変換する
+    リンクの source / target はノード配列の添字にする
+    """
+    nodes = data.get("nodes", [])
+    links = data.get("links", [])
+    node_columns = list(nodes[0].keys()) if nodes else ["id"]
+    node_table = {key: [node.get(key) for node in nodes] for key in node_columns}
+    index = pd.Index(node_table["id"])
+    result = {
+        "format": "columnar",
+        "n_nodes": len(nodes),
+        "n_links": len(links),
+        "nodes": node_table,
+        "links": {
+            "source": index.get_indexer([link["source"] for link in links]).tolist(),
+            "target": index.get_indexer([link["target"] for link in links]).tolist(),
+            "value": [link.get("value") for link in links]
+        }
+    }
+    if "meta" in data:
+        result["meta"] = data["meta"]
+    return result
+
+def _typed_arrays(table):
+    """columnar 形式の数値列を (名前, 配列) のリストにする"""
+    arrays = []
+    for key, values in table["nodes"].items():
+        if key == "id":
+            continue
+        dtype = np.int32 if key in _NODE_INT_COLUMNS else np.float32
+        arrays.append((f"nodes.{key}", np.asarray(values, dtype=dtype)))
+    arrays.append(("links.source", np.asarray(table["links"]["source"], dtype=np.int32)))
+    arrays.append(("links.target", np.asarray(table["links"]["target"], dtype=np.int32)))
+    arrays.append(("links.value", np.asarray(table["links"]["value"], dtype=np.float32)))
+    return arrays
+
+def encode_network_binary(data):
+    """
+    ネットワークをバイト列に変換する（ブラウザでは Float32Array / Int32Array でそのまま読める）
+    形式: "NETB" | uint32 バージョン | uint32 ヘッダ長 | ヘッダ JSON (UTF-8) | 8 バイト境界に揃えた配列
+    ヘッダ: {"n_nodes", "n_links", "ids", "meta", "arrays": [{"name", "dtype", "offset", "length"}]}
+    数値はリトルエンディアン、offset はバイト列の先頭からの位置
+    """
+    table = columnar_network(data)
+    arrays = _typed_arrays(table)
+
+    def build_header(base):
+        specs = []
+        offset = base
+        for name, array in arrays:
+            specs.append({"name": name, "dtype": array.dtype.name, "offset": offset, "length": int(len(array))})
+            offset += -(-array.nbytes // 8) * 8
+        header = {
+            "n_nodes": table["n_nodes"],
+            "n_links": table["n_links"],
+            "ids": table["nodes"]["id"],
+            "meta": table.get("meta"),
+            "arrays": specs
+        }
+        return json.dumps(header, ensure_ascii=False, default=str).encode('utf-8')
+
+    # ヘッダ長で配列の開始位置が変わるため、開始位置が定まるまで作り直す
+    prefix = len(_BINARY_MAGIC) + 8
+    base = 0
+    while True:
+        header = build_header(base)
+        aligned = -(-(prefix + len(header)) // 8) * 8
+        if aligned == base:
+            break
+        base = aligned
+
+    parts = [_BINARY_MAGIC, struct.pack("<II", _BINARY_VERSION, len(header)), header]
+    parts.append(b"\0" * (base - prefix - len(header)))
+    for _, array in arrays:
+        raw = array.astype(array.dtype.newbyteorder('<'), copy=False).tobytes()
+        parts.append(raw)
+        parts.append(b"\0" * (-len(raw) % 8))
+    return b"".join(parts)
+
+def decode_network_binary(blob):
+    """encode_network_binary のバイト列を (ヘッダ, {名前: 配列}) に戻す"""
+    if blob[:len(_BINARY_MAGIC)] != _BINARY_MAGIC:
+        raise ValueError("ネットワークのバイナリ形式ではありません")
+    version, header_len = struct.unpack_from("<II", blob, len(_BINARY_MAGIC))
+    if version != _BINARY_VERSION:
+        raise ValueError(f"未対応のバイナリ形式のバージョンです: {version}")
+    start = len(_BINARY_MAGIC) + 8
+    header = json.loads(blob[start:start + header_len].decode('utf-8'))
+    arrays = {
+        spec["name"]: np.frombuffer(blob, dtype=np.dtype(spec["dtype"]).newbyteorder('<'), count=spec["length"], offset=spec["offset"])
+        for spec in header["arrays"]
+    }
+    return header, arrays
@@ -1,6 +1,15 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from app.decorators import login_required
 from .draw_network import create_network_json
+from .centrality import BETWEENNESS_MODES, BETWEENNESS_MIN_PIVOTS
+from .communities import community_options_from_form
+from .backbone import backbone_options_from_form
+from .layout import layout_options_from_form
+from .payload import network_format_from_args, columnar_network, encode_network_binary, NETWORK_BINARY_MIMETYPE
+from .graph_index import get_graph_index, ego_network, induced_subgraph, EGO_MAX_DEPTH
+from .network_diff import diff_networks, DIFF_DEFAULT_LIMIT
+from .what_if import simulate_what_if, WHAT_IF_DEFAULT_LIMIT
+from .export import export_network, EXPORT_FORMATS
 import traceback
 import logging
 import tempfile
@@ -27,6 +36,21 @@ def network():
                 "message": "CSVまたはExcelファイルのみ対応しています"
             }), 400
 
+        betweenness_mode = request.form.get("betweenness_mode", "auto")
+        betweenness_k = int(request.form["betweenness_k"]) if request.form.get("betweenness_k") else None
+        n_jobs = int(request.form.get("n_jobs", "1"))
+        if betweenness_mode not in BETWEENNESS_MODES:
+            return jsonify({"error": "invalid_betweenness_mode"}), 400
+        if betweenness_k is not None and betweenness_k < BETWEENNESS_MIN_PIVOTS:
+            return jsonify({"error": "invalid_betweenness_k"}), 400
+        try:
+            community_options = community_options_from_form(request.form)
+            backbone_options = backbone_options_from_form(request.form)
+            layout_options = layout_options_from_form(request.form)
+            response_format = network_format_from_args(request.args)
+        except ValueError as e:
+            return jsonify({"error": "invalid_network_options", "message": str(e)}), 400
+
         # ファイルの内容を完全に読み込んでコピー
         file_content = f.read()
         f.seek(0)  # ファイルポインタをリセット
@@ -45,8 +69,12 @@ def network():
             else:
                 df = pd.read_excel(temp_file_path)
 
-            data = create_network_json(temp_file_path)
-            return jsonify(data)
+            data = create_network_json(
+                temp_file_path, betweenness_mode=betweenness_mode, betweenness_k=betweenness_k,
+                n_jobs=n_jobs, community_options=community_options, backbone_options=backbone_options,
+                layout_options=layout_options
+            )
+            return _network_response(data, response_format)
         except Exception as e:
             logging.error(f"Network creation error: {str(e)}")
             logging.error(traceback.format_exc())
@@ -68,3 +96,137 @@ def network():
             "message": str(e),
             "details": traceback.format_exc()
         }), 500
+
+def _network_response(data, response_format):
+    if response_format == "binary":
+        return Response(encode_network_binary(data), mimetype=NETWORK_BINARY_MIMETYPE)
+    if response_format == "columnar":
+        return jsonify(columnar_network(data))
+    return jsonify(data)
+
+@network_bp.route("/api/network/<process_id>/ego/<path:shop>", methods=["GET"])
+@login_required
+def ego(process_id, shop):
+    """処理済みネットワークから店舗の depth ホップ以内の部分グラフを返す"""
+    try:
+        graph_index = get_graph_index(process_id)
+        if graph_index is None:
+            return jsonify({"error": "graph_not_found", "message": "処理済みのネットワークが見つかりません"}), 404
+        try:
+            depth = int(request.args.get("depth", "2"))
+            min_lift = float(request.args["min_lift"]) if request.args.get("min_lift") else None
+            response_format = network_format_from_args(request.args)
+        except ValueError as e:
+            return jsonify({"error": "invalid_ego_options", "message": str(e)}), 400
+        if not 1 <= depth <= EGO_MAX_DEPTH:
+            return jsonify({"error": "invalid_ego_options", "message": f"depthは1以上{EGO_MAX_DEPTH}以下を指定してください"}), 400
+
+        data = ego_network(graph_index, shop, depth=depth, min_lift=min_lift)
+        if data is None:
+            return jsonify({"error": "shop_not_found", "message": f"店舗が見つかりません: {shop}"}), 404
+        return _network_response(data, response_format)
+    except Exception as e:
+        logging.error(f"Ego network error: {str(e)}")
+        logging.error(traceback.format_exc())
+        return jsonify({"error": "ego_network_failed", "message": str(e)}), 500
+
+@network_bp.route("/api/network/<process_id>/subgraph", methods=["GET"])
+@login_required
+def subgraph(process_id):
+    """処理済みネットワークから指定した店舗（shop を複数指定）どうしの部分グラフを返す"""
+    try:
+        graph_index = get_graph_index(process_id)
+        if graph_index is None:
+            return jsonify({"error": "graph_not_found", "message": "処理済みのネットワークが見つかりません"}), 404
+        shops = request.args.getlist("shop")
+        if not shops:
+            return jsonify({"error": "shop_required"}), 400
+        try:
+            min_lift = float(request.args["min_lift"]) if request.args.get("min_lift") else None
+            response_format = network_format_from_args(request.args)
+        except ValueError as e:
+            return jsonify({"error": "invalid_subgraph_options", "message": str(e)}), 400
+
+        data, _ = induced_subgraph(graph_index, shops, min_lift=min_lift)
+        return _network_response(data, response_format)
+    except Exception as e:
+        logging.error(f"Subgraph error: {str(e)}")
+        logging.error(traceback.format_exc())
+        return jsonify({"error": "subgraph_failed", "message": str(e)}), 500
+
+@network_bp.route("/api/network/diff", methods=["GET"])
+@login_required
+def network_diff():
+    """2つの処理済みネットワーク（before, after の処理ID）の辺・ノード・コミュニティの差分を返す"""
+    try:
+        before_id = request.args.get("before")
+        after_id = request.args.get("after")
+        if not before_id or not after_id:
+            return jsonify({"error": "process_id_required", "message": "beforeとafterに処理IDを指定してください"}), 400
+        before = get_graph_index(before_id)
+        after = get_graph_index(after_id)
+        missing = [pid for pid, index in ((before_id, before), (after_id, after)) if index is None]
+        if missing:
+            return jsonify({"error": "graph_not_found", "message": f"処理済みのネットワークが見つかりません: {', '.join(missing)}"}), 404
+        try:
+            limit = int(request.args.get("limit", str(DIFF_DEFAULT_LIMIT)))
+            data = diff_networks(before, after, metric=request.args.get("metric", "betweenness"), limit=max(limit, 0))
+        except ValueError as e:
+            return jsonify({"error": "invalid_diff_options", "message": str(e)}), 400
+        data["summary"].update({"before": before_id, "after": after_id})
+        return jsonify(data)
+    except Exception as e:
+        logging.error(f"Network diff error: {str(e)}")
+        logging.error(traceback.format_exc())
+        return jsonify({"error": "network_diff_failed", "message": str(e)}), 500
+
+@network_bp.route("/api/network/<process_id>/what-if", methods=["POST"])
+@login_required
+def what_if(process_id):
+    """
+    店舗の削除・統合後の媒介中心性・近さ中心性を返す
+    JSON: {"remove": [店舗名, ...], "merge": [{"into": 統合後の店舗名, "members": [店舗名, ...]}], "limit": 件数}
+    """
+    try:
+        graph_index = get_graph_index(process_id)
+        if graph_index is None:
+            return jsonify({"error": "graph_not_found", "message": "処理済みのネットワークが見つかりません"}), 404
+        body = request.get_json(silent=True) or {}
+        remove = body.get("remove") or []
+        merges = body.get("merge") or []
+        if not remove and not merges:
+            return jsonify({"error": "scenario_required", "message": "removeまたはmergeを指定してください"}), 400
+        if any(not isinstance(m, dict) or "into" not in m or not m.get("members") for m in merges):
+            return jsonify({"error": "invalid_scenario", "message": "mergeは into と members を指定してください"}), 400
+        try:
+            limit = max(int(body.get("limit", WHAT_IF_DEFAULT_LIMIT)), 0)
+            data = simulate_what_if(graph_index, remove=remove, merges=merges, limit=limit, n_jobs=int(body.get("n_jobs", 1)))
+        except ValueError as e:
+            return jsonify({"error": "invalid_scenario", "message": str(e)}), 400
+        return jsonify(data)
+    except Exception as e:
+        logging.error(f"What-if error: {str(e)}")
+        logging.error(traceback.format_exc())
+        return jsonify({"error": "what_if_failed", "message": str(e)}), 500
+
+@network_bp.route("/api/network/<process_id>/export", methods=["GET"])
+@login_required
+def export(process_id):
+    """処理済みネットワークを GEXF / GraphML / Gephi 用 CSV（ZIP）で少しずつ送る"""
+    try:
+        graph_index = get_graph_index(process_id)
+        if graph_index is None:
+            return jsonify({"error": "graph_not_found", "message": "処理済みのネットワークが見つかりません"}), 404
+        fmt = request.args.get("format", "gexf")
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({"error": "invalid_export_format", "message": f"formatは {', '.join(EXPORT_FORMATS)} のいずれかを指定してください"}), 400
+        mimetype, extension = EXPORT_FORMATS[fmt]
+        return Response(
+            stream_with_context(export_network(graph_index, fmt)),
+            mimetype=mimetype,
+            headers={"Content-Disposition": f"attachment; filename=network_{process_id}.{extension}"}
+        )
+    except Exception as e:
+        logging.error(f"Network export error: {str(e)}")
+        logging.error(traceback.format_exc())
+        return jsonify({"error": "network_export_failed", "message": str(e)}), 500
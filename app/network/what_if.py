@@ -0,0 +1,193 @@
+import time
+import logging
+import numpy as np
+import pandas as pd
+from scipy.sparse import csgraph
+from .graph_metrics import SparseGraph, closeness_centrality
+from .centrality import compute_betweenness, source_dependencies, _TIGHT_RTOL
+
+# 影響を受ける辺の判定で一度に扱う「削除ノードの辺」の数（メモリ使用量の調整用）
+_ARC_BLOCK = 64
+
+# 変化の一覧で返す既定の件数（0 なら全件）
+WHAT_IF_DEFAULT_LIMIT = 100
+
+def _exact_scale(n):
+    """正規化した厳密な媒介中心性 = 依存度の合計 × scale（compute_betweenness と同じ）"""
+    return 1.0 / ((n - 1) * (n - 2)) if n > 2 else 0.0
+
+def merge_nodes(graph, merges):
+    """
+    ノードを統合したグラフ
+    merges: [{"into": 統合後の店舗名, "members": [統合する店舗名, ...]}]
+    統合後のノードと同じ店舗を結ぶ辺が複数できた場合は lift の最大値を使う（自己ループは除く）
+    """
+    names = graph.nodes.copy()
+    for merge in merges:
+        members = np.isin(names, list(merge["members"]))
+        names[members] = merge["into"]
+    codes, nodes = pd.factorize(names)
+    src, dst = codes[graph.src], codes[graph.dst]
+    edges = pd.DataFrame({"lo": np.minimum(src, dst), "hi": np.maximum(src, dst), "weight": graph.weight})
+    edges = edges[edges["lo"] != edges["hi"]]
+    edges = edges.groupby(["lo", "hi"], sort=False, as_index=False)["weight"].max()
+    return SparseGraph(np.asarray(nodes, dtype=object), edges["lo"].to_numpy(), edges["hi"].to_numpy(), edges["weight"].to_numpy())
+
+def affected_sources(graph, removed):
+    """
+    削除ノードを最短経路の途中に含む始点（削除ノード自身を含む）
+    r の隣接ノード w について d(s, w) = d(s, r) + len(r, w) となる始点 s は、
+    s からの最短経路 DAG で r が w の親になる（＝ r が途中にある）
+    戻り値: (始点の bool 配列, 削除ノードからの最短距離 (len(removed), n))
+    """
+    n = graph.n_nodes
+    adjacency = graph.distance_matrix()
+    tails, heads, lengths = graph.arcs()
+    out = np.isin(tails, removed)
+    arc_r, arc_w, arc_len = tails[out], heads[out], lengths[out]
+
+    probe = np.unique(np.concatenate([removed, arc_w]))
+    dist = csgraph.dijkstra(adjacency, directed=False, indices=probe)
+    affected = np.zeros(n, dtype=bool)
+    affected[removed] = True
+    for start in range(0, len(arc_r), _ARC_BLOCK):
+        block = slice(start, start + _ARC_BLOCK)
+        dist_r = dist[np.searchsorted(probe, arc_r[block])]
+        dist_w = dist[np.searchsorted(probe, arc_w[block])]
+        through = np.isfinite(dist_r) & np.isclose(dist_r + arc_len[block, None], dist_w, rtol=_TIGHT_RTOL, atol=0)
+        affected |= through.any(axis=0)
+    return affected, dist[np.searchsorted(probe, removed)]
+
+def remove_nodes_incremental(graph, betweenness, closeness, removed):
+    """
+    ノード削除後の媒介中心性・近さ中心性を、影響を受ける最短経路木だけ計算し直して求める
+    betweenness, closeness: 削除前の厳密な値（正規化済み）
+    影響を受けない始点 s（削除ノードを最短経路の途中に含まない）からの依存度は、
+    終点が削除ノードの分（始点を削除ノードにした依存度で求める）を引くだけで済む
+    戻り値: (削除後のグラフ, 媒介中心性, 近さ中心性, 影響を受けた始点数)。
+            差分計算の方が遅くなる場合は None
+    """
+    n = graph.n_nodes
+    removed = np.unique(np.asarray(removed, dtype=np.int64))
+    keep = np.setdiff1d(np.arange(n), removed)
+    new_graph = graph.subgraph(keep)
+    if new_graph.weighted != graph.weighted:
+        return None
+    affected, dist_removed = affected_sources(graph, removed)
+    recompute = np.flatnonzero(affected)
+    if 2 * len(recompute) > len(keep):
+        return None
+
+    # 媒介中心性: 影響を受けた始点の依存度を入れ替え、その他の始点からは削除ノードを終点とする分を引く
+    tails, heads, lengths = graph.arcs()
+    adjacency = graph.distance_matrix()
+    raw = betweenness * ((n - 1) * (n - 2)) if n > 2 else np.zeros(n)
+    raw = raw - source_dependencies(adjacency, tails, heads, lengths, recompute)
+    unaffected_targets = (~affected).astype(np.float64)
+    raw = raw - source_dependencies(adjacency, tails, heads, lengths, removed, target_weights=unaffected_targets)
+    renumber = np.full(n, -1, dtype=np.int64)
+    renumber[keep] = np.arange(len(keep))
+    new_tails, new_heads, new_lengths = new_graph.arcs()
+    new_sources = renumber[recompute[~np.isin(recompute, removed)]]
+    raw = raw[keep] + source_dependencies(new_graph.distance_matrix(), new_tails, new_heads, new_lengths, new_sources)
+    new_betweenness = np.maximum(raw, 0.0) * _exact_scale(len(keep))
+
+    # 近さ中心性: 影響を受けないノードは削除ノードへの距離を合計から除くだけで済む
+    _, labels = csgraph.connected_components(graph.adjacency, directed=False)
+    n_reach = np.bincount(labels)[labels] - 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        total = np.where(closeness > 0, n_reach ** 2 / ((n - 1) * closeness), 0.0)
+    reach_removed = np.isfinite(dist_removed)
+    n_reach_new = (n_reach - reach_removed.sum(axis=0))[keep]
+    total_new = (total - np.where(reach_removed, dist_removed, 0.0).sum(axis=0))[keep]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        new_closeness = np.where(
+            (total_new > 0) & (n_reach_new > 0),
+            n_reach_new / total_new * n_reach_new / max(len(keep) - 1, 1),
+            0.0
+        )
+    new_closeness[new_sources] = closeness_centrality(new_graph, indices=new_sources)
+    return new_graph, new_betweenness, new_closeness, int(len(recompute))
+
+def _n_components(graph):
+    return int(csgraph.connected_components(graph.adjacency, directed=False)[0]) if graph.n_nodes else 0
+
+def _validate_names(graph_index, names):
+    positions = graph_index.index.get_indexer(list(names))
+    missing = [name for name, pos in zip(names, positions) if pos < 0]
+    if missing:
+        raise ValueError(f"店舗が見つかりません: {', '.join(map(str, missing))}")
+    return positions
+
+def simulate_what_if(graph_index, remove=(), merges=(), limit=WHAT_IF_DEFAULT_LIMIT, n_jobs=1):
+    """
+    店舗の削除・統合後の媒介中心性・近さ中心性を求める
+    削除だけで元の媒介中心性が厳密値の場合は差分計算、それ以外（統合・近似値）は全体を計算し直す
+    戻り値: {"summary", "nodes": 変化の大きい順の列ごとのリスト}
+    """
+    start = time.perf_counter()
+    remove = list(dict.fromkeys(remove))
+    merges = [{"into": str(m["into"]), "members": list(m["members"])} for m in merges]
+    removed = _validate_names(graph_index, remove)
+    for merge in merges:
+        _validate_names(graph_index, merge["members"])
+
+    graph = graph_index.graph
+    n = graph.n_nodes
+    betweenness_before = graph_index.attributes.get("betweenness", np.zeros(n)).astype(np.float64)
+    closeness_before = graph_index.attributes.get("closeness", np.zeros(n)).astype(np.float64)
+    betweenness_info = graph_index.meta.get("betweenness") or {}
+    exact_before = betweenness_info.get("mode", "exact") == "exact"
+
+    result = None
+    if len(removed) and not merges and exact_before:
+        result = remove_nodes_incremental(graph, betweenness_before, closeness_before, removed)
+    if result is not None:
+        new_graph, betweenness_after, closeness_after, n_affected = result
+        mode = "incremental"
+    else:
+        new_graph = graph.subgraph(np.setdiff1d(np.arange(n), removed))
+        if merges:
+            new_graph = merge_nodes(new_graph, merges)
+        if exact_before:
+            betweenness_after, _ = compute_betweenness(new_graph, mode="exact", n_jobs=n_jobs)
+        else:
+            betweenness_after, _ = compute_betweenness(new_graph, mode="approx", k=betweenness_info.get("k"), n_jobs=n_jobs)
+        closeness_after = closeness_centrality(new_graph)
+        n_affected = new_graph.n_nodes
+        mode = "full"
+
+    # 統合で新しくできた店舗は変更前の値がない
+    before_ids = graph_index.index.get_indexer(new_graph.nodes)
+    has_before = before_ids >= 0
+    frame = pd.DataFrame({
+        "id": new_graph.nodes,
+        "betweenness_before": np.where(has_before, betweenness_before[before_ids], np.nan),
+        "betweenness_after": betweenness_after,
+        "closeness_before": np.where(has_before, closeness_before[before_ids], np.nan),
+        "closeness_after": closeness_after
+    })
+    frame["betweenness_delta"] = frame["betweenness_after"] - frame["betweenness_before"]
+    frame["closeness_delta"] = frame["closeness_after"] - frame["closeness_before"]
+    frame = frame.iloc[np.argsort(-frame["betweenness_delta"].abs().fillna(np.inf).to_numpy(), kind="stable")]
+    if limit:
+        frame = frame.head(limit)
+    frame = frame.astype(object).where(frame.notna(), None)
+
+    summary = {
+        "mode": mode,
+        "removed": remove,
+        "merged": merges,
+        "affected_sources": n_affected,
+        "nodes_before": int(n),
+        "nodes_after": int(new_graph.n_nodes),
+        "edges_before": int(graph.n_edges),
+        "edges_after": int(new_graph.n_edges),
+        "components_before": _n_components(graph),
+        "components_after": _n_components(new_graph),
+        "mean_closeness_before": float(closeness_before.mean()) if n else 0.0,
+        "mean_closeness_after": float(closeness_after.mean()) if new_graph.n_nodes else 0.0,
+        "seconds": time.perf_counter() - start
+    }
+    logging.info(f"What-if 計算完了: {mode}, 削除 {len(remove)}, 統合 {len(merges)}, 影響始点 {n_affected}, {summary['seconds']:.3f}秒")
+    return {"summary": summary, "nodes": {column: frame[column].tolist() for column in frame.columns}}
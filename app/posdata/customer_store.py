@@ -0,0 +1,304 @@
+import os
+import re
+import json
+import hashlib
+import tempfile
+import threading
+import logging
+import numpy as np
+import pandas as pd
+from .pos_stream import CategoryEncoder, to_epoch_seconds, _grow, read_pos_csv_chunks, DEFAULT_CHUNKSIZE, _TS_MASK
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# 顧客特徴量ストアの保存先
+CUSTOMER_STORE_DIR = os.environ.get("POS_CUSTOMER_STORE_DIR", os.path.join(tempfile.gettempdir(), "pos_customer_store"))
+
+# 顧客のキーにする列（先にあるものを使う）
+CUSTOMER_KEY_COLUMNS = ['カード番号', '会員番号']
+
+# クラスタリングに渡す特徴量の列（ストアのファイルにそのまま保存する）
+FEATURE_COLUMNS = ['利用回数', '総利用金額', '平均利用金額', '最大利用金額', '最頻時間帯', '最頻曜日', '最終利用からの日数']
+
+_HOURS = 24
+_WEEKDAYS = 7
+_HOUR_COLUMNS = [f"hour_{h:02d}" for h in range(_HOURS)]
+_WEEKDAY_COLUMNS = [f"weekday_{d}" for d in range(_WEEKDAYS)]
+_METADATA_KEY = b"customer_store"
+
+# 取り込み済みの購買（顧客ごとの利用日時・利用金額）を保存する列
+_TXN_SECONDS_COLUMN = "txn_seconds"
+_TXN_AMOUNTS_COLUMN = "txn_amounts"
+
+_STORE_ID_PATTERN = re.compile(r'^[\w\-]+$')
+
+# ストアごとの排他ロック
+_store_locks = {}
+_store_locks_guard = threading.Lock()
+
+# 読み込み済みストアのメモリキャッシュ
+_loaded_stores = {}
+
+def _modal_column(counts):
+    """顧客×値の件数行列から最頻値（同数なら小さい値、件数がなければ -1）"""
+    if counts.shape[0] == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.where(counts.sum(axis=1) > 0, counts.argmax(axis=1), -1)
+
+class CustomerFeatureStore:
+    """
+    顧客（カード番号・会員番号）ごとの特徴量を、追加データの差分だけで更新する
+    - 利用回数・利用金額の合計・最大
+    - 時間帯別・曜日別の件数（最頻時間帯・最頻曜日の計算用）
+    - 最終利用日時（RFM の Recency 用）
+    - 取り込み済みの (顧客, 利用日時) キーと利用金額
+    同じ顧客・同じ利用日時の購買は利用金額が最大の1件だけを数える（drop_duplicate_purchases と同じ）
+    前月分を含む累積のファイルを追加しても、取り込み済みの購買は二重に数えない
+    """
+    def __init__(self, key_col=None):
+        self.key_col = key_col
+        self.customers = CategoryEncoder()
+        self.count = np.zeros(0, dtype=np.int64)
+        self.total = np.zeros(0, dtype=np.float64)
+        self.maximum = np.zeros(0, dtype=np.float64)
+        self.last_seen = np.zeros(0, dtype=np.int64)  # UNIX秒（不明は -1）
+        self.hours = np.zeros((0, _HOURS), dtype=np.int32)
+        self.weekdays = np.zeros((0, _WEEKDAYS), dtype=np.int32)
+        # 重複削除状態（キー昇順）
+        self.keys = np.empty(0, dtype=np.int64)
+        self.key_amounts = np.empty(0, dtype=np.float64)
+        self.sources = []
+        self.n_rows = 0
+
+    def _resolve_key_col(self, columns):
+        if self.key_col is None:
+            self.key_col = next((c for c in CUSTOMER_KEY_COLUMNS if c in columns), None)
+        if self.key_col not in columns:
+            raise ValueError(f"顧客のキー列（{'/'.join(CUSTOMER_KEY_COLUMNS)}）が見つかりません")
+        return self.key_col
+
+    def add_chunk(self, chunk):
+        """
+        POSデータのチャンク（顧客キー・利用日時・利用金額）を取り込む
+        戻り値: (新規キー数, 置き換えたキー数)
+        """
+        key_col = self._resolve_key_col(chunk.columns)
+        if '利用日時' not in chunk.columns:
+            raise ValueError("顧客特徴量ストアには利用日時の列が必要です")
+        self.n_rows += len(chunk)
+        cust = self.customers.encode(chunk[key_col]).astype(np.int64)
+        n_cust = len(self.customers)
+        self.count = _grow(self.count, n_cust)
+        self.total = _grow(self.total, n_cust)
+        self.maximum = _grow(self.maximum, n_cust, fill=np.nan)
+        self.last_seen = _grow(self.last_seen, n_cust, fill=-1)
+        self.hours = np.vstack([self.hours, np.zeros((n_cust - len(self.hours), _HOURS), dtype=np.int32)])
+        self.weekdays = np.vstack([self.weekdays, np.zeros((n_cust - len(self.weekdays), _WEEKDAYS), dtype=np.int32)])
+
+        amount = pd.to_numeric(chunk['利用金額'], errors='coerce').to_numpy(dtype=np.float64)
+        seconds, valid = to_epoch_seconds(chunk['利用日時'])
+        ok = cust >= 0
+        cust, amount, seconds, valid = cust[ok], amount[ok], seconds[ok], valid[ok]
+        keys = (cust << 32) | (seconds & _TS_MASK)
+
+        # チャンク内の重複削除（キー昇順・利用金額降順で先頭を残す）
+        order = np.lexsort((-amount, keys))
+        keys, cust, amount, seconds, valid = keys[order], cust[order], amount[order], seconds[order], valid[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        keys, cust, amount, seconds, valid = keys[first], cust[first], amount[first], seconds[first], valid[first]
+
+        pos = np.searchsorted(self.keys, keys)
+        found = pos < len(self.keys)
+        found[found] = self.keys[pos[found]] == keys[found]
+
+        # 取り込み済みのキー: 利用金額が大きい行が来たら置き換える（件数・日時の集計は変わらない）
+        idx = pos[found]
+        new_amount, old_amount = amount[found], self.key_amounts[idx]
+        better = (new_amount > old_amount) | (np.isnan(old_amount) & ~np.isnan(new_amount))
+        idx, new_amount, old_amount, replaced = idx[better], new_amount[better], old_amount[better], cust[found][better]
+        self.key_amounts[idx] = new_amount
+        self.count += np.bincount(replaced[np.isnan(old_amount)], minlength=n_cust)
+        self.total += np.bincount(replaced, weights=new_amount - np.nan_to_num(old_amount), minlength=n_cust)
+        np.fmax.at(self.maximum, replaced, new_amount)
+
+        # 新規キー: 昇順を保ったまま挿入し、件数・金額・日時を集計する
+        ins = ~found
+        cust, amount, seconds, valid = cust[ins], amount[ins], seconds[ins], valid[ins]
+        self.keys = np.insert(self.keys, pos[ins], keys[ins])
+        self.key_amounts = np.insert(self.key_amounts, pos[ins], amount)
+        has_amount = ~np.isnan(amount)
+        self.count += np.bincount(cust[has_amount], minlength=n_cust)
+        self.total += np.bincount(cust[has_amount], weights=amount[has_amount], minlength=n_cust)
+        np.fmax.at(self.maximum, cust[has_amount], amount[has_amount])
+
+        cust_valid, seconds = cust[valid], seconds[valid]
+        hour = (seconds // 3600) % _HOURS
+        self.hours += np.bincount(cust_valid * _HOURS + hour, minlength=n_cust * _HOURS).reshape(n_cust, _HOURS).astype(np.int32)
+        # 1970-01-01 は木曜日（月曜日を 0 とする）
+        weekday = (seconds // 86400 + 3) % _WEEKDAYS
+        self.weekdays += np.bincount(cust_valid * _WEEKDAYS + weekday, minlength=n_cust * _WEEKDAYS).reshape(n_cust, _WEEKDAYS).astype(np.int32)
+        np.maximum.at(self.last_seen, cust_valid, seconds)
+        return int(ins.sum()), len(idx)
+
+    def append_csv(self, file_path, chunksize=DEFAULT_CHUNKSIZE):
+        """
+        追加分のCSVを取り込む（取り込み済みのファイルは読み飛ばす）
+        戻り値: 取り込み行数・新規顧客数・読み飛ばしたかどうか
+        """
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return self._append_source(digest.hexdigest(), lambda: self._read_csv(file_path, chunksize))
+
+    def append_frame(self, df, source=None):
+        """読み込み済みのPOSデータを取り込む（source が取り込み済みなら読み飛ばす）"""
+        return self._append_source(source, lambda: [df])
+
+    def _append_source(self, source, chunks):
+        if source is not None and source in self.sources:
+            logging.info(f"取り込み済みのデータのため顧客特徴量ストアの更新を省略: {source}")
+            return {"rows": 0, "new_keys": 0, "replaced_keys": 0, "new_customers": 0, "skipped": True}
+        n_rows, n_customers = self.n_rows, len(self.customers)
+        new_keys = replaced_keys = 0
+        for chunk in chunks():
+            n_new, n_replaced = self.add_chunk(chunk)
+            new_keys += n_new
+            replaced_keys += n_replaced
+        if source is not None:
+            self.sources.append(source)
+        return {
+            "rows": self.n_rows - n_rows,
+            "new_keys": new_keys,
+            "replaced_keys": replaced_keys,
+            "new_customers": len(self.customers) - n_customers,
+            "skipped": False
+        }
+
+    def _read_csv(self, file_path, chunksize):
+        header = pd.read_csv(file_path, nrows=0).columns
+        usecols = [c for c in CUSTOMER_KEY_COLUMNS + ['利用金額', '利用日時'] if c in header]
+        self._resolve_key_col(usecols)
+        return read_pos_csv_chunks(file_path, chunksize=chunksize, usecols=usecols)
+
+    def features(self):
+        """
+        顧客特徴量の表（キー列 + FEATURE_COLUMNS）
+        最終利用からの日数はストア内の最新の利用日時を基準にする
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(self.count > 0, self.total / np.maximum(self.count, 1), np.nan)
+        known = self.last_seen >= 0
+        latest = self.last_seen[known].max() if known.any() else 0
+        recency = np.where(known, (latest - self.last_seen) // 86400, -1)
+        return pd.DataFrame({
+            self.key_col or CUSTOMER_KEY_COLUMNS[0]: self.customers.index.to_numpy(),
+            '利用回数': self.count,
+            '総利用金額': self.total,
+            '平均利用金額': mean,
+            '最大利用金額': self.maximum,
+            '最頻時間帯': _modal_column(self.hours),
+            '最頻曜日': _modal_column(self.weekdays),
+            '最終利用からの日数': recency
+        })
+
+    def summary(self):
+        return {
+            "key_col": self.key_col,
+            "n_rows": int(self.n_rows),
+            "n_customers": len(self.customers),
+            "n_transactions": len(self.keys),
+            "n_sources": len(self.sources)
+        }
+
+    def save(self, path):
+        """特徴量と差分更新用の件数を1つの列指向ファイル（Parquet）に保存する"""
+        if pa is None:
+            raise RuntimeError("顧客特徴量ストアの保存には pyarrow が必要です")
+        frame = self.features()
+        frame['last_seen'] = self.last_seen
+        frame[_HOUR_COLUMNS] = self.hours
+        frame[_WEEKDAY_COLUMNS] = self.weekdays
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        # 取り込み済みの購買は顧客ごとのリストにして同じファイルに保存する（キーは顧客順に並んでいる）
+        offsets = pa.array(np.searchsorted(self.keys >> 32, np.arange(len(self.customers) + 1)).astype(np.int32))
+        table = table.append_column(_TXN_SECONDS_COLUMN, pa.ListArray.from_arrays(offsets, pa.array(self.keys & _TS_MASK)))
+        table = table.append_column(_TXN_AMOUNTS_COLUMN, pa.ListArray.from_arrays(offsets, pa.array(self.key_amounts)))
+        metadata = dict(table.schema.metadata or {})
+        metadata[_METADATA_KEY] = json.dumps(
+            {"key_col": self.key_col, "n_rows": int(self.n_rows), "sources": self.sources}
+        ).encode('utf-8')
+        pq.write_table(table.replace_schema_metadata(metadata), path)
+
+    @classmethod
+    def load(cls, path):
+        if pa is None:
+            raise RuntimeError("顧客特徴量ストアの読み込みには pyarrow が必要です")
+        table = pq.read_table(path)
+        meta = json.loads(table.schema.metadata[_METADATA_KEY])
+        store = cls(key_col=meta["key_col"])
+        store.n_rows = meta["n_rows"]
+        store.sources = meta["sources"]
+        frame = table.to_pandas()
+        store.customers.index = pd.Index(frame[store.key_col].tolist(), dtype=object)
+        # Arrow から変換した配列は読み取り専用のことがあるため、差分更新できるようコピーする
+        store.count = frame['利用回数'].to_numpy(dtype=np.int64, copy=True)
+        store.total = frame['総利用金額'].to_numpy(dtype=np.float64, copy=True)
+        store.maximum = frame['最大利用金額'].to_numpy(dtype=np.float64, copy=True)
+        store.last_seen = frame['last_seen'].to_numpy(dtype=np.int64, copy=True)
+        store.hours = frame[_HOUR_COLUMNS].to_numpy(dtype=np.int32, copy=True)
+        store.weekdays = frame[_WEEKDAY_COLUMNS].to_numpy(dtype=np.int32, copy=True)
+        seconds = table.column(_TXN_SECONDS_COLUMN).combine_chunks()
+        lengths = np.diff(seconds.offsets.to_numpy())
+        store.keys = (np.repeat(np.arange(len(lengths), dtype=np.int64), lengths) << 32) | seconds.flatten().to_numpy()
+        store.key_amounts = table.column(_TXN_AMOUNTS_COLUMN).combine_chunks().flatten().to_numpy(zero_copy_only=False).copy()
+        return store
+
+def customer_store_path(store_id):
+    if not _STORE_ID_PATTERN.match(store_id or ''):
+        raise ValueError(f"無効なストアIDです: {store_id}")
+    return os.path.join(CUSTOMER_STORE_DIR, f"{store_id}.parquet")
+
+def customer_store_lock(store_id):
+    with _store_locks_guard:
+        return _store_locks.setdefault(store_id, threading.Lock())
+
+def load_customer_store(store_id):
+    """保存済みのストアを読み込む（存在しなければ None）"""
+    if store_id in _loaded_stores:
+        return _loaded_stores[store_id]
+    path = customer_store_path(store_id)
+    if not os.path.exists(path):
+        return None
+    store = CustomerFeatureStore.load(path)
+    _loaded_stores[store_id] = store
+    return store
+
+def save_customer_store(store_id, store):
+    os.makedirs(CUSTOMER_STORE_DIR, exist_ok=True)
+    path = customer_store_path(store_id)
+    # 書き込み途中のファイルを読まないよう一時ファイル経由で置き換える
+    tmp_path = path + ".tmp"
+    store.save(tmp_path)
+    os.replace(tmp_path, path)
+    _loaded_stores[store_id] = store
+    logging.info(f"顧客特徴量ストア保存完了: {path}")
+
+def discard_customer_store(store_id):
+    """メモリキャッシュのストアを破棄する（更新が途中で失敗したとき、次回は保存済みのファイルから読み直す）"""
+    _loaded_stores.pop(store_id, None)
+
+def read_customer_features(store_id):
+    """保存済みストアのファイルからクラスタリング用の特徴量の列だけを読み込む（存在しなければ None）"""
+    path = customer_store_path(store_id)
+    if not os.path.exists(path):
+        return None
+    if pa is None:
+        raise RuntimeError("顧客特徴量ストアの読み込みには pyarrow が必要です")
+    key_col = json.loads(pq.read_schema(path).metadata[_METADATA_KEY])["key_col"]
+    return pq.read_table(path, columns=[key_col] + FEATURE_COLUMNS).to_pandas()
@@ -0,0 +1,222 @@
+import numpy as np
+import pandas as pd
+import logging
+import re
+from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor
+from .pair_rules import RULE_COLUMNS, count_pairs
+
+# 複数店舗からなる antecedents / consequents を文字列にする際の区切り
+ITEMSET_SEPARATOR = ' & '
+# 店舗名に含まれる '&' と '\\' はバックスラッシュでエスケープする
+_ITEMSET_TOKEN = re.compile(r'\\(.)| & |(.)', re.DOTALL)
+
+# 1回のAND演算でまとめて処理する候補数の上限（メモリ使用量の調整用）
+_BLOCK_SIZE = 256
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(words):
+        """uint64 配列の最終軸ごとの立っているビット数"""
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def popcount(words):
+        """uint64 配列の最終軸ごとの立っているビット数"""
+        as_bytes = np.ascontiguousarray(words).view(np.uint8)
+        return _POPCOUNT_TABLE[as_bytes].sum(axis=-1, dtype=np.int64)
+
+def pack_bitmaps(X):
+    """
+    カード×店舗の接続行列を店舗ごとの顧客ビットマップ（uint64, 店舗数×ワード数）に変換
+    """
+    Xc = X.tocsc()
+    n_cards, n_shops = Xc.shape
+    n_words = max((n_cards + 63) // 64, 1)
+    shop_idx = np.repeat(np.arange(n_shops, dtype=np.int64), np.diff(Xc.indptr))
+    cards = Xc.indices.astype(np.int64)
+    flat = np.zeros(n_shops * n_words, dtype=np.uint64)
+    bits = np.left_shift(np.uint64(1), (cards & 63).astype(np.uint64))
+    np.bitwise_or.at(flat, shop_idx * n_words + (cards >> 6), bits)
+    return flat.reshape(n_shops, n_words)
+
+def count_extensions(bitmaps, base, extensions):
+    """
+    base の店舗集合に extensions の各店舗を1つずつ加えた集合の顧客数を数える
+    base のビットマップは1回だけ作成し、extensions とはまとめて AND + popcount する
+    """
+    base_bitmap = np.bitwise_and.reduce(bitmaps[list(base)], axis=0)
+    counts = np.empty(len(extensions), dtype=np.int64)
+    for start in range(0, len(extensions), _BLOCK_SIZE):
+        block = extensions[start:start + _BLOCK_SIZE]
+        counts[start:start + _BLOCK_SIZE] = popcount(bitmaps[block] & base_bitmap)
+    return counts
+
+_worker_bitmaps = None
+
+def _init_worker(bitmaps):
+    global _worker_bitmaps
+    _worker_bitmaps = bitmaps
+
+def _count_task_batch(tasks):
+    return [count_extensions(_worker_bitmaps, base, extensions) for base, extensions in tasks]
+
+def generate_candidates(level):
+    """
+    (k-1)店舗の頻出集合から k店舗の候補を作成（接頭辞が同じ集合同士を結合し、Aprioriで枝刈り）
+    戻り値: [(base, extensions), ...]  base は (k-1)店舗のタプル、extensions は追加する店舗の配列
+    """
+    frequent = set(level)
+    groups = {}
+    for itemset in sorted(level):
+        groups.setdefault(itemset[:-1], []).append(itemset[-1])
+
+    tasks = []
+    for prefix, lasts in groups.items():
+        for i, a in enumerate(lasts):
+            base = prefix + (a,)
+            extensions = []
+            for b in lasts[i + 1:]:
+                candidate = base + (b,)
+                # 部分集合がすべて頻出でない候補は除外
+                if all(candidate[:j] + candidate[j + 1:] in frequent for j in range(len(candidate) - 2)):
+                    extensions.append(b)
+            if extensions:
+                tasks.append((base, np.array(extensions, dtype=np.int64)))
+    return tasks
+
+def _count_tasks(bitmaps, tasks, n_jobs):
+    if n_jobs <= 1 or len(tasks) < 2:
+        return [count_extensions(bitmaps, base, extensions) for base, extensions in tasks]
+    # 接頭辞ごとのタスクをワーカーに分割
+    n_batches = min(len(tasks), n_jobs * 4)
+    batches = [tasks[i::n_batches] for i in range(n_batches)]
+    results = [None] * len(tasks)
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(bitmaps,)) as executor:
+        for i, batch_counts in enumerate(executor.map(_count_task_batch, batches)):
+            results[i::n_batches] = batch_counts
+    return results
+
+def mine_frequent_itemsets(X, min_support=0.0001, max_len=3, n_jobs=1):
+    """
+    カード×店舗の接続行列から max_len 店舗までの頻出集合を求める
+    2店舗までは Xᵀ·X、3店舗以上はビットマップの AND + popcount で支持度を数える
+    戻り値: ({店舗コードのタプル: 顧客数}, トランザクション数)
+    """
+    n_transactions = int((X.getnnz(axis=1) > 0).sum())
+    if n_transactions == 0:
+        return {}, 0
+
+    item_counts, pair_counts = count_pairs(X)
+    frequent = {}
+    for i in np.flatnonzero(item_counts / n_transactions >= min_support):
+        frequent[(int(i),)] = int(item_counts[i])
+    if max_len < 2:
+        return frequent, n_transactions
+
+    keep = pair_counts.data / n_transactions >= min_support
+    level = {
+        (int(a), int(b)): int(c)
+        for a, b, c in zip(pair_counts.row[keep], pair_counts.col[keep], pair_counts.data[keep])
+    }
+    frequent.update(level)
+    logging.info(f"頻出集合（2店舗）: {len(level)} 件")
+
+    bitmaps = pack_bitmaps(X) if max_len >= 3 and level else None
+    for k in range(3, max_len + 1):
+        tasks = generate_candidates(level)
+        if not tasks:
+            break
+        counts = _count_tasks(bitmaps, tasks, n_jobs)
+        level = {}
+        for (base, extensions), c in zip(tasks, counts):
+            ok = c / n_transactions >= min_support
+            for e, n in zip(extensions[ok], c[ok]):
+                level[base + (int(e),)] = int(n)
+        logging.info(f"頻出集合（{k}店舗）: 候補 {sum(len(e) for _, e in tasks)} 件, 頻出 {len(level)} 件")
+        if not level:
+            break
+        frequent.update(level)
+    return frequent, n_transactions
+
+def join_itemset(names):
+    """
+    店舗名の集合を文字列にする（名前順に並べ、複数店舗の場合は店舗名中の '&' をエスケープして連結）
+    1店舗の集合は店舗名のまま返す
+    """
+    names = sorted(str(n) for n in names)
+    if len(names) == 1:
+        return names[0]
+    return ITEMSET_SEPARATOR.join(n.replace('\\', '\\\\').replace('&', '\\&') for n in names)
+
+def split_itemset(label):
+    """
+    join_itemset で作成した複数店舗の文字列を店舗名のリストに戻す
+    """
+    names, current = [], []
+    for match in _ITEMSET_TOKEN.finditer(label):
+        escaped, char = match.groups()
+        if escaped is None and char is None:
+            names.append(''.join(current))
+            current = []
+        else:
+            current.append(escaped if escaped is not None else char)
+    names.append(''.join(current))
+    return names
+
+def itemset_rules_from_counts(frequent, n_transactions, item_names, min_lift=1.0):
+    """
+    頻出集合から全ての antecedents → consequents の分割についてルールを作成
+    店舗集合は join_itemset で文字列にする
+    """
+    ante_list, cons_list, counts = [], [], []
+    for itemset, count in frequent.items():
+        if len(itemset) < 2:
+            continue
+        for r in range(1, len(itemset)):
+            for ante in combinations(itemset, r):
+                ante_list.append(ante)
+                cons_list.append(tuple(i for i in itemset if i not in ante))
+                counts.append(count)
+
+    columns = RULE_COLUMNS + ['antecedent_len', 'consequent_len']
+    if not counts:
+        return pd.DataFrame(columns=columns)
+
+    counts = np.asarray(counts, dtype=np.float64)
+    ante_counts = np.array([frequent[a] for a in ante_list], dtype=np.float64)
+    cons_counts = np.array([frequent[c] for c in cons_list], dtype=np.float64)
+    # lift >= min_lift は件数で判定する（lift = 1 付近の丸め誤差を避ける）
+    keep = counts * n_transactions >= min_lift * ante_counts * cons_counts
+
+    support = counts / n_transactions
+    ante_support = ante_counts / n_transactions
+    cons_support = cons_counts / n_transactions
+    confidence = support / ante_support
+    lift = support / (ante_support * cons_support)
+    leverage = support - ante_support * cons_support
+    with np.errstate(divide='ignore'):
+        conviction = np.where(confidence < 1, (1 - cons_support) / (1 - confidence), np.inf)
+
+    names = [str(n) for n in item_names]
+    rules = pd.DataFrame({
+        'antecedents': [join_itemset(names[i] for i in a) for a in ante_list],
+        'consequents': [join_itemset(names[i] for i in c) for c in cons_list],
+        'antecedent support': ante_support,
+        'consequent support': cons_support,
+        'support': support,
+        'confidence': confidence,
+        'lift': lift,
+        'leverage': leverage,
+        'conviction': conviction,
+        'antecedent_len': [len(a) for a in ante_list],
+        'consequent_len': [len(c) for c in cons_list]
+    }, columns=columns)
+    return rules[keep].reset_index(drop=True)
+
+def mine_itemset_rules(X, item_names, min_support=0.0001, max_len=3, n_jobs=1):
+    """
+    接続行列から max_len 店舗までのアソシエーションルールを計算
+    """
+    frequent, n_transactions = mine_frequent_itemsets(X, min_support=min_support, max_len=max_len, n_jobs=n_jobs)
+    return itemset_rules_from_counts(frequent, n_transactions, item_names)
@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# アソシエーションルールの出力列（mlxtend の association_rules と同じ並び）
+RULE_COLUMNS = [
+    'antecedents',
+    'consequents',
+    'antecedent support',
+    'consequent support',
+    'support',
+    'confidence',
+    'lift',
+    'leverage',
+    'conviction'
+]
+
+def encode_pos_columns(df, card_col='カード番号', shop_col='ショップ名略称'):
+    """
+    カード番号・店舗名を整数コードに変換する
+    欠損値のコードは -1
+    """
+    cards = pd.Categorical(df[card_col])
+    shops = pd.Categorical(df[shop_col])
+    shop_names = [str(s) for s in shops.categories]
+    return cards.codes, shops.codes, len(cards.categories), shop_names
+
+def build_incidence_matrix(card_codes, shop_codes, n_cards, n_shops):
+    """
+    カード×店舗の0/1接続行列（CSR）を作成
+    同じカード・店舗の組が複数あっても1として扱う
+    """
+    card_codes = np.asarray(card_codes)
+    shop_codes = np.asarray(shop_codes)
+    valid = (card_codes >= 0) & (shop_codes >= 0)
+    data = np.ones(int(valid.sum()), dtype=np.int32)
+    X = sparse.csr_matrix(
+        (data, (card_codes[valid], shop_codes[valid])),
+        shape=(n_cards, n_shops)
+    )
+    X.data[:] = 1
+    return X
+
+def count_pairs(X):
+    """
+    Xᵀ·X の1回の積で店舗ごとの顧客数と店舗ペアの共起顧客数を計算
+    戻り値: (店舗ごとの顧客数, 上三角の共起数 COO 行列)
+    """
+    co = (X.T @ X).tocsr()
+    item_counts = np.asarray(co.diagonal()).astype(np.int64)
+    pair_counts = sparse.triu(co, k=1).tocoo()
+    return item_counts, pair_counts
+
+def binary_rows(counts, rows):
+    """件数行列から指定行を取り出して0/1にする"""
+    sub = counts[rows].astype(np.int64)
+    sub.data[:] = 1
+    return sub
+
+def pair_count_delta(old_rows, new_rows):
+    """
+    一部のカードの行が old_rows から new_rows（どちらも0/1接続行列）に変わったときの
+    店舗ごとの顧客数・上三角の共起数・トランザクション数の差分を計算
+    """
+    item_delta = np.asarray(new_rows.sum(axis=0)).ravel() - np.asarray(old_rows.sum(axis=0)).ravel()
+    pair_delta = sparse.triu(new_rows.T @ new_rows - old_rows.T @ old_rows, k=1)
+    n_delta = int((new_rows.getnnz(axis=1) > 0).sum()) - int((old_rows.getnnz(axis=1) > 0).sum())
+    return item_delta, pair_delta, n_delta
+
+def pair_rules_from_counts(item_counts, pair_counts, n_transactions, item_names, min_support=0.0001, min_lift=1.0):
+    """
+    共起カウントから support / confidence / lift をベクトル演算で計算
+    頻出ペアごとに A→B と B→A の両方向のルールを生成する
+    pair_counts は店舗×店舗の疎行列（上三角または対称）
+    """
+    if n_transactions == 0:
+        return pd.DataFrame(columns=RULE_COLUMNS)
+
+    pairs = sparse.triu(sparse.coo_matrix(pair_counts), k=1).tocoo()
+    item_counts = np.asarray(item_counts, dtype=np.float64)
+    pair_count = pairs.data.astype(np.float64)
+
+    # min_support を満たすペアだけ残す
+    keep = pair_count / n_transactions >= min_support
+    rows = pairs.row[keep]
+    cols = pairs.col[keep]
+    pair_count = pair_count[keep]
+
+    # lift >= min_lift は件数で判定する（lift = 1 付近の丸め誤差を避ける）
+    keep = pair_count * n_transactions >= min_lift * item_counts[rows] * item_counts[cols]
+    rows, cols, pair_count = rows[keep], cols[keep], pair_count[keep]
+
+    # 両方向のルールを並べる
+    ante = np.concatenate([rows, cols])
+    cons = np.concatenate([cols, rows])
+    support = np.concatenate([pair_count, pair_count]) / n_transactions
+    ante_support = item_counts[ante] / n_transactions
+    cons_support = item_counts[cons] / n_transactions
+
+    confidence = support / ante_support
+    lift = support / (ante_support * cons_support)
+
+    leverage = support - ante_support * cons_support
+    with np.errstate(divide='ignore'):
+        conviction = np.where(confidence < 1, (1 - cons_support) / (1 - confidence), np.inf)
+
+    names = np.asarray(item_names, dtype=object)
+    return pd.DataFrame({
+        'antecedents': names[ante],
+        'consequents': names[cons],
+        'antecedent support': ante_support,
+        'consequent support': cons_support,
+        'support': support,
+        'confidence': confidence,
+        'lift': lift,
+        'leverage': leverage,
+        'conviction': conviction
+    }, columns=RULE_COLUMNS)
+
+def build_pos_incidence(df):
+    """
+    POSデータからカード×店舗の接続行列と店舗名リストを作成
+    """
+    card_codes, shop_codes, n_cards, shop_names = encode_pos_columns(df)
+    X = build_incidence_matrix(card_codes, shop_codes, n_cards, len(shop_names))
+    return X, shop_names
+
+def pair_rules_from_incidence(X, shop_names, min_support=0.0001):
+    """
+    接続行列から2店舗間のアソシエーションルールを計算
+    """
+    n_transactions = int((X.getnnz(axis=1) > 0).sum())
+    item_counts, pair_counts = count_pairs(X)
+    return pair_rules_from_counts(item_counts, pair_counts, n_transactions, shop_names, min_support=min_support)
+
+def calc_pair_rules(df, min_support=0.0001):
+    """
+    重複削除済みのPOSデータから2店舗間のアソシエーションルールを計算
+    （apriori + association_rules の max_len=2 と同じ結果）
+    """
+    X, shop_names = build_pos_incidence(df)
+    return pair_rules_from_incidence(X, shop_names, min_support=min_support)
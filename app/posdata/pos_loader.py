@@ -0,0 +1,111 @@
+import logging
+import numpy as np
+import pandas as pd
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+    pa_csv = None
+
+# 辞書エンコード（category）で保持するID・店舗・分類の列
+CATEGORY_COLUMNS = ['カード番号', '会員番号', 'ショップ名略称', 'テナント名', 'カテゴリ']
+
+# 読み込み時に1回だけ解析する日時列
+DATETIME_COLUMNS = ['利用日時', '利用日']
+
+AMOUNT_COLUMN = '利用金額'
+
+_INT32_MIN, _INT32_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+
+def is_csv_file(filename):
+    return bool(filename and isinstance(filename, str) and filename.endswith(".csv"))
+
+def read_pos_header(file_path, filename):
+    """列名だけを読み込む（データ行は読まない）"""
+    if is_csv_file(filename):
+        return list(pd.read_csv(file_path, nrows=0).columns)
+    return list(pd.read_excel(file_path, nrows=0).columns)
+
+def read_pos_preview(file_path, filename, nrows=20):
+    """プレビュー用に先頭行だけを読み込む"""
+    if is_csv_file(filename):
+        return pd.read_csv(file_path, nrows=nrows)
+    return pd.read_excel(file_path, nrows=nrows)
+
+def _read_csv_arrow(file_path, usecols=None):
+    """pyarrow のマルチスレッドCSVリーダーで読み込み、ID・店舗列は辞書型のまま category にする"""
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    column_types = {col: dictionary for col in CATEGORY_COLUMNS}
+    # 日時は書式が混在しても pandas と同じ解釈になるよう文字列で受け取る
+    column_types.update({col: pa.string() for col in DATETIME_COLUMNS})
+    convert_options = pa_csv.ConvertOptions(
+        column_types=column_types,
+        include_columns=list(usecols) if usecols else None
+    )
+    table = pa_csv.read_csv(
+        file_path,
+        read_options=pa_csv.ReadOptions(use_threads=True),
+        convert_options=convert_options
+    )
+    return table.to_pandas()
+
+def _read_csv_pandas(file_path, usecols=None):
+    dtype = {col: 'category' for col in CATEGORY_COLUMNS}
+    return pd.read_csv(file_path, usecols=usecols, dtype=dtype)
+
+def ensure_datetime(values):
+    """解析済みの日時列はそのまま返し、未解析の場合だけ変換する"""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    return pd.to_datetime(values, errors='coerce')
+
+def downcast_amount(values):
+    """利用金額を数値化し、欠損がなく int32 に収まる整数なら int32 にする"""
+    amount = pd.to_numeric(values, errors='coerce')
+    if amount.isna().any():
+        return amount.astype(np.float64)
+    if len(amount) == 0:
+        return amount.astype(np.int32)
+    if np.array_equal(amount, np.floor(amount)) and amount.min() >= _INT32_MIN and amount.max() <= _INT32_MAX:
+        return amount.astype(np.int32)
+    return amount
+
+def normalize_pos_frame(df):
+    """
+    POSデータの列の型を揃える
+    - ID・店舗・カテゴリ列: category
+    - 利用日時・利用日: datetime64（ここで1回だけ解析）
+    - 利用金額: int32（欠損や小数を含む場合は float64）
+    """
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            values = df[col]
+            df[col] = values.where(values.isna(), values.astype(str)).astype('category')
+    for col in DATETIME_COLUMNS:
+        if col in df.columns:
+            df[col] = ensure_datetime(df[col])
+    if AMOUNT_COLUMN in df.columns:
+        df[AMOUNT_COLUMN] = downcast_amount(df[AMOUNT_COLUMN])
+    return df
+
+def load_pos_frame(file_path, filename, usecols=None):
+    """
+    POSデータを型付きで読み込む
+    アソシエーション分析・顧客集計・テナント指標はこの DataFrame を共有し、再変換しない
+    """
+    if is_csv_file(filename):
+        if pa_csv is not None:
+            try:
+                df = _read_csv_arrow(file_path, usecols=usecols)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+                logging.warning(f"pyarrowでの読み込みに失敗したためpandasで再読み込みします: {e}")
+                df = _read_csv_pandas(file_path, usecols=usecols)
+        else:
+            df = _read_csv_pandas(file_path, usecols=usecols)
+    else:
+        dtype = {col: str for col in CATEGORY_COLUMNS}
+        df = pd.read_excel(file_path, usecols=usecols, dtype=dtype)
+    df = normalize_pos_frame(df)
+    logging.info(f"POSデータ読み込み完了: {len(df)} 行, {len(df.columns)} 列")
+    return df
@@ -2,7 +2,10 @@ import pandas as pd
 import numpy as np
 import os
 import networkx as nx
-from mlxtend.frequent_patterns import apriori, association_rules
+from .pair_rules import build_pos_incidence, pair_rules_from_incidence
+from .itemset_miner import mine_itemset_rules, split_itemset
+from .windowed_rules import windowed_pair_rules
+from .segmented_rules import segmented_pair_rules
 import logging
 from concurrent.futures import ThreadPoolExecutor
 import multiprocessing
@@ -59,94 +62,83 @@ def llm_column_mapping(column_names):
         logging.error(f"列名マッピングのパースエラー: {e}\n返答: {response.content}")
         return {}
 
-def calc_asociation(df, min_support=0.0001, max_len=2):
+def drop_duplicate_purchases(df):
+    """
+    同じカード・同じ利用日時の購買は利用金額が最大の1件だけ残す
+    """
+    logging.info("重複データ削除開始")
+    df_sorted = df.sort_values(
+        by=['カード番号', '利用日時', '利用金額'],
+        ascending=[True, True, False]
+    )
+    df_unique = df_sorted.drop_duplicates(
+        subset=['カード番号', '利用日時'],
+        keep='first'
+    )
+    logging.info(f"重複削除後: {len(df_unique)} レコード")
+    return df_unique
+
+# アソシエーション分析結果が空の場合の列
+EMPTY_RULES_COLUMNS = ['antecedents', 'consequents', 'lift', 'support', 'confidence', 'antecedent_revenue', 'consequent_revenue', 'total_revenue']
+
+def calc_asociation(df, min_support=0.0001, max_len=2, n_jobs=1):
     """
     POSデータからアソシエーション分析を実行
     高速化のため、データ処理を最適化
+    n_jobs: 3店舗以上の頻出集合探索で使うプロセス数
     """
     try:
         logging.info("アソシエーション分析開始")
         logging.info(f"入力データ: {len(df)} 行, {len(df.columns)} 列")
 
         # 1) 購買重複データの削除（高速化）
-        logging.info("重複データ削除開始")
-        df_sorted = df.sort_values(
-            by=['カード番号', '利用日時', '利用金額'],
-            ascending=[True, True, False]
-        )
-        df_unique = df_sorted.drop_duplicates(
-            subset=['カード番号', '利用日時'],
-            keep='first'
-        )
-        logging.info(f"重複削除後: {len(df_unique)} レコード")
+        df_unique = drop_duplicate_purchases(df)
 
         # 2) 店舗ごとの利用金額合計を計算
         logging.info("店舗ごとの利用金額合計計算開始")
-        shop_revenue = df_unique.groupby('ショップ名略称')['利用金額'].sum().reset_index()
+        shop_revenue = df_unique.groupby('ショップ名略称', observed=True)['利用金額'].sum().reset_index()
         shop_revenue_dict = dict(zip(shop_revenue['ショップ名略称'], shop_revenue['利用金額']))
 
-        # 3) Pivotテーブル作成（メモリ効率化）
-        logging.info("ピボットテーブル作成開始")
-        # 事前にデータ型を最適化
-        df_unique['カード番号'] = df_unique['カード番号'].astype('category')
-        df_unique['ショップ名略称'] = df_unique['ショップ名略称'].astype('category')
-
-        # グループ化とピボット作成
-        temp = df_unique.groupby(['カード番号', 'ショップ名略称']).size().reset_index(name='購入数')
-        pivot = temp.pivot(index='カード番号', columns='ショップ名略称', values='購入数').fillna(0)
+        # 3) アソシエーション分析
+        logging.info("アソシエーション分析実行開始")
+        X, shop_names = build_pos_incidence(df_unique)
+        logging.info(f"接続行列作成完了: {X.shape}, 非ゼロ要素 {X.nnz}")
+        if max_len == 2:
+            # 2店舗間のルールは疎行列の Xᵀ·X で一括計算
+            rules = pair_rules_from_incidence(X, shop_names, min_support=min_support)
+        else:
+            # 3店舗以上はビットマップの AND + popcount で頻出集合を探索
+            rules = mine_itemset_rules(X, shop_names, min_support=min_support, max_len=max_len, n_jobs=n_jobs)
 
-        # 購入の有無を True/False に変換
-        basket = (pivot > 0).astype(bool)
+        if len(rules) == 0:
+            logging.warning("頻出アイテムセットが見つかりませんでした")
+            return pd.DataFrame(columns=EMPTY_RULES_COLUMNS)
 
-        # 空の列を削除
-        basket = basket.loc[:, basket.sum() > 0]
+        # 4) 店舗ごとの利用金額を追加
+        rules = attach_shop_revenue(rules, shop_revenue_dict)
 
-        logging.info(f"ピボットテーブル作成完了: {basket.shape}")
+        logging.info(f"アソシエーション分析完了: {len(rules)} ルール")
+        return rules
 
-        # 4) アソシエーション分析（並列処理対応）
-        logging.info("アソシエーション分析実行開始")
-        freq_item = apriori(
-            basket,
-            min_support=min_support,
-            use_colnames=True,
-            max_len=max_len,
-            low_memory=True
-        )
+    except Exception as e:
+        logging.error(f"アソシエーション分析エラー: {str(e)}")
+        import traceback
+        logging.error(f"スタックトレース: {traceback.format_exc()}")
+        # 空DataFrameで返す（必ず必要な列を持つ）
+        return pd.DataFrame(columns=EMPTY_RULES_COLUMNS)
 
-        if len(freq_item) == 0:
+def calc_asociation_streaming(accumulator, min_support=0.0001, max_len=2, n_jobs=1):
+    """
+    チャンク読み込みで集計済みの AssociationAccumulator からアソシエーション分析を実行
+    """
+    try:
+        logging.info(f"アソシエーション分析開始（ストリーミング）: {accumulator.n_rows} 行, 重複削除後 {accumulator.n_unique} 件")
+        rules = accumulator.to_rules(min_support=min_support, max_len=max_len, n_jobs=n_jobs)
+        if len(rules) == 0:
             logging.warning("頻出アイテムセットが見つかりませんでした")
-            return pd.DataFrame(columns=['antecedents', 'consequents', 'lift', 'support', 'confidence', 'antecedent_revenue', 'consequent_revenue', 'total_revenue'])
-
-        logging.info(f"頻出アイテムセット: {len(freq_item)} 件")
-
-        rules = association_rules(
-            freq_item,
-            metric='lift',
-            min_threshold=1,
-            num_itemsets=min(freq_item.shape[0], 1000)  # 最大1000件に制限
-        ).reset_index(drop=True)
-
-        # 5) antecedents/consequents を文字列に変換
-        logging.info("ルール形式変換開始")
-        for i in range(len(rules)):
-            if isinstance(rules.at[i, 'antecedents'], (list, set, frozenset)):
-                rules.at[i, 'antecedents'] = list(rules.at[i, 'antecedents'])[0]
-            if isinstance(rules.at[i, 'consequents'], (list, set, frozenset)):
-                rules.at[i, 'consequents'] = list(rules.at[i, 'consequents'])[0]
-        # 文字列型に変換
-        rules['antecedents'] = rules['antecedents'].astype(str)
-        rules['consequents'] = rules['consequents'].astype(str)
-
-        # 6) 店舗ごとの利用金額を追加
-        logging.info("店舗利用金額情報追加開始")
-        rules['antecedent_revenue'] = rules['antecedents'].map(shop_revenue_dict).fillna(0)
-        rules['consequent_revenue'] = rules['consequents'].map(shop_revenue_dict).fillna(0)
-        rules['total_revenue'] = rules['antecedent_revenue'] + rules['consequent_revenue']
-
-        # lift列がなければ追加
-        if 'lift' not in rules.columns:
-            rules['lift'] = np.nan
+            return pd.DataFrame(columns=EMPTY_RULES_COLUMNS)
 
+        rules = attach_shop_revenue(rules, accumulator.shop_revenue_dict())
         logging.info(f"アソシエーション分析完了: {len(rules)} ルール")
         return rules
 
@@ -154,8 +146,95 @@ def calc_asociation(df, min_support=0.0001, max_len=2):
         logging.error(f"アソシエーション分析エラー: {str(e)}")
         import traceback
         logging.error(f"スタックトレース: {traceback.format_exc()}")
-        # 空DataFrameで返す（必ず必要な列を持つ）
-        return pd.DataFrame(columns=['antecedents', 'consequents', 'lift', 'support', 'confidence', 'antecedent_revenue', 'consequent_revenue', 'total_revenue'])
+        return pd.DataFrame(columns=EMPTY_RULES_COLUMNS)
+
+def calc_windowed_asociation(df, window_days=7, stride_days=1, min_support=0.0001):
+    """
+    利用日時のスライディングウィンドウ（例: 7日幅・1日ずつ）ごとにアソシエーション分析を実行
+    日単位で共起数を足し引きするため、ファイルの読み込み・重複削除は1回だけ
+    戻り値: [{'window_start': 開始日, 'window_end': 最終日, 'rules': ルール}, ...]
+    """
+    try:
+        logging.info(f"ウィンドウ別アソシエーション分析開始: {window_days}日幅, {stride_days}日ずつ")
+        df_unique = drop_duplicate_purchases(df)
+        windows = []
+        for window_start, window_end, rules, shop_revenue_dict in windowed_pair_rules(
+            df_unique, window_days=window_days, stride_days=stride_days, min_support=min_support
+        ):
+            if len(rules) == 0:
+                rules = pd.DataFrame(columns=EMPTY_RULES_COLUMNS)
+            else:
+                rules = attach_shop_revenue(rules, shop_revenue_dict)
+            windows.append({
+                'window_start': window_start,
+                'window_end': window_end,
+                'rules': rules
+            })
+        logging.info(f"ウィンドウ別アソシエーション分析完了: {len(windows)} ウィンドウ")
+        return windows
+
+    except Exception as e:
+        logging.error(f"ウィンドウ別アソシエーション分析エラー: {str(e)}")
+        raise
+
+def calc_segmented_asociation(df, segment_col, min_support=0.0001, n_jobs=1):
+    """
+    セグメント列（クラスタ、カテゴリ、曜日、年代など）の値ごとにアソシエーション分析を実行
+    戻り値: {セグメント名: ルール}
+    """
+    try:
+        logging.info(f"セグメント別アソシエーション分析開始: {segment_col}")
+        df_unique = drop_duplicate_purchases(df)
+        results = {}
+        for segment, (rules, shop_revenue_dict) in segmented_pair_rules(
+            df_unique, segment_col, min_support=min_support, n_jobs=n_jobs
+        ).items():
+            if len(rules) == 0:
+                results[segment] = pd.DataFrame(columns=EMPTY_RULES_COLUMNS)
+            else:
+                results[segment] = attach_shop_revenue(rules, shop_revenue_dict)
+        logging.info(f"セグメント別アソシエーション分析完了: {len(results)} セグメント")
+        return results
+
+    except Exception as e:
+        logging.error(f"セグメント別アソシエーション分析エラー: {str(e)}")
+        raise
+
+def attach_shop_revenue(rules, shop_revenue_dict):
+    """
+    ルールに店舗ごとの利用金額（antecedent_revenue, consequent_revenue, total_revenue）を追加
+    """
+    logging.info("店舗利用金額情報追加開始")
+    shop_revenue_dict = {str(k): v for k, v in shop_revenue_dict.items()}
+
+    def itemset_revenue(itemsets, length_col):
+        revenue = itemsets.map(shop_revenue_dict)
+        # 複数店舗の集合は各店舗の利用金額の合計
+        if length_col in rules.columns:
+            multi = rules[length_col] > 1
+            if multi.any():
+                revenue[multi] = itemsets[multi].map(
+                    lambda x: sum(shop_revenue_dict.get(shop, 0) for shop in split_itemset(x))
+                )
+        return revenue.fillna(0)
+
+    rules['antecedent_revenue'] = itemset_revenue(rules['antecedents'], 'antecedent_len')
+    rules['consequent_revenue'] = itemset_revenue(rules['consequents'], 'consequent_len')
+    rules['total_revenue'] = rules['antecedent_revenue'] + rules['consequent_revenue']
+
+    # lift列がなければ追加
+    if 'lift' not in rules.columns:
+        rules['lift'] = np.nan
+    return rules
+
+def pairwise_rules(rules):
+    """
+    1店舗 → 1店舗のルールだけを取り出す（ネットワーク作成用）
+    """
+    if 'antecedent_len' not in rules.columns or 'consequent_len' not in rules.columns:
+        return rules
+    mask = (rules['antecedent_len'] == 1) & (rules['consequent_len'] == 1)
+    return rules[mask].reset_index(drop=True)
 
 def build_node_edge_df(rules, mall_name, full_tenant_list=None):
     """
@@ -232,8 +311,8 @@ def process_pos_data_background(df, min_support=0.0001, max_len=2):
         # アソシエーション分析
         rules = calc_asociation(df, min_support=min_support, max_len=max_len)
 
-        # ノード・エッジデータ作成
-        node_df, edge_df = build_node_edge_df(rules, "mall_name")
+        # ノード・エッジデータ作成（1店舗 → 1店舗のルールのみ）
+        node_df, edge_df = build_node_edge_df(pairwise_rules(rules), "mall_name")
 
         return {
             'rules': rules,
@@ -0,0 +1,302 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+import logging
+from .pair_rules import pair_rules_from_incidence
+from .itemset_miner import mine_itemset_rules
+from .pos_loader import CATEGORY_COLUMNS
+
+# チャンク読み込みのデフォルト行数
+DEFAULT_CHUNKSIZE = 200000
+
+# (カード, 利用日時) キーの下位32bitに入れる秒数のマスク
+_TS_MASK = np.int64(0xFFFFFFFF)
+
+class CategoryEncoder:
+    """
+    チャンクをまたいで値→整数コードの対応を保持する
+    欠損値のコードは -1
+    """
+    def __init__(self):
+        self.index = pd.Index([], dtype=object)
+
+    def encode(self, values):
+        values = pd.Index(values, dtype=object)
+        codes = self.index.get_indexer(values)
+        missing = (codes < 0) & ~values.isna()
+        if missing.any():
+            self.index = self.index.append(pd.Index(pd.unique(values[missing]), dtype=object))
+            codes = self.index.get_indexer(values)
+        return codes.astype(np.int32)
+
+    @property
+    def names(self):
+        return [str(v) for v in self.index]
+
+    def __len__(self):
+        return len(self.index)
+
+def to_epoch_seconds(values):
+    """
+    日時列をUNIX秒（int64）に変換する
+    戻り値: (秒, 変換できたかどうか)。変換できない値の秒は0
+    """
+    ts = pd.to_datetime(values, errors='coerce')
+    valid = ~np.asarray(pd.isna(ts))
+    seconds = np.asarray(ts.values.astype('datetime64[s]').astype(np.int64))
+    return np.where(valid, seconds, 0), valid
+
+def _grow(arr, size, fill=0):
+    """配列を size まで伸ばす"""
+    if len(arr) >= size:
+        return arr
+    return np.concatenate([arr, np.full(size - len(arr), fill, dtype=arr.dtype)])
+
+class AssociationAccumulator:
+    """
+    アソシエーション分析用の集計をチャンク単位で更新する
+    - (カード番号, 利用日時) ごとに利用金額が最大の1件を残す重複削除状態
+    - カード×店舗の購買件数（疎行列）
+    - 店舗ごとの利用金額合計
+    """
+    def __init__(self):
+        self.cards = CategoryEncoder()
+        self.shops = CategoryEncoder()
+        # 重複削除状態（キー昇順）
+        self.keys = np.empty(0, dtype=np.int64)
+        self.key_amounts = np.empty(0, dtype=np.float64)
+        self.key_shops = np.empty(0, dtype=np.int32)
+        self.card_shop = sparse.csr_matrix((0, 0), dtype=np.int32)
+        self.shop_revenue = np.zeros(0, dtype=np.float64)
+        self.n_rows = 0
+
+    def add_chunk(self, chunk, timestamps=None):
+        """
+        POSデータのチャンク（カード番号・利用日時・利用金額・ショップ名略称）を取り込む
+        timestamps: 利用日時の to_epoch_seconds の戻り値（変換済みなら渡す）
+        戻り値: (新規キー数, 置き換えたキー数)
+        """
+        self.n_rows += len(chunk)
+        card = self.cards.encode(chunk['カード番号'])
+        shop = self.shops.encode(chunk['ショップ名略称'])
+        amount = pd.to_numeric(chunk['利用金額'], errors='coerce').to_numpy(dtype=np.float64)
+        seconds, _ = timestamps if timestamps is not None else to_epoch_seconds(chunk['利用日時'])
+
+        valid = (card >= 0) & (shop >= 0)
+        card, shop, amount, seconds = card[valid], shop[valid], amount[valid], seconds[valid]
+        keys = (card.astype(np.int64) << 32) | (seconds & _TS_MASK)
+
+        # チャンク内の重複削除（キー昇順・利用金額降順で先頭を残す）
+        order = np.lexsort((-amount, keys))
+        keys, amount, shop = keys[order], amount[order], shop[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        keys, amount, shop = keys[first], amount[first], shop[first]
+        return self._merge(keys, amount, shop)
+
+    def _merge(self, keys, amount, shop):
+        """
+        チャンクの重複削除結果を既存の状態へマージし、件数・利用金額の差分を反映する
+        戻り値: (新規キー数, 置き換えたキー数)
+        """
+        n_cards, n_shops = len(self.cards), len(self.shops)
+        self.shop_revenue = _grow(self.shop_revenue, n_shops)
+
+        pos = np.searchsorted(self.keys, keys)
+        found = pos < len(self.keys)
+        found[found] = self.keys[pos[found]] == keys[found]
+
+        # 既存キー: 利用金額が大きい行が来たら置き換える
+        idx = pos[found]
+        new_amount, new_shop = amount[found], shop[found]
+        old_amount, old_shop = self.key_amounts[idx], self.key_shops[idx]
+        better = (new_amount > old_amount) | (np.isnan(old_amount) & ~np.isnan(new_amount))
+        idx, new_amount, new_shop = idx[better], new_amount[better], new_shop[better]
+        old_amount, old_shop = old_amount[better], old_shop[better]
+        replaced_cards = (self.keys[idx] >> 32).astype(np.int32)
+        self.key_amounts[idx] = new_amount
+        self.key_shops[idx] = new_shop
+
+        # 新規キー: 昇順を保ったまま挿入
+        ins = ~found
+        ins_keys, ins_amount, ins_shop = keys[ins], amount[ins], shop[ins]
+        self.keys = np.insert(self.keys, pos[ins], ins_keys)
+        self.key_amounts = np.insert(self.key_amounts, pos[ins], ins_amount)
+        self.key_shops = np.insert(self.key_shops, pos[ins], ins_shop)
+        ins_cards = (ins_keys >> 32).astype(np.int32)
+
+        # 店舗ごとの利用金額合計
+        self.shop_revenue -= np.bincount(old_shop, weights=np.nan_to_num(old_amount), minlength=n_shops)
+        self.shop_revenue += np.bincount(new_shop, weights=np.nan_to_num(new_amount), minlength=n_shops)
+        self.shop_revenue += np.bincount(ins_shop, weights=np.nan_to_num(ins_amount), minlength=n_shops)
+
+        # カード×店舗の購買件数
+        rows = np.concatenate([replaced_cards, replaced_cards, ins_cards])
+        cols = np.concatenate([old_shop, new_shop, ins_shop])
+        data = np.concatenate([
+            -np.ones(len(old_shop), dtype=np.int32),
+            np.ones(len(new_shop) + len(ins_shop), dtype=np.int32)
+        ])
+        delta = sparse.csr_matrix((data, (rows, cols)), shape=(n_cards, n_shops))
+        self.card_shop.resize((n_cards, n_shops))
+        self.card_shop = (self.card_shop + delta).tocsr()
+        self.card_shop.eliminate_zeros()
+        return len(ins_keys), len(idx)
+
+    @property
+    def n_unique(self):
+        """重複削除後の件数"""
+        return len(self.keys)
+
+    def incidence_matrix(self):
+        """カード×店舗の0/1接続行列"""
+        X = self.card_shop.copy()
+        X.data[:] = 1
+        return X
+
+    def shop_revenue_dict(self):
+        return dict(zip(self.shops.names, self.shop_revenue))
+
+    def to_rules(self, min_support=0.0001, max_len=2, n_jobs=1):
+        """集計済みの状態からアソシエーションルールを計算"""
+        X = self.incidence_matrix()
+        if max_len == 2:
+            return pair_rules_from_incidence(X, self.shops.names, min_support=min_support)
+        return mine_itemset_rules(X, self.shops.names, min_support=min_support, max_len=max_len, n_jobs=n_jobs)
+
+class PosSummaryAccumulator:
+    """
+    クラスタリング・レーダーチャート用の集計をチャンク単位で更新する（重複削除なし）
+    - 顧客ごとの利用回数・合計・最大・時間帯別件数
+    - テナントごとの売上・ユニーク客数・訪問日数
+    """
+    def __init__(self, tenant_col, date_col, member_col, category_col=None):
+        self.tenant_col = tenant_col
+        self.date_col = date_col
+        self.member_col = member_col
+        self.category_col = category_col
+        self.customers = CategoryEncoder()
+        self.tenants = CategoryEncoder()
+        self.members = CategoryEncoder()
+        self.customer_count = np.zeros(0, dtype=np.int64)
+        self.customer_sum = np.zeros(0, dtype=np.float64)
+        self.customer_max = np.zeros(0, dtype=np.float64)
+        self.customer_hours = np.zeros(0, dtype=np.int32)  # 顧客×24時間のフラット配列
+        self.tenant_sales = np.zeros(0, dtype=np.float64)
+        self.tenant_members = sparse.csr_matrix((0, 0), dtype=np.int32)
+        self.tenant_days = np.empty(0, dtype=np.int64)
+        self.categories = set()
+
+    def add_chunk(self, chunk, timestamps=None):
+        """timestamps: 利用日時の to_epoch_seconds の戻り値（変換済みなら渡す）"""
+        seconds, valid = timestamps if timestamps is not None else to_epoch_seconds(chunk['利用日時'])
+        amount = pd.to_numeric(chunk['利用金額'], errors='coerce').to_numpy(dtype=np.float64)
+        has_amount = ~np.isnan(amount)
+
+        # 顧客ごとの集計
+        cust = self.customers.encode(chunk['カード番号'])
+        n_cust = len(self.customers)
+        ok = cust >= 0
+        self.customer_count = _grow(self.customer_count, n_cust)
+        self.customer_sum = _grow(self.customer_sum, n_cust)
+        self.customer_max = _grow(self.customer_max, n_cust, fill=np.nan)
+        self.customer_count += np.bincount(cust[ok & has_amount], minlength=n_cust)
+        self.customer_sum += np.bincount(cust[ok], weights=np.nan_to_num(amount[ok]), minlength=n_cust)
+        chunk_max = pd.Series(amount[ok]).groupby(cust[ok]).max()
+        idx = chunk_max.index.to_numpy()
+        self.customer_max[idx] = np.fmax(self.customer_max[idx], chunk_max.to_numpy())
+        hours = (seconds // 3600) % 24
+        ok_hour = ok & valid
+        self.customer_hours = _grow(self.customer_hours, n_cust * 24)
+        self.customer_hours += np.bincount(
+            cust[ok_hour].astype(np.int64) * 24 + hours[ok_hour],
+            minlength=n_cust * 24
+        ).astype(np.int32)
+
+        # テナントごとの集計
+        tenant = self.tenants.encode(chunk[self.tenant_col])
+        member = self.members.encode(chunk[self.member_col])
+        n_tenant = len(self.tenants)
+        ok = tenant >= 0
+        self.tenant_sales = _grow(self.tenant_sales, n_tenant)
+        self.tenant_sales += np.bincount(tenant[ok], weights=np.nan_to_num(amount[ok]), minlength=n_tenant)
+        ok_member = ok & (member >= 0)
+        presence = sparse.csr_matrix(
+            (np.ones(int(ok_member.sum()), dtype=np.int32), (tenant[ok_member], member[ok_member])),
+            shape=(n_tenant, len(self.members))
+        )
+        self.tenant_members.resize(presence.shape)
+        self.tenant_members = (self.tenant_members + presence).tocsr()
+        self.tenant_members.data[:] = 1
+        if self.date_col == '利用日時':
+            day_seconds, day_valid = seconds, valid.copy()
+        else:
+            day_seconds, day_valid = to_epoch_seconds(chunk[self.date_col])
+        day_valid &= ok
+        day_keys = (tenant[day_valid].astype(np.int64) << 32) | (day_seconds[day_valid] & _TS_MASK)
+        self.tenant_days = np.union1d(self.tenant_days, day_keys)
+
+        if self.category_col and self.category_col in chunk.columns:
+            self.categories.update(chunk[self.category_col].dropna().unique().tolist())
+
+    def customer_data(self):
+        """顧客属性データ（background_auto_process_independent の customer_data と同じ列）"""
+        count = self.customer_count
+        hours = self.customer_hours.reshape(-1, 24)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, self.customer_sum / np.maximum(count, 1), np.nan)
+        return pd.DataFrame({
+            'カード番号': self.customers.index.to_numpy(),
+            '利用回数': count,
+            '総利用金額': self.customer_sum,
+            '平均利用金額': mean,
+            '最大利用金額': self.customer_max,
+            '最頻時間帯': hours.argmax(axis=1)
+        })
+
+    def tenant_metrics(self):
+        """テナントごとのユニーク客数・売上・訪問日数"""
+        n_tenant = len(self.tenants)
+        visit_days = np.bincount((self.tenant_days >> 32).astype(np.int64), minlength=n_tenant)
+        unique_customers = np.zeros(n_tenant, dtype=np.int64)
+        unique_customers[:self.tenant_members.shape[0]] = self.tenant_members.getnnz(axis=1)
+        return pd.DataFrame({
+            'ユニーク客数': unique_customers,
+            '売上': self.tenant_sales,
+            '訪問日数': visit_days
+        }, index=pd.Index(self.tenants.index, name=self.tenant_col))
+
+def read_pos_csv_chunks(file_path, chunksize=DEFAULT_CHUNKSIZE, usecols=None):
+    """POSデータのCSVをチャンク単位で読み込む（ID・店舗列は文字列として扱う）"""
+    dtype = {col: str for col in CATEGORY_COLUMNS}
+    return pd.read_csv(file_path, chunksize=chunksize, usecols=usecols, dtype=dtype)
+
+def stream_pos_file(file_path, chunksize=DEFAULT_CHUNKSIZE, category_col=None):
+    """
+    POSデータのCSVを1回だけチャンク読み込みし、
+    アソシエーション用とクラスタリング・レーダーチャート用の集計を同時に作成する
+    """
+    header = pd.read_csv(file_path, nrows=0).columns
+    tenant_col = next((c for c in ['テナント名', 'ショップ名略称'] if c in header), None)
+    date_col = next((c for c in ['利用日', '利用日時'] if c in header), None)
+    member_col = next((c for c in ['会員番号', 'カード番号'] if c in header), None)
+    if tenant_col is None:
+        raise ValueError('テナント名またはショップ名略称列が見つかりません')
+    if date_col is None:
+        raise ValueError('利用日または利用日時列が見つかりません')
+    if member_col is None:
+        raise ValueError('会員番号またはカード番号列が見つかりません')
+
+    usecols = {'カード番号', '利用日時', '利用金額', 'ショップ名略称', tenant_col, date_col, member_col}
+    if category_col and category_col in header:
+        usecols.add(category_col)
+
+    association = AssociationAccumulator()
+    summary = PosSummaryAccumulator(tenant_col, date_col, member_col, category_col=category_col)
+    for i, chunk in enumerate(read_pos_csv_chunks(file_path, chunksize=chunksize, usecols=list(usecols))):
+        # 利用日時の変換は1回だけ行い、両方の集計で使う
+        timestamps = to_epoch_seconds(chunk['利用日時'])
+        association.add_chunk(chunk, timestamps=timestamps)
+        summary.add_chunk(chunk, timestamps=timestamps)
+        logging.info(f"チャンク{i + 1}取り込み完了: 累計 {association.n_rows} 行, 重複削除後 {association.n_unique} 件")
+    return association, summary
@@ -0,0 +1,130 @@
+import os
+import json
+import stat
+import shutil
+import pickle
+import hashlib
+import tempfile
+import threading
+import logging
+
+# 自動処理結果のキャッシュ保存先と容量上限
+RESULT_CACHE_DIR = os.environ.get("POS_RESULT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "pos_result_cache"))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("POS_RESULT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# 結果の形式を変えたら更新する（古い形式のキャッシュを使わないため）
+RESULT_CACHE_VERSION = 3
+
+_RESULT_FILE = "result.pkl"
+
+_cache_lock = threading.Lock()
+
+def result_cache_key(file_bytes, column_mapping, params):
+    """ファイル内容・列名マッピング・処理パラメータのハッシュをキーにする"""
+    digest = hashlib.sha256()
+    digest.update(f"v{RESULT_CACHE_VERSION}\n".encode('utf-8'))
+    digest.update(json.dumps(column_mapping or {}, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    digest.update(json.dumps(params, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8'))
+    digest.update(file_bytes)
+    return digest.hexdigest()
+
+def _entry_dir(key):
+    return os.path.join(RESULT_CACHE_DIR, key)
+
+def _secure_cache_dir():
+    """
+    キャッシュディレクトリを所有者のみ読み書きできる権限（0700）で作成する
+    結果は pickle で読み込むため、他のユーザーが書き込めるディレクトリは使わない
+    """
+    try:
+        os.makedirs(RESULT_CACHE_DIR, mode=0o700, exist_ok=True)
+        st = os.lstat(RESULT_CACHE_DIR)
+    except OSError as e:
+        logging.warning(f"結果キャッシュのディレクトリを作成できないため使用しません: {RESULT_CACHE_DIR}: {e}")
+        return False
+    if not stat.S_ISDIR(st.st_mode):
+        logging.warning(f"結果キャッシュのパスがディレクトリではないため使用しません: {RESULT_CACHE_DIR}")
+        return False
+    if hasattr(os, 'getuid') and st.st_uid != os.getuid():
+        logging.warning(f"結果キャッシュのディレクトリの所有者が異なるため使用しません: {RESULT_CACHE_DIR}")
+        return False
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        logging.warning(f"結果キャッシュのディレクトリが他のユーザーから書き込めるため使用しません: {RESULT_CACHE_DIR}")
+        return False
+    return True
+
+def _dir_size(path):
+    return sum(
+        os.path.getsize(os.path.join(path, name))
+        for name in os.listdir(path)
+        if os.path.isfile(os.path.join(path, name))
+    )
+
+def load_cached_result(key):
+    """
+    キャッシュ済みの結果を返す（なければ None）
+    一緒に保存したダウンロード用ファイルは一時ディレクトリに戻し、最終利用時刻を更新する
+    """
+    if not _secure_cache_dir():
+        return None
+    entry = _entry_dir(key)
+    with _cache_lock:
+        result_path = os.path.join(entry, _RESULT_FILE)
+        if not os.path.exists(result_path):
+            return None
+        try:
+            with open(result_path, 'rb') as f:
+                result = pickle.load(f)
+        except Exception as e:
+            logging.warning(f"結果キャッシュの読み込みに失敗したため削除します: {key}: {e}")
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        for name in os.listdir(entry):
+            dst = os.path.join(tempfile.gettempdir(), name)
+            if name != _RESULT_FILE and not os.path.exists(dst):
+                shutil.copyfile(os.path.join(entry, name), dst)
+        # LRU 判定用にディレクトリの更新時刻を最終利用時刻として使う
+        os.utime(entry)
+    logging.info(f"結果キャッシュヒット: {key}")
+    return result
+
+def store_cached_result(key, result, file_paths=()):
+    """結果とダウンロード用ファイルを保存し、容量上限を超えた分を古い順に削除する"""
+    if not _secure_cache_dir():
+        return
+    entry = _entry_dir(key)
+    # 書き込み途中のエントリを読まないよう一時ディレクトリ経由で置き換える
+    tmp_entry = tempfile.mkdtemp(prefix=f".{key}.", dir=RESULT_CACHE_DIR)
+    try:
+        with open(os.path.join(tmp_entry, _RESULT_FILE), 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        for path in file_paths:
+            shutil.copyfile(path, os.path.join(tmp_entry, os.path.basename(path)))
+        with _cache_lock:
+            shutil.rmtree(entry, ignore_errors=True)
+            os.replace(tmp_entry, entry)
+            _evict_locked(RESULT_CACHE_MAX_BYTES)
+    finally:
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+    logging.info(f"結果キャッシュ保存完了: {key}")
+
+def evict_result_cache(max_bytes=RESULT_CACHE_MAX_BYTES):
+    with _cache_lock:
+        _evict_locked(max_bytes)
+
+def _evict_locked(max_bytes):
+    if not os.path.isdir(RESULT_CACHE_DIR):
+        return
+    entries = []
+    for name in os.listdir(RESULT_CACHE_DIR):
+        path = os.path.join(RESULT_CACHE_DIR, name)
+        if name.startswith('.') or not os.path.isdir(path):
+            continue
+        entries.append((os.path.getmtime(path), _dir_size(path), path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        logging.info(f"結果キャッシュ削除（容量上限）: {os.path.basename(path)}")
@@ -1,12 +1,26 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, Response
 from app.decorators import login_required
-from .pos_preprocessing import calc_asociation, build_node_edge_df, process_pos_data_background, llm_column_mapping, REQUIRED_COLUMNS
+from .pos_preprocessing import calc_asociation, calc_asociation_streaming, calc_windowed_asociation, calc_segmented_asociation, pairwise_rules, build_node_edge_df, process_pos_data_background, llm_column_mapping, REQUIRED_COLUMNS
+from .pos_stream import stream_pos_file, DEFAULT_CHUNKSIZE
+from .pos_loader import load_pos_frame, read_pos_header, read_pos_preview, ensure_datetime, is_csv_file
+from .rule_store import RuleStatsStore, load_rule_store, save_rule_store, discard_rule_store, rule_store_lock, rule_store_path
+from .customer_store import CustomerFeatureStore, load_customer_store, save_customer_store, discard_customer_store, customer_store_lock, customer_store_path, read_customer_features
+from .result_cache import result_cache_key, load_cached_result, store_cached_result
+from app.network.centrality import compute_betweenness, BETWEENNESS_MODES, BETWEENNESS_MIN_PIVOTS
+from app.network.graph_metrics import SparseGraph, build_rules_network
+from app.network.communities import community_options_from_form
+from app.network.backbone import backbone_options_from_form
+from app.network.layout import layout_options_from_form
+from app.network.graph_index import register_graph_index
+from app.network.payload import network_format_from_args, columnar_network, encode_network_binary, NETWORK_BINARY_MIMETYPE
+from app.clustering.make_clustring import k_range_from_form
 import pandas as pd
 import io
 import tempfile
 import os
 import logging
 import json
+import hashlib
 import threading
 from datetime import datetime
 import time
@@ -35,6 +49,12 @@ processing_status = {}
 # 自動処理用のグローバル変数
 auto_processing_data = {}
 
+# ウィンドウ別処理の結果
+windowed_processing_data = {}
+
+# セグメント別処理の結果
+segmented_processing_data = {}
+
 def nan_to_none(obj):
     if isinstance(obj, float) and (math.isnan(obj) or obj is np.nan):
         return None
@@ -45,10 +65,144 @@ def nan_to_none(obj):
     else:
         return obj
 
+def aggregate_customer_data(df_pos):
+    """カードごとの利用回数・利用金額・最頻時間帯を集計"""
+    cards = df_pos['カード番号']
+    customer_data = df_pos.groupby(cards, observed=True)['利用金額'].agg(['count', 'sum', 'mean', 'max'])
+    # 最頻時間帯: カード×時間帯の件数から最大の時間帯（同数の場合は早い時間帯）
+    hours = ensure_datetime(df_pos['利用日時']).dt.hour
+    hour_counts = df_pos.groupby([cards, hours], observed=True).size().unstack(fill_value=0)
+    modal_hour = hour_counts.idxmax(axis=1).reindex(customer_data.index, fill_value=0)
+    customer_data['最頻時間帯'] = modal_hour.astype(np.int64)
+    customer_data = customer_data.reset_index()
+    customer_data.columns = ['カード番号', '利用回数', '総利用金額', '平均利用金額', '最大利用金額', '最頻時間帯']
+    customer_data['カード番号'] = customer_data['カード番号'].astype(object)
+    return customer_data
+
+def calc_tenant_metrics(df_pos):
+    """テナントごとのユニーク客数・売上・訪問日数を集計"""
+    tenant_col = None
+    for col in ['テナント名', 'ショップ名略称']:
+        if col in df_pos.columns:
+            tenant_col = col
+            break
+    if tenant_col is None:
+        raise ValueError('テナント名またはショップ名略称列が見つかりません')
+    date_col = None
+    for col in ['利用日', '利用日時']:
+        if col in df_pos.columns:
+            date_col = col
+            break
+    if date_col is None:
+        raise ValueError('利用日または利用日時列が見つかりません')
+    member_col = None
+    for col in ['会員番号', 'カード番号']:
+        if col in df_pos.columns:
+            member_col = col
+            break
+    if member_col is None:
+        raise ValueError('会員番号またはカード番号列が見つかりません')
+    dates = ensure_datetime(df_pos[date_col])
+    grouped = df_pos.groupby(tenant_col, observed=True)
+    unique_customers = grouped[member_col].nunique()
+    unique_customers.name = 'ユニーク客数'
+    sales = grouped['利用金額'].sum()
+    sales.name = '売上'
+    visit_days = dates.groupby(df_pos[tenant_col], observed=True).nunique()
+    visit_days.name = '訪問日数'
+    return pd.concat([unique_customers, sales, visit_days], axis=1)
+
+def build_radar_chart_data(tenant_metrics, rules_df, betweenness=None):
+    """
+    テナント指標と媒介中心性を正規化してレーダーチャート用データを作成
+    betweenness: ネットワーク作成時に計算済みの {店舗: 媒介中心性}（なければここで計算）
+    """
+    unique_customers = tenant_metrics['ユニーク客数']
+    sales = tenant_metrics['売上']
+    visit_days = tenant_metrics['訪問日数']
+    avg_freq = (visit_days / unique_customers)
+    avg_freq.name = '平均頻度(日数/ユニーク客数)'
+    sales_per_day = (sales / visit_days)
+    sales_per_day.name = '1日あたり購買金額'
+    if betweenness is None:
+        graph = SparseGraph.from_rules(rules_df)
+        betweenness = dict(zip(graph.nodes, compute_betweenness(graph)[0]))
+    bc_series = pd.Series(betweenness, name='日別合計媒介中心', dtype=np.float64)
+    metrics_df = pd.concat([
+        unique_customers, sales, avg_freq, sales_per_day
+    ], axis=1)
+    bc_series.index = bc_series.index.astype(str)
+    metrics_df.index = metrics_df.index.astype(str)
+    metrics_df = metrics_df.join(bc_series, how='left')
+    if '日別合計媒介中心' in metrics_df.columns:
+        metrics_df['日別合計媒介中心'] = metrics_df['日別合計媒介中心'].fillna(0)
+    logger.info(f"metrics_df columns after join: {metrics_df.columns}")
+    logger.info(f"metrics_df index after join: {metrics_df.index}")
+    metrics_df = metrics_df.reset_index()
+    metrics_df = metrics_df.rename(columns={metrics_df.columns[0]: 'テナント名'})
+    logger.info(f"metrics_df columns: {metrics_df.columns}")
+    if 'テナント名' not in metrics_df.columns:
+        raise ValueError(f"metrics_dfにテナント名列が存在しません: {metrics_df.columns}")
+    metrics = [
+        "ユニーク客数",
+        "売上",
+        "平均頻度(日数/ユニーク客数)",
+        "1日あたり購買金額",
+        "日別合計媒介中心"
+    ]
+    df_norm = metrics_df.copy()
+    for m in metrics:
+        min_v = df_norm[m].min()
+        max_v = df_norm[m].max()
+        if max_v > min_v:
+            df_norm[m] = (df_norm[m] - min_v) / (max_v - min_v)
+        else:
+            df_norm[m] = 0.0
+    tenants = list(df_norm["テナント名"].values)
+    radar_chart_data = []
+    for metric in metrics:
+        row = {"metric": metric}
+        for t in tenants:
+            v = df_norm.loc[df_norm["テナント名"] == t, metric].values
+            row[t] = str(float(v[0])) if len(v) else "0.0"
+        radar_chart_data.append(row)
+    return tenants, radar_chart_data
+
 # --- ここからグローバルに移動（import文の直後） ---
-def background_auto_process_independent(file_bytes, filename, column_mapping, process_id, start_time):
+def background_auto_process_independent(file_bytes, filename, column_mapping, process_id, start_time, streaming=False, chunksize=DEFAULT_CHUNKSIZE, min_support=0.0001, max_len=2, n_jobs=1, use_cache=True, betweenness_mode="auto", betweenness_k=None, community_options=None, backbone_options=None, layout_options=None, n_clusters=4, k_range=None, customer_store=None):
     try:
         logger.info(f"自動処理開始: {process_id}")
+        # 同じファイル・列名マッピング・パラメータの結果があれば再計算しない
+        # （streaming, chunksize, n_jobs は結果に影響しないためキーに含めない）
+        cache_key = None
+        if use_cache:
+            cache_key = result_cache_key(file_bytes, column_mapping, {
+                "filetype": "csv" if is_csv_file(filename) else "excel",
+                "min_support": min_support,
+                "max_len": max_len,
+                "betweenness_mode": betweenness_mode,
+                "betweenness_k": betweenness_k,
+                "community": community_options or {},
+                "backbone": backbone_options or {},
+                "layout": layout_options or {},
+                "n_clusters": n_clusters,
+                "k_range": k_range
+            })
+            cached = load_cached_result(cache_key)
+            if cached is not None:
+                processing_time = time.time() - start_time
+                cached.update({'processing_time': processing_time, 'cache_hit': True})
+                auto_processing_data[process_id] = cached
+                register_graph_index(process_id, cached.get('network_data', {}))
+                processing_status[process_id].update({
+                    "status": "completed",
+                    "progress": 100,
+                    "message": f"キャッシュ済みの結果を返しました（処理時間: {processing_time:.2f}秒）",
+                    "current_step": "完了",
+                    "processing_time": processing_time,
+                    "cache_hit": True
+                })
+                return
         temp_file_pos = tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.csv')
         temp_file_cluster = tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.csv')
         temp_file_network = tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.csv')
@@ -70,29 +224,39 @@ def background_auto_process_independent(file_bytes, filename, column_mapping, pr
                 "current_step": "POSデータ前処理"
             })
             logger.info("POSデータ前処理開始")
-            if filename and isinstance(filename, str) and filename.endswith(".csv"):
-                df_pos = pd.read_csv(temp_file_pos.name)
-            else:
-                df_pos = pd.read_excel(temp_file_pos.name)
-            logger.info(f"POSファイル読み込み完了: {len(df_pos)} 行")
             # --- カテゴリ列のユニーク値取得ロジックを修正 ---
             category_col = None
             for k, v in column_mapping.items():
                 if v == "カテゴリ":
                     category_col = k
                     break
-            if category_col and category_col in df_pos.columns:
-                categories = df_pos[category_col].dropna().unique().tolist()
+            pos_summary = None
+            if streaming:
+                # チャンク単位で集計し、全件のDataFrameは作らない
+                logger.info(f"ストリーミング読み込み開始: chunksize={chunksize}")
+                pos_accumulator, pos_summary = stream_pos_file(temp_file_pos.name, chunksize=chunksize, category_col=category_col)
+                logger.info(f"POSファイル読み込み完了: {pos_accumulator.n_rows} 行")
+                categories = list(pos_summary.categories)
+                rules = calc_asociation_streaming(pos_accumulator, min_support=min_support, max_len=max_len, n_jobs=n_jobs)
+                pos_accumulator = None
             else:
-                categories = []
-            rules = calc_asociation(df_pos, min_support=0.0001, max_len=2)
+                # 型付きで1回だけ読み込み、アソシエーション・顧客集計・テナント指標で共有する
+                df_pos = load_pos_frame(temp_file_pos.name, filename)
+                logger.info(f"POSファイル読み込み完了: {len(df_pos)} 行")
+                if category_col and category_col in df_pos.columns:
+                    categories = df_pos[category_col].dropna().unique().tolist()
+                else:
+                    categories = []
+                rules = calc_asociation(df_pos, min_support=min_support, max_len=max_len, n_jobs=n_jobs)
             logger.info(f"アソシエーション分析完了: {len(rules)} ルール")
             for col in ['antecedents', 'consequents', 'lift']:
                 if col not in rules.columns:
                     rules[col] = np.nan
             rules_df = rules
             rules_list = list(rules_df.itertuples(index=False, name=None))
-            node_df, edge_df = build_node_edge_df(rules_df, "mall_name")
+            # ネットワークは1店舗 → 1店舗のルールから作成
+            network_rules_df = pairwise_rules(rules_df)
+            node_df, edge_df = build_node_edge_df(network_rules_df, "mall_name")
             if not isinstance(node_df, pd.DataFrame):
                 node_list = list(node_df)
                 node_df_df = pd.DataFrame(node_list)
@@ -120,12 +284,27 @@ def background_auto_process_independent(file_bytes, filename, column_mapping, pr
             logger.info("クラスタリング開始")
             from app.clustering.make_clustring import cluster_main
             logger.info("顧客属性データ変換開始")
-            customer_data = df_pos.groupby('カード番号').agg({
-                '利用金額': ['count', 'sum', 'mean', 'max'],
-                '利用日時': lambda x: pd.to_datetime(x).dt.hour.mode().iloc[0] if len(x) > 0 else 0
-            }).reset_index()
-            customer_data.columns = ['カード番号', '利用回数', '総利用金額', '平均利用金額', '最大利用金額', '最頻時間帯']
-            clustering_result = cluster_main(customer_data, n_clusters=4)
+            if customer_store:
+                # 顧客特徴量ストアを差分更新し、保存済みの特徴量の表でクラスタリングする
+                with customer_store_lock(customer_store):
+                    store = load_customer_store(customer_store) or CustomerFeatureStore()
+                    try:
+                        if pos_summary is not None:
+                            appended = store.append_csv(temp_file_pos.name, chunksize=chunksize)
+                        else:
+                            appended = store.append_frame(df_pos, source=hashlib.sha256(file_bytes).hexdigest())
+                        save_customer_store(customer_store, store)
+                    except Exception:
+                        # 途中まで反映した集計を保存済みのファイルと食い違ったまま残さない
+                        discard_customer_store(customer_store)
+                        raise
+                    customer_data = read_customer_features(customer_store)
+                logger.info(f"顧客特徴量ストア更新完了: {customer_store}, {appended}")
+            elif pos_summary is not None:
+                customer_data = pos_summary.customer_data()
+            else:
+                customer_data = aggregate_customer_data(df_pos)
+            clustering_result = cluster_main(customer_data, n_clusters=n_clusters, k_range=k_range, n_jobs=n_jobs)
             cluster_filename = f"clustering_result_{timestamp}.csv"
             cluster_file_path = os.path.join(tempfile.gettempdir(), cluster_filename)
             clustering_result['agg_df'] = clustering_result['agg_df'].where(pd.notnull(clustering_result['agg_df']), None)
@@ -137,8 +316,11 @@ def background_auto_process_independent(file_bytes, filename, column_mapping, pr
                 "current_step": "ネットワーク描画"
             })
             logger.info("ネットワーク描画準備開始")
-            from app.network.draw_network import create_network_json
-            network_data = create_network_json_from_rules(rules_df)
+            network_data = create_network_json_from_rules(
+                network_rules_df, betweenness_mode=betweenness_mode, betweenness_k=betweenness_k,
+                n_jobs=n_jobs, community_options=community_options, backbone_options=backbone_options,
+                layout_options=layout_options
+            )
             logger.info("ネットワークデータ作成完了")
             processing_status[process_id].update({
                 "progress": 80,
@@ -146,86 +328,13 @@ def background_auto_process_independent(file_bytes, filename, column_mapping, pr
                 "current_step": "レーダーチャート"
             })
             logger.info("レーダーチャート準備開始")
-            tenant_col = None
-            for col in ['テナント名', 'ショップ名略称']:
-                if col in df_pos.columns:
-                    tenant_col = col
-                    break
-            if tenant_col is None:
-                raise ValueError('テナント名またはショップ名略称列が見つかりません')
-            date_col = None
-            for col in ['利用日', '利用日時']:
-                if col in df_pos.columns:
-                    date_col = col
-                    break
-            if date_col is None:
-                raise ValueError('利用日または利用日時列が見つかりません')
-            member_col = None
-            for col in ['会員番号', 'カード番号']:
-                if col in df_pos.columns:
-                    member_col = col
-                    break
-            if member_col is None:
-                raise ValueError('会員番号またはカード番号列が見つかりません')
-            df_pos[date_col] = pd.to_datetime(df_pos[date_col], errors='coerce')
-            unique_customers = df_pos.groupby(tenant_col)[member_col].nunique()
-            unique_customers.name = 'ユニーク客数'
-            sales = df_pos.groupby(tenant_col)['利用金額'].sum()
-            sales.name = '売上'
-            visit_days = df_pos.groupby(tenant_col)[date_col].nunique()
-            visit_days.name = '訪問日数'
-            avg_freq = (visit_days / unique_customers)
-            avg_freq.name = '平均頻度(日数/ユニーク客数)'
-            sales_per_day = (sales / visit_days)
-            sales_per_day.name = '1日あたり購買金額'
-            import networkx as nx
-            G = nx.Graph()
-            for _, row in rules_df.iterrows():
-                src = str(row['antecedents'])
-                dst = str(row['consequents'])
-                lift_val = row['lift'] if 'lift' in row else 1.0
-                if src and dst and src != dst:
-                    G.add_edge(src, dst, weight=lift_val)
-            bet_cent = nx.betweenness_centrality(G, weight='weight', normalized=True)
-            bc_series = pd.Series(bet_cent, name='日別合計媒介中心')
-            metrics_df = pd.concat([
-                unique_customers, sales, avg_freq, sales_per_day
-            ], axis=1)
-            bc_series.index = bc_series.index.astype(str)
-            metrics_df.index = metrics_df.index.astype(str)
-            metrics_df = metrics_df.join(bc_series, how='left')
-            if '日別合計媒介中心' in metrics_df.columns:
-                metrics_df['日別合計媒介中心'] = metrics_df['日別合計媒介中心'].fillna(0)
-            logger.info(f"metrics_df columns after join: {metrics_df.columns}")
-            logger.info(f"metrics_df index after join: {metrics_df.index}")
-            metrics_df = metrics_df.reset_index()
-            metrics_df = metrics_df.rename(columns={metrics_df.columns[0]: 'テナント名'})
-            logger.info(f"metrics_df columns: {metrics_df.columns}")
-            if 'テナント名' not in metrics_df.columns:
-                raise ValueError(f"metrics_dfにテナント名列が存在しません: {metrics_df.columns}")
-            metrics = [
-                "ユニーク客数",
-                "売上",
-                "平均頻度(日数/ユニーク客数)",
-                "1日あたり購買金額",
-                "日別合計媒介中心"
-            ]
-            df_norm = metrics_df.copy()
-            for m in metrics:
-                min_v = df_norm[m].min()
-                max_v = df_norm[m].max()
-                if max_v > min_v:
-                    df_norm[m] = (df_norm[m] - min_v) / (max_v - min_v)
-                else:
-                    df_norm[m] = 0.0
-            tenants = list(df_norm["テナント名"].values)
-            radar_chart_data = []
-            for metric in metrics:
-                row = {"metric": metric}
-                for t in tenants:
-                    v = df_norm.loc[df_norm["テナント名"] == t, metric].values
-                    row[t] = str(float(v[0])) if len(v) else "0.0"
-                radar_chart_data.append(row)
+            if pos_summary is not None:
+                tenant_metrics = pos_summary.tenant_metrics()
+            else:
+                tenant_metrics = calc_tenant_metrics(df_pos)
+            # 媒介中心性はネットワーク作成時の結果を使い、再計算しない
+            betweenness = {node["id"]: node["betweenness"] for node in network_data.get("nodes", [])}
+            tenants, radar_chart_data = build_radar_chart_data(tenant_metrics, network_rules_df, betweenness=betweenness)
             logger.info("レーダーチャートデータ準備完了")
             end_time = time.time()
             processing_time = end_time - start_time
@@ -242,12 +351,21 @@ def background_auto_process_independent(file_bytes, filename, column_mapping, pr
                     'tenants': tenants,
                     'radar_chart_data': radar_chart_data,
                     'agg_df': clustering_result['agg_df'],
-                    'cluster_names': clustering_result.get('cluster_names', {})
+                    'cluster_names': clustering_result.get('cluster_names', {}),
+                    'k_sweep': clustering_result.get('k_sweep')
                 },
                 'network_data': network_data,
                 'processing_time': processing_time,
-                'category': categories
+                'category': categories,
+                'cache_hit': False
             }
+            # エゴネットワーク等の検索用にグラフのインデックスを保持
+            register_graph_index(process_id, network_data)
+            if cache_key is not None:
+                try:
+                    store_cached_result(cache_key, auto_processing_data[process_id], [pos_file_path, cluster_file_path])
+                except Exception as e:
+                    logger.warning(f"結果キャッシュ保存エラー: {str(e)}")
             processing_status[process_id].update({
                 "status": "completed",
                 "progress": 100,
@@ -314,10 +432,7 @@ def upload_posdata():
         temp_file_path = temp_file.name
 
         try:
-            if filename and isinstance(filename, str) and filename.endswith(".csv"):
-                df = pd.read_csv(temp_file_path)
-            else:
-                df = pd.read_excel(temp_file_path)
+            df = read_pos_preview(temp_file_path, filename, nrows=20)
             preview = df.head(20)
             preview = preview.where(pd.notnull(preview), None)
             preview = preview.to_dict(orient="records")
@@ -341,6 +456,11 @@ def process_posdata():
         column_mapping_str = request.form.get("column_mapping", "{}")
         min_support = float(request.form.get("min_support", "0.0001"))
         max_len = int(request.form.get("max_len", "2"))
+        streaming = request.form.get("streaming", "false").lower() in ("true", "1")
+        chunksize = int(request.form.get("chunksize", str(DEFAULT_CHUNKSIZE)))
+        n_jobs = int(request.form.get("n_jobs", "1"))
+        if max_len < 2:
+            return jsonify({"error": "max_lenは2以上を指定してください"}), 400
 
         # ファイル内容を一時保存して列名取得
         file_content = file.read()
@@ -356,6 +476,8 @@ def process_posdata():
         filename = file.filename
         file = None
         file_content = None
+        if streaming and not is_csv_file(filename):
+            return jsonify({"error": "ストリーミングモードはCSVファイルのみ対応しています"}), 400
 
         # 一時ファイルで列名取得
         temp_file = tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.csv')
@@ -364,11 +486,7 @@ def process_posdata():
         temp_file.close()
         temp_file_path = temp_file.name
         try:
-            if filename and isinstance(filename, str) and filename.endswith(".csv"):
-                df = pd.read_csv(temp_file_path)
-            else:
-                df = pd.read_excel(temp_file_path)
-            columns = list(df.columns)
+            columns = read_pos_header(temp_file_path, filename)
         finally:
             if os.path.exists(temp_file_path):
                 os.unlink(temp_file_path)
@@ -427,7 +545,12 @@ def process_posdata():
                     filename=filename,
                     column_mapping=column_mapping,
                     process_id=process_id,
-                    start_time=start_time
+                    start_time=start_time,
+                    streaming=streaming,
+                    chunksize=chunksize,
+                    min_support=min_support,
+                    max_len=max_len,
+                    n_jobs=n_jobs
                 )
             except Exception as e:
                 logging.error(f"バックグラウンド処理エラー: {str(e)}")
@@ -500,6 +623,31 @@ def auto_process_posdata():
         # パラメータの取得
         column_mapping_str = request.form.get("column_mapping", "{}")
         column_mapping = json.loads(column_mapping_str)
+        streaming = request.form.get("streaming", "false").lower() in ("true", "1")
+        chunksize = int(request.form.get("chunksize", str(DEFAULT_CHUNKSIZE)))
+        min_support = float(request.form.get("min_support", "0.0001"))
+        max_len = int(request.form.get("max_len", "2"))
+        n_jobs = int(request.form.get("n_jobs", "1"))
+        use_cache = request.form.get("use_cache", "true").lower() in ("true", "1")
+        betweenness_mode = request.form.get("betweenness_mode", "auto")
+        betweenness_k = int(request.form["betweenness_k"]) if request.form.get("betweenness_k") else None
+        if max_len < 2:
+            return jsonify({"error": "max_lenは2以上を指定してください"}), 400
+        if betweenness_mode not in BETWEENNESS_MODES:
+            return jsonify({"error": f"betweenness_modeは {', '.join(BETWEENNESS_MODES)} のいずれかを指定してください"}), 400
+        if betweenness_k is not None and betweenness_k < BETWEENNESS_MIN_PIVOTS:
+            return jsonify({"error": f"betweenness_kは{BETWEENNESS_MIN_PIVOTS}以上を指定してください"}), 400
+        try:
+            community_options = community_options_from_form(request.form)
+            backbone_options = backbone_options_from_form(request.form)
+            layout_options = layout_options_from_form(request.form)
+            k_range = k_range_from_form(request.form)
+            n_clusters = 4 if k_range is not None else int(request.form.get("n_clusters", "4"))
+            customer_store = request.form.get("customer_store") or None
+            if customer_store:
+                customer_store_path(customer_store)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         # ファイルの内容を完全にコピーしてからバックグラウンド処理に渡す
         file_content = file.read()
@@ -521,6 +669,8 @@ def auto_process_posdata():
         # ファイルオブジェクトとfile_contentを明示的にNoneにして参照を断つ
         file = None
         file_content = None
+        if streaming and not is_csv_file(filename):
+            return jsonify({"error": "ストリーミングモードはCSVファイルのみ対応しています"}), 400
 
         logger.info(f"ファイル内容読み込み完了: {len(file_bytes_for_thread)} バイト")
 
@@ -540,7 +690,24 @@ def auto_process_posdata():
         # スレッドでバックグラウンド処理を開始
         thread = threading.Thread(
             target=background_auto_process_independent,
-            args=(file_bytes_for_thread, filename, column_mapping, process_id, start_time)
+            args=(file_bytes_for_thread, filename, column_mapping, process_id, start_time),
+            kwargs={
+                "streaming": streaming,
+                "chunksize": chunksize,
+                "min_support": min_support,
+                "max_len": max_len,
+                "n_jobs": n_jobs,
+                "betweenness_mode": betweenness_mode,
+                "betweenness_k": betweenness_k,
+                "community_options": community_options,
+                "backbone_options": backbone_options,
+                "layout_options": layout_options,
+                "n_clusters": n_clusters,
+                "k_range": k_range,
+                # ストアを使う場合は結果がストアの状態に依存するため、結果キャッシュを使わない
+                "use_cache": use_cache and not customer_store,
+                "customer_store": customer_store
+            }
         )
         thread.daemon = True
         thread.start()
@@ -614,11 +781,20 @@ def download_auto_processed_data(process_id, data_type):
                 'cluster_names': clustering_data.get('cluster_names', {}),
                 'radar_chart_data': clustering_data.get('radar_chart_data', []),
                 'download_filename': clustering_data.get('filename', None),
-                'tenants': clustering_data.get('tenants', [])
+                'tenants': clustering_data.get('tenants', []),
+                'k_sweep': clustering_data.get('k_sweep')
             }))
         elif data_type == "network":
-            # ネットワークデータ（nodes, links）をJSONで返す
+            # ネットワークデータ（nodes, links）を返す（format で列形式・バイナリも選べる）
             network_data = data.get('network_data', {})
+            try:
+                response_format = network_format_from_args(request.args)
+            except ValueError as e:
+                return jsonify(nan_to_none({"error": str(e)})), 400
+            if response_format == "binary":
+                return Response(encode_network_binary(network_data), mimetype=NETWORK_BINARY_MIMETYPE)
+            if response_format == "columnar":
+                return jsonify(nan_to_none(columnar_network(network_data)))
             return jsonify(nan_to_none(network_data))
         elif data_type == "radar":
             # レーダーチャートデータをJSONで返す
@@ -639,106 +815,438 @@ def download_auto_processed_data(process_id, data_type):
         logging.error(f"自動処理結果ダウンロードエラー: {str(e)}")
         return jsonify(nan_to_none({"error": str(e)})), 500
 
-@posdata_bp.route("/api/posdata/llm-mapping", methods=["POST"], strict_slashes=False)
+@posdata_bp.route("/api/posdata/rule-store/<store_id>/append", methods=["POST"])
 @login_required
-def llm_mapping_api():
+def append_rule_store(store_id):
+    """追加分のPOSデータ（CSV）でルール集計ストアを差分更新"""
     try:
-        data = request.get_json()
-        columns = data.get("columns", [])
-        if not columns or not isinstance(columns, list):
-            return jsonify(nan_to_none({"error": "columnsリストが必要です"})), 400
-        mapping = llm_column_mapping(columns)
-        return jsonify(nan_to_none({"mapping": mapping}))
+        if "file" not in request.files:
+            return jsonify({"error": "ファイルが必要です"}), 400
+        file = request.files["file"]
+        if not file.filename or not file.filename.endswith(".csv"):
+            return jsonify({"error": "CSVファイルのみ対応しています"}), 400
+        chunksize = int(request.form.get("chunksize", str(DEFAULT_CHUNKSIZE)))
+        rule_store_path(store_id)
+
+        temp_file = tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.csv')
+        file.save(temp_file)
+        temp_file.close()
+        try:
+            start_time = time.time()
+            with rule_store_lock(store_id):
+                store = load_rule_store(store_id) or RuleStatsStore()
+                try:
+                    appended = store.append_csv(temp_file.name, chunksize=chunksize)
+                    save_rule_store(store_id, store)
+                except Exception:
+                    # 途中まで反映した集計を保存済みのファイルと食い違ったまま残さない
+                    discard_rule_store(store_id)
+                    raise
+                summary = store.summary()
+            processing_time = time.time() - start_time
+            logger.info(f"ルール集計ストア更新完了: {store_id}, {appended}, {processing_time:.2f}秒")
+            return jsonify(nan_to_none({
+                "store_id": store_id,
+                "appended": appended,
+                "store": summary,
+                "processing_time": processing_time
+            }))
+        finally:
+            if os.path.exists(temp_file.name):
+                os.unlink(temp_file.name)
+    except ValueError as e:
+        return jsonify(nan_to_none({"error": str(e)})), 400
     except Exception as e:
-        logger.error(f"LLMマッピングAPIエラー: {str(e)}")
+        logger.error(f"ルール集計ストア更新エラー: {str(e)}")
         return jsonify(nan_to_none({"error": str(e)})), 500
 
-def create_network_json_from_rules(rules):
-    """アソシエーションルールからネットワークデータを作成"""
+@posdata_bp.route("/api/posdata/rule-store/<store_id>/rules", methods=["GET"])
+@login_required
+def get_rule_store_rules(store_id):
+    """ルール集計ストアからアソシエーションルールとネットワークを再計算"""
     try:
-        import networkx as nx
-        from networkx.algorithms import community
+        min_support = float(request.args.get("min_support", "0.0001"))
+        start_time = time.time()
+        with rule_store_lock(store_id):
+            store = load_rule_store(store_id)
+            if store is None:
+                return jsonify(nan_to_none({"error": "ストアが見つかりません"})), 404
+            rules = calc_asociation_streaming(store, min_support=min_support)
+            summary = store.summary()
+        network_data = create_network_json_from_rules(rules)
+        processing_time = time.time() - start_time
+
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        pos_filename = f"pos_processed_{store_id}_{timestamp}.csv"
+        rules.to_csv(os.path.join(tempfile.gettempdir(), pos_filename), index=False, encoding='utf-8-sig')
+        return jsonify(nan_to_none({
+            "store_id": store_id,
+            "store": summary,
+            "rules_count": len(rules),
+            "filename": pos_filename,
+            "network_data": network_data,
+            "processing_time": processing_time
+        }))
+    except ValueError as e:
+        return jsonify(nan_to_none({"error": str(e)})), 400
+    except Exception as e:
+        logger.error(f"ルール集計ストア取得エラー: {str(e)}")
+        return jsonify(nan_to_none({"error": str(e)})), 500
 
-        # グラフの構築
-        G = nx.Graph()
-        for _, row in rules.iterrows():
-            source = str(row["antecedents"]).strip()
-            target = str(row["consequents"]).strip()
-            weight = float(row["lift"])
+@posdata_bp.route("/api/posdata/customer-store/<store_id>/append", methods=["POST"])
+@login_required
+def append_customer_store(store_id):
+    """追加分のPOSデータ（CSV）で顧客特徴量ストアを差分更新"""
+    try:
+        if "file" not in request.files:
+            return jsonify({"error": "ファイルが必要です"}), 400
+        file = request.files["file"]
+        if not file.filename or not file.filename.endswith(".csv"):
+            return jsonify({"error": "CSVファイルのみ対応しています"}), 400
+        chunksize = int(request.form.get("chunksize", str(DEFAULT_CHUNKSIZE)))
+        customer_store_path(store_id)
 
-            if source and target and source != target:
-                G.add_edge(source, target, weight=weight)
+        temp_file = tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.csv')
+        file.save(temp_file)
+        temp_file.close()
+        try:
+            start_time = time.time()
+            with customer_store_lock(store_id):
+                store = load_customer_store(store_id) or CustomerFeatureStore()
+                try:
+                    appended = store.append_csv(temp_file.name, chunksize=chunksize)
+                    if not appended["skipped"]:
+                        save_customer_store(store_id, store)
+                except Exception:
+                    # 途中まで反映した集計を保存済みのファイルと食い違ったまま残さない
+                    discard_customer_store(store_id)
+                    raise
+                summary = store.summary()
+            processing_time = time.time() - start_time
+            logger.info(f"顧客特徴量ストア更新完了: {store_id}, {appended}, {processing_time:.2f}秒")
+            return jsonify(nan_to_none({
+                "store_id": store_id,
+                "appended": appended,
+                "store": summary,
+                "processing_time": processing_time
+            }))
+        finally:
+            if os.path.exists(temp_file.name):
+                os.unlink(temp_file.name)
+    except ValueError as e:
+        return jsonify(nan_to_none({"error": str(e)})), 400
+    except Exception as e:
+        logger.error(f"顧客特徴量ストア更新エラー: {str(e)}")
+        return jsonify(nan_to_none({"error": str(e)})), 500
 
-        if len(G.nodes()) == 0:
-            return {"nodes": [], "links": []}
+@posdata_bp.route("/api/posdata/customer-store/<store_id>/features", methods=["GET"])
+@login_required
+def get_customer_store_features(store_id):
+    """顧客特徴量ストアの特徴量の表（先頭 limit 行、format=csv で全件をダウンロード）"""
+    try:
+        limit = int(request.args.get("limit", "100"))
+        customer_store_path(store_id)
+        with customer_store_lock(store_id):
+            features = read_customer_features(store_id)
+        if features is None:
+            return jsonify(nan_to_none({"error": "ストアが見つかりません"})), 404
+        if request.args.get("format") == "csv":
+            output = io.BytesIO(features.to_csv(index=False).encode('utf-8-sig'))
+            return send_file(output, mimetype='text/csv', as_attachment=True, download_name=f"customer_features_{store_id}.csv")
+        return jsonify(nan_to_none({
+            "store_id": store_id,
+            "n_customers": len(features),
+            "columns": list(features.columns),
+            "features": features.head(limit).to_dict(orient='records')
+        }))
+    except ValueError as e:
+        return jsonify(nan_to_none({"error": str(e)})), 400
+    except Exception as e:
+        logger.error(f"顧客特徴量ストア取得エラー: {str(e)}")
+        return jsonify(nan_to_none({"error": str(e)})), 500
 
-        # 中心性指標の計算
-        try:
-            betweenness = nx.betweenness_centrality(G, weight="weight", normalized=True)
-        except:
-            betweenness = nx.betweenness_centrality(G, normalized=True)
+def background_windowed_process(file_bytes, filename, process_id, start_time, window_days, stride_days, min_support):
+    """ウィンドウごとのルール・ネットワークを1回の読み込みから作成"""
+    temp_file = tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.csv')
+    try:
+        temp_file.write(file_bytes)
+        temp_file.close()
+        processing_status[process_id].update({
+            "progress": 10,
+            "message": "POSデータを読み込み中...",
+            "current_step": "POSデータ前処理"
+        })
+        df_pos = load_pos_frame(temp_file.name, filename)
 
-        try:
-            degree = nx.degree_centrality(G)
-        except:
-            degree = {node: 0 for node in G.nodes()}
+        processing_status[process_id].update({
+            "progress": 30,
+            "message": "ウィンドウ別アソシエーション分析を実行中...",
+            "current_step": "アソシエーション分析"
+        })
+        windows = calc_windowed_asociation(df_pos, window_days=window_days, stride_days=stride_days, min_support=min_support)
+        df_pos = None
 
-        try:
-            closeness = nx.closeness_centrality(G, distance="weight")
-        except:
-            closeness = nx.closeness_centrality(G)
+        snapshots = []
+        rules_tables = []
+        for i, window in enumerate(windows):
+            processing_status[process_id].update({
+                "progress": 50 + int(50 * i / max(len(windows), 1)),
+                "message": f"ネットワークを作成中... ({i + 1}/{len(windows)})",
+                "current_step": "ネットワーク描画"
+            })
+            window_start = window['window_start'].strftime('%Y-%m-%d')
+            window_end = window['window_end'].strftime('%Y-%m-%d')
+            rules = window['rules']
+            snapshots.append({
+                "window_start": window_start,
+                "window_end": window_end,
+                "rules_count": len(rules),
+                "network_data": create_network_json_from_rules(rules)
+            })
+            rules_tables.append(rules.assign(window_start=window_start, window_end=window_end))
 
-        try:
-            eigenvector = nx.eigenvector_centrality_numpy(G, weight="weight")
-        except:
-            eigenvector = {node: 0 for node in G.nodes()}
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        rules_filename = f"pos_windowed_{timestamp}.csv"
+        if rules_tables:
+            pd.concat(rules_tables, ignore_index=True).to_csv(
+                os.path.join(tempfile.gettempdir(), rules_filename), index=False, encoding='utf-8-sig'
+            )
+        processing_time = time.time() - start_time
+        windowed_processing_data[process_id] = {
+            "window_days": window_days,
+            "stride_days": stride_days,
+            "filename": rules_filename if rules_tables else None,
+            "snapshots": snapshots,
+            "processing_time": processing_time
+        }
+        processing_status[process_id].update({
+            "status": "completed",
+            "progress": 100,
+            "message": f"ウィンドウ別処理が完了しました（{len(snapshots)} ウィンドウ, 処理時間: {processing_time:.2f}秒）",
+            "current_step": "完了",
+            "processing_time": processing_time
+        })
+    except Exception as e:
+        logger.error(f"ウィンドウ別処理エラー: {str(e)}")
+        logger.error(f"スタックトレース: {traceback.format_exc()}")
+        processing_status[process_id].update({
+            "status": "failed",
+            "progress": 0,
+            "message": f"エラーが発生しました: {str(e)}",
+            "current_step": "エラー"
+        })
+    finally:
+        if os.path.exists(temp_file.name):
+            os.unlink(temp_file.name)
 
-        # コミュニティ検出
-        try:
-            communities = list(community.greedy_modularity_communities(G, weight="weight"))
-        except:
-            communities = list(community.greedy_modularity_communities(G))
-
-        node_community = {n: cid for cid, com in enumerate(communities) for n in com}
-
-        # 店舗ごとのrevenueを集計
-        shop_revenue = {}
-        if 'antecedent_revenue' in rules.columns and 'consequent_revenue' in rules.columns:
-            for _, row in rules.iterrows():
-                antecedent = str(row["antecedents"]).strip()
-                consequent = str(row["consequents"]).strip()
-                antecedent_revenue = float(row.get("antecedent_revenue", 0) or 0)
-                consequent_revenue = float(row.get("consequent_revenue", 0) or 0)
-                if antecedent not in shop_revenue:
-                    shop_revenue[antecedent] = antecedent_revenue
-                if consequent not in shop_revenue:
-                    shop_revenue[consequent] = consequent_revenue
-
-        # ノードデータの作成
-        nodes = [
-            {
-                "id": n,
-                "betweenness": float(betweenness.get(n, 0)),
-                "degree": float(degree.get(n, 0)),
-                "closeness": float(closeness.get(n, 0)),
-                "eigenvector": float(eigenvector.get(n, 0)),
-                "group": int(node_community.get(n, 0)),
-                "revenue": float(shop_revenue.get(n, 0))
-            }
-            for n in G.nodes()
-        ]
-
-        # リンクデータの作成
-        links = [
-            {
-                "source": u,
-                "target": v,
-                "value": float(d.get("weight", 1))
+@posdata_bp.route("/api/posdata/windowed", methods=["POST"])
+@login_required
+def windowed_posdata():
+    """利用日時のスライディングウィンドウごとにルールとネットワークを作成"""
+    try:
+        if "file" not in request.files:
+            return jsonify({"error": "ファイルが必要です"}), 400
+        file = request.files["file"]
+        if not file.filename:
+            return jsonify({"error": "ファイル名が必要です"}), 400
+        window_days = int(request.form.get("window_days", "7"))
+        stride_days = int(request.form.get("stride_days", "1"))
+        min_support = float(request.form.get("min_support", "0.0001"))
+        if window_days < 1 or stride_days < 1:
+            return jsonify({"error": "window_days, stride_daysは1以上を指定してください"}), 400
+
+        file_bytes_for_thread = bytes(file.read())
+        filename = file.filename
+        file = None
+
+        process_id = f"windowed_process_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        start_time = time.time()
+        processing_status[process_id] = {
+            "status": "processing",
+            "progress": 0,
+            "message": "ウィンドウ別処理を開始しました",
+            "start_time": start_time,
+            "current_step": "POSデータ前処理"
+        }
+        thread = threading.Thread(
+            target=background_windowed_process,
+            args=(file_bytes_for_thread, filename, process_id, start_time, window_days, stride_days, min_support)
+        )
+        thread.daemon = True
+        thread.start()
+
+        return jsonify(nan_to_none({
+            "message": "ウィンドウ別処理を開始しました",
+            "process_id": process_id
+        }))
+    except Exception as e:
+        logger.error(f"ウィンドウ別処理開始エラー: {str(e)}")
+        return jsonify(nan_to_none({"error": str(e)})), 500
+
+@posdata_bp.route("/api/posdata/windowed/<process_id>", methods=["GET"])
+@login_required
+def get_windowed_result(process_id):
+    """ウィンドウ別処理の結果（各ウィンドウのネットワークと中心性）を取得"""
+    try:
+        if process_id not in windowed_processing_data:
+            return jsonify(nan_to_none({"error": "処理結果が見つかりません"})), 404
+        return jsonify(nan_to_none(windowed_processing_data[process_id]))
+    except Exception as e:
+        logger.error(f"ウィンドウ別処理結果取得エラー: {str(e)}")
+        return jsonify(nan_to_none({"error": str(e)})), 500
+
+def background_segmented_process(file_bytes, filename, process_id, start_time, segment_col, min_support, n_jobs):
+    """セグメントの値ごとのルール・ネットワークを1つの接続行列から作成"""
+    temp_file = tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.csv')
+    try:
+        temp_file.write(file_bytes)
+        temp_file.close()
+        processing_status[process_id].update({
+            "progress": 10,
+            "message": "POSデータを読み込み中...",
+            "current_step": "POSデータ前処理"
+        })
+        df_pos = load_pos_frame(temp_file.name, filename)
+
+        processing_status[process_id].update({
+            "progress": 30,
+            "message": "セグメント別アソシエーション分析を実行中...",
+            "current_step": "アソシエーション分析"
+        })
+        segment_rules = calc_segmented_asociation(df_pos, segment_col, min_support=min_support, n_jobs=n_jobs)
+        df_pos = None
+
+        segments = {}
+        rules_tables = []
+        for i, (segment, rules) in enumerate(segment_rules.items()):
+            processing_status[process_id].update({
+                "progress": 50 + int(50 * i / max(len(segment_rules), 1)),
+                "message": f"ネットワークを作成中... ({i + 1}/{len(segment_rules)})",
+                "current_step": "ネットワーク描画"
+            })
+            segments[segment] = {
+                "rules_count": len(rules),
+                "network_data": create_network_json_from_rules(rules)
             }
-            for u, v, d in G.edges(data=True)
-        ]
+            rules_tables.append(rules.assign(segment=segment))
+
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        rules_filename = f"pos_segmented_{timestamp}.csv"
+        if rules_tables:
+            pd.concat(rules_tables, ignore_index=True).to_csv(
+                os.path.join(tempfile.gettempdir(), rules_filename), index=False, encoding='utf-8-sig'
+            )
+        processing_time = time.time() - start_time
+        segmented_processing_data[process_id] = {
+            "segment_col": segment_col,
+            "filename": rules_filename if rules_tables else None,
+            "segments": segments,
+            "processing_time": processing_time
+        }
+        processing_status[process_id].update({
+            "status": "completed",
+            "progress": 100,
+            "message": f"セグメント別処理が完了しました（{len(segments)} セグメント, 処理時間: {processing_time:.2f}秒）",
+            "current_step": "完了",
+            "processing_time": processing_time
+        })
+    except Exception as e:
+        logger.error(f"セグメント別処理エラー: {str(e)}")
+        logger.error(f"スタックトレース: {traceback.format_exc()}")
+        processing_status[process_id].update({
+            "status": "failed",
+            "progress": 0,
+            "message": f"エラーが発生しました: {str(e)}",
+            "current_step": "エラー"
+        })
+    finally:
+        if os.path.exists(temp_file.name):
+            os.unlink(temp_file.name)
+
+@posdata_bp.route("/api/posdata/segmented", methods=["POST"])
+@login_required
+def segmented_posdata():
+    """セグメント列の値ごとにルールとネットワークを作成"""
+    try:
+        if "file" not in request.files:
+            return jsonify({"error": "ファイルが必要です"}), 400
+        file = request.files["file"]
+        if not file.filename:
+            return jsonify({"error": "ファイル名が必要です"}), 400
+        segment_col = request.form.get("segment_col")
+        if not segment_col:
+            return jsonify({"error": "segment_colが必要です"}), 400
+        min_support = float(request.form.get("min_support", "0.0001"))
+        n_jobs = int(request.form.get("n_jobs", "1"))
 
-        return {"nodes": nodes, "links": links}
+        file_bytes_for_thread = bytes(file.read())
+        filename = file.filename
+        file = None
+
+        process_id = f"segmented_process_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        start_time = time.time()
+        processing_status[process_id] = {
+            "status": "processing",
+            "progress": 0,
+            "message": "セグメント別処理を開始しました",
+            "start_time": start_time,
+            "current_step": "POSデータ前処理"
+        }
+        thread = threading.Thread(
+            target=background_segmented_process,
+            args=(file_bytes_for_thread, filename, process_id, start_time, segment_col, min_support, n_jobs)
+        )
+        thread.daemon = True
+        thread.start()
+
+        return jsonify(nan_to_none({
+            "message": "セグメント別処理を開始しました",
+            "process_id": process_id
+        }))
+    except Exception as e:
+        logger.error(f"セグメント別処理開始エラー: {str(e)}")
+        return jsonify(nan_to_none({"error": str(e)})), 500
+
+@posdata_bp.route("/api/posdata/segmented/<process_id>", methods=["GET"])
+@login_required
+def get_segmented_result(process_id):
+    """セグメント別処理の結果（セグメントごとのネットワーク）を取得"""
+    try:
+        if process_id not in segmented_processing_data:
+            return jsonify(nan_to_none({"error": "処理結果が見つかりません"})), 404
+        return jsonify(nan_to_none(segmented_processing_data[process_id]))
+    except Exception as e:
+        logger.error(f"セグメント別処理結果取得エラー: {str(e)}")
+        return jsonify(nan_to_none({"error": str(e)})), 500
+
+@posdata_bp.route("/api/posdata/llm-mapping", methods=["POST"], strict_slashes=False)
+@login_required
+def llm_mapping_api():
+    try:
+        data = request.get_json()
+        columns = data.get("columns", [])
+        if not columns or not isinstance(columns, list):
+            return jsonify(nan_to_none({"error": "columnsリストが必要です"})), 400
+        mapping = llm_column_mapping(columns)
+        return jsonify(nan_to_none({"mapping": mapping}))
+    except Exception as e:
+        logger.error(f"LLMマッピングAPIエラー: {str(e)}")
+        return jsonify(nan_to_none({"error": str(e)})), 500
+
+def create_network_json_from_rules(rules, betweenness_mode="auto", betweenness_k=None, n_jobs=1, community_options=None, backbone_options=None, layout_options=None):
+    """
+    アソシエーションルールからネットワークデータを作成
+    n_jobs: 媒介中心性の計算で始点を分割するプロセス数
+    community_options: コミュニティ検出の方式・resolution・seed
+    backbone_options: 骨格抽出（alpha, top_k, min_lift）
+    layout_options: ノード座標の計算（enabled, iterations, seed）
+    """
+    try:
+        _, _, data = build_rules_network(
+            rules, betweenness_mode=betweenness_mode, betweenness_k=betweenness_k,
+            n_jobs=n_jobs, backbone=backbone_options, layout=layout_options, **(community_options or {})
+        )
+        return data
 
     except Exception as e:
         logging.error(f"ネットワークデータ作成エラー: {str(e)}")
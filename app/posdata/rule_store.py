@@ -0,0 +1,161 @@
+import os
+import re
+import tempfile
+import threading
+import logging
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from .pos_stream import AssociationAccumulator, read_pos_csv_chunks, DEFAULT_CHUNKSIZE
+from .pair_rules import pair_rules_from_counts, binary_rows, pair_count_delta
+
+# 集計ストアの保存先
+RULE_STORE_DIR = os.environ.get("POS_RULE_STORE_DIR", os.path.join(tempfile.gettempdir(), "pos_rule_store"))
+
+_STORE_ID_PATTERN = re.compile(r'^[\w\-]+$')
+
+# ストアごとの排他ロック
+_store_locks = {}
+_store_locks_guard = threading.Lock()
+
+# 読み込み済みストアのメモリキャッシュ
+_loaded_stores = {}
+
+class RuleStatsStore(AssociationAccumulator):
+    """
+    アソシエーションルールの十分統計量を保持し、追加データの差分だけで更新する
+    - 店舗ごとの顧客数・店舗ペアの共起顧客数
+    - 店舗ごとの利用金額合計
+    - 取り込み済みの (カード番号, 利用日時) キー
+    同じ行を再度取り込んでも集計は変わらないため、前日分を含むファイルをそのまま追加できる
+    """
+    def __init__(self):
+        super().__init__()
+        self.item_counts = np.zeros(0, dtype=np.int64)
+        self.pair_counts = sparse.csr_matrix((0, 0), dtype=np.int64)
+        self.n_transactions = 0
+
+    def _merge(self, keys, amount, shop):
+        """変化しうるカードの行だけを比較して、顧客数・共起数の差分を反映する"""
+        n_cards, n_shops = len(self.cards), len(self.shops)
+        cards = np.unique(keys >> 32)
+        self.card_shop.resize((n_cards, n_shops))
+        old = binary_rows(self.card_shop, cards)
+        result = super()._merge(keys, amount, shop)
+        new = binary_rows(self.card_shop, cards)
+
+        item_delta, pair_delta, n_delta = pair_count_delta(old, new)
+        self.item_counts = np.concatenate([self.item_counts, np.zeros(n_shops - len(self.item_counts), dtype=np.int64)])
+        self.item_counts += item_delta
+        self.pair_counts.resize((n_shops, n_shops))
+        self.pair_counts = (self.pair_counts + pair_delta).tocsr()
+        self.pair_counts.eliminate_zeros()
+        self.n_transactions += n_delta
+        return result
+
+    def to_rules(self, min_support=0.0001, max_len=2, n_jobs=1):
+        """保持している件数からルールを再計算（2店舗間は接続行列を使わない）"""
+        if max_len != 2:
+            return super().to_rules(min_support=min_support, max_len=max_len, n_jobs=n_jobs)
+        return pair_rules_from_counts(self.item_counts, self.pair_counts, self.n_transactions, self.shops.names, min_support=min_support)
+
+    def append_csv(self, file_path, chunksize=DEFAULT_CHUNKSIZE):
+        """
+        追加分のCSVを取り込む
+        戻り値: 取り込み行数・新規キー数・置き換えたキー数
+        """
+        n_rows, n_inserted, n_replaced = 0, 0, 0
+        usecols = ['カード番号', '利用日時', '利用金額', 'ショップ名略称']
+        for chunk in read_pos_csv_chunks(file_path, chunksize=chunksize, usecols=usecols):
+            inserted, replaced = self.add_chunk(chunk)
+            n_rows += len(chunk)
+            n_inserted += inserted
+            n_replaced += replaced
+        return {"rows": n_rows, "new_keys": n_inserted, "replaced_keys": n_replaced}
+
+    def summary(self):
+        return {
+            "n_rows": int(self.n_rows),
+            "n_keys": int(self.n_unique),
+            "n_transactions": int(self.n_transactions),
+            "n_cards": len(self.cards),
+            "n_shops": len(self.shops),
+            "n_pairs": int(self.pair_counts.nnz)
+        }
+
+    def save(self, path):
+        pairs = self.pair_counts.tocoo()
+        np.savez_compressed(
+            path,
+            cards=np.array(self.cards.names, dtype=str),
+            shops=np.array(self.shops.names, dtype=str),
+            keys=self.keys,
+            key_amounts=self.key_amounts,
+            key_shops=self.key_shops,
+            card_shop_data=self.card_shop.data,
+            card_shop_indices=self.card_shop.indices,
+            card_shop_indptr=self.card_shop.indptr,
+            shop_revenue=self.shop_revenue,
+            item_counts=self.item_counts,
+            pair_row=pairs.row,
+            pair_col=pairs.col,
+            pair_data=pairs.data,
+            counters=np.array([self.n_rows, self.n_transactions], dtype=np.int64)
+        )
+
+    @classmethod
+    def load(cls, path):
+        store = cls()
+        with np.load(path) as data:
+            store.cards.index = pd.Index(data['cards'].tolist(), dtype=object)
+            store.shops.index = pd.Index(data['shops'].tolist(), dtype=object)
+            n_cards, n_shops = len(store.cards), len(store.shops)
+            store.keys = data['keys']
+            store.key_amounts = data['key_amounts']
+            store.key_shops = data['key_shops']
+            store.card_shop = sparse.csr_matrix(
+                (data['card_shop_data'], data['card_shop_indices'], data['card_shop_indptr']),
+                shape=(n_cards, n_shops)
+            )
+            store.shop_revenue = data['shop_revenue']
+            store.item_counts = data['item_counts']
+            store.pair_counts = sparse.csr_matrix(
+                (data['pair_data'], (data['pair_row'], data['pair_col'])),
+                shape=(n_shops, n_shops)
+            )
+            store.n_rows, store.n_transactions = (int(v) for v in data['counters'])
+        return store
+
+def rule_store_path(store_id):
+    if not _STORE_ID_PATTERN.match(store_id or ''):
+        raise ValueError(f"無効なストアIDです: {store_id}")
+    return os.path.join(RULE_STORE_DIR, f"{store_id}.npz")
+
+def rule_store_lock(store_id):
+    with _store_locks_guard:
+        return _store_locks.setdefault(store_id, threading.Lock())
+
+def load_rule_store(store_id):
+    """保存済みのストアを読み込む（存在しなければ None）"""
+    if store_id in _loaded_stores:
+        return _loaded_stores[store_id]
+    path = rule_store_path(store_id)
+    if not os.path.exists(path):
+        return None
+    store = RuleStatsStore.load(path)
+    _loaded_stores[store_id] = store
+    return store
+
+def save_rule_store(store_id, store):
+    os.makedirs(RULE_STORE_DIR, exist_ok=True)
+    path = rule_store_path(store_id)
+    # 書き込み途中のファイルを読まないよう一時ファイル経由で置き換える
+    tmp_path = path + ".tmp.npz"
+    store.save(tmp_path)
+    os.replace(tmp_path, path)
+    _loaded_stores[store_id] = store
+    logging.info(f"ルール集計ストア保存完了: {path}")
+
+def discard_rule_store(store_id):
+    """メモリキャッシュのストアを破棄する（更新が途中で失敗したとき、次回は保存済みのファイルから読み直す）"""
+    _loaded_stores.pop(store_id, None)
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from scipy import sparse
+from .pair_rules import build_incidence_matrix, pair_rules_from_incidence
+
+# 利用日時・年齢から作る派生セグメント
+SEGMENT_WEEKDAY = '曜日'
+SEGMENT_AGE_BAND = '年代'
+WEEKDAY_NAMES = ['月', '火', '水', '木', '金', '土', '日']
+
+def derive_segment(df, segment_col):
+    """
+    セグメント列を取得する
+    ファイルにない場合は「曜日」（利用日時から）、「年代」（年齢・誕生日から）を作成
+    """
+    if segment_col in df.columns:
+        return df[segment_col]
+    if segment_col == SEGMENT_WEEKDAY and '利用日時' in df.columns:
+        weekday = pd.to_datetime(df['利用日時'], errors='coerce').dt.weekday
+        return pd.Categorical.from_codes(weekday.fillna(-1).astype(int), categories=WEEKDAY_NAMES)
+    if segment_col == SEGMENT_AGE_BAND:
+        if '年齢' in df.columns:
+            age = pd.to_numeric(df['年齢'], errors='coerce')
+        elif '誕生日' in df.columns:
+            age = (pd.Timestamp(datetime.now()) - pd.to_datetime(df['誕生日'], errors='coerce')).dt.days // 365
+        else:
+            raise ValueError('年代の計算には年齢または誕生日列が必要です')
+        band = (age // 10 * 10)
+        return band.map(lambda x: f"{int(x)}代" if pd.notnull(x) else None)
+    raise ValueError(f"セグメント列が見つかりません: {segment_col}")
+
+def build_segment_incidence(df_unique, segments):
+    """
+    (セグメント, カード) を行、店舗を列とする接続行列を1つだけ作成
+    戻り値: (接続行列, 各行のセグメントコード, セグメント名リスト, 店舗名リスト)
+    """
+    seg = pd.Categorical(segments)
+    cards = pd.Categorical(df_unique['カード番号'])
+    shops = pd.Categorical(df_unique['ショップ名略称'])
+    valid = (seg.codes >= 0) & (cards.codes >= 0) & (shops.codes >= 0)
+    n_cards = len(cards.categories)
+
+    row_keys = seg.codes[valid].astype(np.int64) * n_cards + cards.codes[valid]
+    unique_keys, row_ids = np.unique(row_keys, return_inverse=True)
+    shop_names = [str(s) for s in shops.categories]
+    X = build_incidence_matrix(row_ids, shops.codes[valid], len(unique_keys), len(shop_names))
+    row_segments = (unique_keys // n_cards).astype(np.int32)
+    return X, row_segments, [str(s) for s in seg.categories], shop_names
+
+def segment_shop_revenue(df_unique, segments, n_segments, shop_names):
+    """セグメント×店舗の利用金額合計"""
+    seg = pd.Categorical(segments)
+    shops = pd.Categorical(df_unique['ショップ名略称'], categories=shop_names)
+    valid = (seg.codes >= 0) & (shops.codes >= 0)
+    amount = np.nan_to_num(pd.to_numeric(df_unique['利用金額'], errors='coerce').to_numpy(dtype=np.float64))
+    return np.bincount(
+        seg.codes[valid].astype(np.int64) * len(shop_names) + shops.codes[valid],
+        weights=amount[valid],
+        minlength=n_segments * len(shop_names)
+    ).reshape(n_segments, len(shop_names))
+
+_worker_state = None
+
+def _init_worker(data, indices, indptr, shape, row_segments, shop_names, min_support):
+    global _worker_state
+    X = sparse.csr_matrix((data, indices, indptr), shape=shape)
+    _worker_state = (X, row_segments, shop_names, min_support)
+
+def _segment_rules_task(segment_code):
+    X, row_segments, shop_names, min_support = _worker_state
+    return pair_rules_from_incidence(X[row_segments == segment_code], shop_names, min_support=min_support)
+
+def segmented_pair_rules(df_unique, segment_col, min_support=0.0001, n_jobs=1):
+    """
+    セグメントの値ごとに2店舗間のアソシエーションルールを計算
+    接続行列は1回だけ作成し、セグメントごとに行マスクで取り出す
+    戻り値: {セグメント名: (ルール, {店舗: 利用金額})}
+    """
+    segments = derive_segment(df_unique, segment_col)
+    X, row_segments, segment_names, shop_names = build_segment_incidence(df_unique, segments)
+    revenue = segment_shop_revenue(df_unique, segments, len(segment_names), shop_names)
+    codes = list(range(len(segment_names)))
+
+    if n_jobs <= 1 or len(codes) < 2:
+        rules_list = [
+            pair_rules_from_incidence(X[row_segments == code], shop_names, min_support=min_support)
+            for code in codes
+        ]
+    else:
+        initargs = (X.data, X.indices, X.indptr, X.shape, row_segments, shop_names, min_support)
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=initargs) as executor:
+            rules_list = list(executor.map(_segment_rules_task, codes))
+
+    return {
+        segment_names[code]: (rules, dict(zip(shop_names, revenue[code])))
+        for code, rules in zip(codes, rules_list)
+    }
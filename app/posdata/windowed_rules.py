@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from .pair_rules import binary_rows, pair_count_delta, pair_rules_from_counts
+
+class SlidingPairCounter:
+    """
+    日単位の追加・削除でカード×店舗の件数行列を更新し、
+    店舗ごとの顧客数・店舗ペアの共起数を差分で保持する
+    """
+    def __init__(self, n_cards, n_shops):
+        self.counts = sparse.csr_matrix((n_cards, n_shops), dtype=np.int32)
+        self.item_counts = np.zeros(n_shops, dtype=np.int64)
+        self.pair_counts = sparse.csr_matrix((n_shops, n_shops), dtype=np.int64)
+        self.n_transactions = 0
+
+    def update(self, cards, shops, sign):
+        """(カード, 店舗) の組を sign=+1 で追加、sign=-1 で削除する"""
+        if len(cards) == 0:
+            return
+        delta = sparse.csr_matrix(
+            (np.full(len(cards), sign, dtype=np.int32), (cards, shops)),
+            shape=self.counts.shape
+        )
+        rows = np.unique(cards)
+        old = binary_rows(self.counts, rows)
+        self.counts = (self.counts + delta).tocsr()
+        self.counts.eliminate_zeros()
+        new = binary_rows(self.counts, rows)
+
+        item_delta, pair_delta, n_delta = pair_count_delta(old, new)
+        self.item_counts += item_delta
+        self.pair_counts = (self.pair_counts + pair_delta).tocsr()
+        self.pair_counts.eliminate_zeros()
+        self.n_transactions += n_delta
+
+def window_starts(n_days, window_days, stride_days):
+    """
+    ウィンドウの開始日（先頭日からの日数）。期間がウィンドウより短い場合は1つだけ
+    stride で末尾の日が残る場合は、最終日で終わるウィンドウを追加する
+    """
+    last_start = max(n_days - window_days, 0)
+    starts = list(range(0, last_start + 1, stride_days))
+    if starts[-1] != last_start:
+        starts.append(last_start)
+    return starts
+
+def iter_window_counts(card_codes, shop_codes, days, amounts, n_cards, n_shops, window_days=7, stride_days=1):
+    """
+    利用日でソートした1回の走査で、スライディングウィンドウごとの集計を順に返す
+    days は先頭日からの日数（int）
+    戻り値: (開始日, 終了日（含まない）, SlidingPairCounter, 店舗ごとの利用金額) のイテレータ
+    """
+    days = np.asarray(days, dtype=np.int64)
+    n_days = int(days.max()) + 1 if len(days) else 0
+
+    # 店舗ごと・日ごとの利用金額の累積和（ウィンドウの利用金額は差で求める）
+    day_revenue = np.bincount(
+        days * n_shops + shop_codes,
+        weights=np.nan_to_num(np.asarray(amounts, dtype=np.float64)),
+        minlength=n_days * n_shops
+    ).reshape(n_days, n_shops)
+    revenue_cumsum = np.vstack([np.zeros((1, n_shops)), np.cumsum(day_revenue, axis=0)])
+
+    # 日ごとの (カード, 店舗) の組（重複なし）を日付順に並べる
+    keys = np.unique((days * n_cards + card_codes) * n_shops + shop_codes)
+    triple_days = keys // (n_cards * n_shops)
+    triple_cards = (keys // n_shops) % n_cards
+    triple_shops = keys % n_shops
+    bounds = np.searchsorted(triple_days, np.arange(n_days + 1))
+
+    counter = SlidingPairCounter(n_cards, n_shops)
+    lo, hi = 0, 0
+    for start in window_starts(n_days, window_days, stride_days):
+        end = min(start + window_days, n_days)
+        # ウィンドウから外れた日を削除
+        remove_to = min(hi, start)
+        if remove_to > lo:
+            rows = slice(bounds[lo], bounds[remove_to])
+            counter.update(triple_cards[rows], triple_shops[rows], -1)
+        lo = start
+        if hi < start:
+            hi = start
+        # ウィンドウに入った日を追加
+        if end > hi:
+            rows = slice(bounds[hi], bounds[end])
+            counter.update(triple_cards[rows], triple_shops[rows], 1)
+            hi = end
+        yield start, end, counter, revenue_cumsum[end] - revenue_cumsum[start]
+
+def windowed_pair_rules(df_unique, window_days=7, stride_days=1, min_support=0.0001):
+    """
+    重複削除済みのPOSデータから、ウィンドウごとの2店舗間ルールを計算
+    戻り値: [(ウィンドウ開始日, ウィンドウ最終日, ルール, {店舗: 利用金額}), ...]
+    """
+    ts = pd.to_datetime(df_unique['利用日時'], errors='coerce')
+    valid = ts.notna().to_numpy()
+    df_valid = df_unique[valid]
+    dates = ts[valid].dt.normalize()
+    if len(dates) == 0:
+        return []
+    first_day = dates.min()
+    days = (dates - first_day).dt.days.to_numpy()
+
+    cards = pd.Categorical(df_valid['カード番号'])
+    shops = pd.Categorical(df_valid['ショップ名略称'])
+    ok = (cards.codes >= 0) & (shops.codes >= 0)
+    shop_names = [str(s) for s in shops.categories]
+    amounts = pd.to_numeric(df_valid['利用金額'], errors='coerce').to_numpy()
+
+    results = []
+    for start, end, counter, revenue in iter_window_counts(
+        cards.codes[ok].astype(np.int64), shops.codes[ok].astype(np.int64), days[ok], amounts[ok],
+        len(cards.categories), len(shop_names), window_days=window_days, stride_days=stride_days
+    ):
+        rules = pair_rules_from_counts(
+            counter.item_counts, counter.pair_counts, counter.n_transactions, shop_names, min_support=min_support
+        )
+        results.append((
+            first_day + pd.Timedelta(days=start),
+            first_day + pd.Timedelta(days=end - 1),
+            rules,
+            dict(zip(shop_names, revenue))
+        ))
+    return results
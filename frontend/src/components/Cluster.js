@@ -25,6 +25,8 @@ const Cluster = React.memo(({ autoProcessId }) => {
   const [clusterCounts, setClusterCounts] = useState({});
   const [clusteredData, setClusteredData] = useState([]);
   const [downloadFilename, setDownloadFilename] = useState(null);
+  // サーバー側に保持したクラスタリング結果のID（agg_df は先頭のページのみ）
+  const [resultId, setResultId] = useState(null);
   const [convertingToPos, setConvertingToPos] = useState(false);
 
   // autoProcessIdで自動描画
@@ -77,6 +79,7 @@ const Cluster = React.memo(({ autoProcessId }) => {
     setClusterCounts({});
     setClusteredData([]);
     setDownloadFilename(null);
+    setResultId(null);
     if (!f) return;
     const formData = new FormData();
     formData.append("file", f);
@@ -117,6 +120,7 @@ const Cluster = React.memo(({ autoProcessId }) => {
     setClusterCounts({});
     setClusteredData([]);
     setDownloadFilename(null);
+    setResultId(null);
     const formData = new FormData();
     formData.append("n_clusters", nClusters);
     formData.append("selected_columns", JSON.stringify(selectedColumns));
@@ -134,8 +138,12 @@ const Cluster = React.memo(({ autoProcessId }) => {
       setClusterNames(data.cluster_names);
       setRadarData(data.radar_chart_data);
       setDownloadFilename(data.download_filename);
-      // 件数取得
-      if (data.agg_df) {
+      setResultId(data.result_id || null);
+      // 件数取得（全件の件数はサーバーで集計済み）
+      if (data.cluster_counts) {
+        setClusteredData(data.agg_df || []);
+        setClusterCounts(data.cluster_counts);
+      } else if (data.agg_df) {
         setClusteredData(data.agg_df);
         const counts = {};
         data.agg_df.forEach(row => {
@@ -175,11 +183,13 @@ const Cluster = React.memo(({ autoProcessId }) => {
 
   // レーダーチャートデータをselectedColumnsで再生成
   useEffect(() => {
+    // サーバー側に結果がある場合は全件から計算したレーダーチャートをそのまま使う
+    if (resultId) return;
     if (clusteredData.length && selectedColumns.length) {
       setRadarData(getRadarDataFromSelected());
     }
     // eslint-disable-next-line
-  }, [clusteredData, selectedColumns]);
+  }, [clusteredData, selectedColumns, resultId]);
 
   // クラスタ抽出API
   const handleLegendClick = (e) => {
@@ -188,13 +198,13 @@ const Cluster = React.memo(({ autoProcessId }) => {
     fetch("/api/cluster/select", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ cluster_name: e.value })
+      body: JSON.stringify({ cluster_name: e.value, result_id: resultId, limit: 1 })
     })
       .then(res => res.json())
       .then(data => {
         if (data.data) {
           // 選択クラスタのデータ件数を更新
-          setClusterCounts(counts => ({ ...counts, [e.value]: data.data.length }));
+          setClusterCounts(counts => ({ ...counts, [e.value]: data.total ?? data.data.length }));
         }
       })
       .catch(err => setError("抽出に失敗しました"));
@@ -208,8 +218,21 @@ const Cluster = React.memo(({ autoProcessId }) => {
   };
 
   // CSVダウンロード
-  const handleDownloadCSV = () => {
+  const handleDownloadCSV = async () => {
     if (!selectedClusters.length || !clusteredData.length) return;
+    if (resultId) {
+      // 全件はサーバー側で絞り込んでCSVにする
+      const params = new URLSearchParams({ format: "csv" });
+      selectedClusters.forEach(name => params.append("cluster", name));
+      try {
+        const response = await fetch(`/api/cluster/results/${resultId}?${params.toString()}`, { credentials: 'include' });
+        if (!response.ok) throw new Error("CSVの取得に失敗しました");
+        saveAs(await response.blob(), "selected_clusters.csv");
+      } catch (e) {
+        setError(e.message);
+      }
+      return;
+    }
     // 選択したクラスタのデータのみ抽出
     const filtered = clusteredData.filter(row => selectedClusters.includes(row["クラスタ名"]));
     if (!filtered.length) return;
@@ -171,6 +171,9 @@ const DrawNetwork = React.memo(({ autoProcessId }) => {
     return labelSize * (1 + value);
   }, [showLabels, labelSize, nodeSizeType]);
 
+  // サーバーで計算済みの座標があればブラウザでの力学計算を省略
+  const hasServerLayout = graphData.nodes.length > 0 && graphData.nodes.every(n => Number.isFinite(n.x) && Number.isFinite(n.y));
+
   // ネットワーク効果除去後の売上計算
   const totalRevenue = graphData.nodes.reduce((sum, n) => sum + (n.revenue || 0), 0);
   const maxCentrality = Math.max(...graphData.nodes.map(n => n[nodeSizeType] || 0), 1);
@@ -398,6 +401,7 @@ const DrawNetwork = React.memo(({ autoProcessId }) => {
           <ForceGraph2D
             ref={fgRef}
             graphData={graphData}
+            cooldownTicks={hasServerLayout ? 0 : Infinity}
             nodeColor={getNodeColor}
             linkColor={getLinkColor}
             nodeRelSize={getNodeSize}
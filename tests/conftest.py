@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+@pytest.fixture
+def pos_df():
+    """
+    テスト用のPOSデータ（カード番号・利用日時・利用金額・ショップ名略称）
+    店舗の人気に偏りを付け、同じカード・同じ利用日時の重複行も含める
+    """
+    rng = np.random.default_rng(0)
+    n = 6000
+    shops = [f"店舗{i:02d}" for i in range(25)]
+    popularity = rng.dirichlet(np.full(len(shops), 0.6))
+    df = pd.DataFrame({
+        "カード番号": rng.integers(0, 900, n).astype(str),
+        "利用日時": (pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 90 * 86400, n), unit="s")).strftime("%Y-%m-%d %H:%M:%S"),
+        "利用金額": rng.integers(100, 10000, n).astype(float),
+        "ショップ名略称": rng.choice(shops, n, p=popularity)
+    })
+    duplicates = df.sample(300, random_state=1).assign(
+        利用金額=lambda d: d["利用金額"] + 1,
+        ショップ名略称=lambda d: rng.choice(shops, len(d))
+    )
+    return pd.concat([df, duplicates], ignore_index=True)
+
+def dedupe_purchases(df):
+    """同じカード・同じ利用日時の購買は利用金額が最大の1件だけ残す（drop_duplicate_purchases と同じ）"""
+    return df.sort_values(
+        by=["カード番号", "利用日時", "利用金額"], ascending=[True, True, False]
+    ).drop_duplicates(subset=["カード番号", "利用日時"], keep="first")
+
+def random_graph(n_nodes=60, n_edges=180, seed=0, integer_weights=True):
+    """連結とは限らない無向の重み付きグラフの辺 (始点名, 終点名, 重み)"""
+    rng = np.random.default_rng(seed)
+    pairs = set()
+    while len(pairs) < n_edges:
+        a, b = sorted(rng.integers(0, n_nodes, 2).tolist())
+        if a != b:
+            pairs.add((a, b))
+    pairs = sorted(pairs)
+    weights = rng.integers(1, 4, len(pairs)).astype(float) if integer_weights else rng.uniform(1.0, 3.0, len(pairs))
+    names = [f"店舗{i:03d}" for i in range(n_nodes)]
+    return [names[a] for a, _ in pairs], [names[b] for _, b in pairs], weights
+
+def planted_graph(n_groups=4, group_size=15, seed=0):
+    """グループ内は密、グループ間は疎な重み付きグラフの辺 (始点名, 終点名, 重み)（ノード i のグループは i // group_size）"""
+    rng = np.random.default_rng(seed)
+    n = n_groups * group_size
+    sources, targets, weights = [], [], []
+    for a in range(n):
+        for b in range(a + 1, n):
+            if rng.random() < (0.5 if a // group_size == b // group_size else 0.02):
+                sources.append(f"店舗{a:03d}")
+                targets.append(f"店舗{b:03d}")
+                weights.append(rng.uniform(1.0, 3.0))
+    return sources, targets, np.array(weights)
+
+def rules_network(n_nodes=30, n_edges=70, seed=5):
+    """random_graph の辺をルールにして build_rules_network で作ったネットワーク JSON"""
+    from app.network.graph_metrics import build_rules_network
+    sources, targets, lifts = random_graph(n_nodes=n_nodes, n_edges=n_edges, seed=seed, integer_weights=False)
+    rules = pd.DataFrame({"antecedents": sources, "consequents": targets, "lift": lifts + 1.0})
+    _, _, data = build_rules_network(rules, betweenness_mode="exact", layout={"iterations": 20})
+    return data
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from app.network.backbone import extract_backbone, backbone_options_from_form
+from app.network.graph_metrics import SparseGraph
+from conftest import random_graph
+
+def _graph():
+    return SparseGraph.from_edges(*random_graph(n_nodes=50, n_edges=200, seed=4, integer_weights=False))
+
+def _edges(graph):
+    return {frozenset((graph.nodes[u], graph.nodes[v])) for u, v in zip(graph.src, graph.dst)}
+
+def _disparity_reference(graph, alpha):
+    """辺ごとにループで計算するディスパリティ・フィルタ"""
+    G = graph.to_networkx()
+    kept = set()
+    for u, v, w in G.edges(data="weight"):
+        for node in (u, v):
+            k = G.degree(node)
+            s = G.degree(node, weight="weight")
+            if k <= 1 or (1 - w / s) ** (k - 1) < alpha:
+                kept.add(frozenset((u, v)))
+    return kept
+
+def _top_k_reference(graph, k):
+    G = graph.to_networkx()
+    kept = set()
+    for node in G.nodes:
+        edges = sorted(G.edges(node, data="weight"), key=lambda e: -e[2])
+        kept.update(frozenset((u, v)) for u, v, _ in edges[:k])
+    return kept
+
+@pytest.mark.parametrize("alpha", [0.05, 0.3])
+def test_disparity_filter_matches_reference(alpha):
+    graph = _graph()
+    backbone, info = extract_backbone(graph, alpha=alpha)
+    assert _edges(backbone) == _disparity_reference(graph, alpha)
+    assert info["edges_after"] == backbone.n_edges < graph.n_edges
+    # ノードは辺がなくなっても残す
+    np.testing.assert_array_equal(backbone.nodes, graph.nodes)
+
+@pytest.mark.parametrize("k", [1, 3])
+def test_top_k_matches_reference(k):
+    graph = _graph()
+    backbone, _ = extract_backbone(graph, top_k=k)
+    assert _edges(backbone) == _top_k_reference(graph, k)
+
+def test_filters_are_combined():
+    graph = _graph()
+    backbone, info = extract_backbone(graph, alpha=0.3, top_k=3, min_lift=2.0)
+    lifted = {frozenset((graph.nodes[u], graph.nodes[v])) for u, v, w in zip(graph.src, graph.dst, graph.weight) if w >= 2.0}
+    assert _edges(backbone) == lifted & _disparity_reference(graph, 0.3) & _top_k_reference(graph, 3)
+    assert info["removed_edges"] == sum(info["removed_by"].values())
+
+@pytest.mark.parametrize("form", [{"backbone_alpha": "0"}, {"backbone_alpha": "1.5"}, {"backbone_top_k": "0"}])
+def test_invalid_options_raise(form):
+    with pytest.raises(ValueError):
+        backbone_options_from_form(form)
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+import networkx as nx
+from app.network import centrality
+from app.network.centrality import compute_betweenness, resolve_betweenness_mode
+from app.network.graph_metrics import SparseGraph, closeness_centrality, degree_centrality
+from conftest import random_graph
+
+def _graph(**kwargs):
+    return SparseGraph.from_edges(*random_graph(**kwargs))
+
+def _networkx_betweenness(graph):
+    G = graph.to_networkx()
+    expected = nx.betweenness_centrality(G, weight="weight" if graph.weighted else None, normalized=True)
+    return np.array([expected[name] for name in graph.nodes])
+
+@pytest.mark.parametrize("integer_weights", [True, False])
+def test_exact_betweenness_matches_networkx(integer_weights):
+    # 整数の重みでは同じ長さの最短経路が複数でき、経路数の数え方も確認できる
+    graph = _graph(integer_weights=integer_weights)
+    betweenness, info = compute_betweenness(graph, mode="exact")
+    assert info["mode"] == "exact"
+    np.testing.assert_allclose(betweenness, _networkx_betweenness(graph), rtol=1e-9, atol=1e-12)
+
+def test_exact_betweenness_is_independent_of_source_block(monkeypatch):
+    graph = _graph(n_nodes=40, n_edges=120)
+    expected, _ = compute_betweenness(graph, mode="exact")
+    # メモリ上限を最小にすると始点ブロックは1始点ずつになる
+    monkeypatch.setattr(centrality, "BETWEENNESS_MEMORY_BUDGET_MB", 0)
+    assert centrality.source_block_size(len(graph.arcs()[0])) == 1
+    betweenness, _ = compute_betweenness(graph, mode="exact")
+    np.testing.assert_allclose(betweenness, expected, rtol=1e-12)
+
+def test_degree_and_closeness_match_networkx():
+    graph = _graph(integer_weights=False)
+    G = graph.to_networkx()
+    degree = nx.degree_centrality(G)
+    closeness = nx.closeness_centrality(G, distance="weight" if graph.weighted else None)
+    np.testing.assert_allclose(degree_centrality(graph), [degree[name] for name in graph.nodes], rtol=1e-12)
+    np.testing.assert_allclose(closeness_centrality(graph), [closeness[name] for name in graph.nodes], rtol=1e-9)
+
+@pytest.mark.parametrize("k", [0, 1])
+def test_approx_betweenness_rejects_fewer_than_two_pivots(k):
+    with pytest.raises(ValueError):
+        resolve_betweenness_mode(1000, mode="approx", k=k)
+
+def test_auto_mode_switches_at_threshold():
+    assert resolve_betweenness_mode(100, mode="auto", k=10, threshold=100) == ("exact", None)
+    assert resolve_betweenness_mode(101, mode="auto", k=10, threshold=100) == ("approx", 10)
+    # ピボット数がノード数以上なら厳密計算と同じ
+    assert resolve_betweenness_mode(10, mode="approx", k=10) == ("exact", None)
+
+def test_approx_betweenness_is_finite():
+    graph = _graph(n_nodes=80, n_edges=300)
+    betweenness, info = compute_betweenness(graph, mode="approx", k=2)
+    assert info["mode"] == "approx" and info["k"] == 2
+    assert np.all(np.isfinite(betweenness))
+
+def test_approx_betweenness_is_within_error_bound():
+    graph = _graph(n_nodes=80, n_edges=300)
+    exact, _ = compute_betweenness(graph, mode="exact")
+    approx, info = compute_betweenness(graph, mode="approx", k=40, seed=1)
+    assert 0 < info["error_bound"]
+    assert np.max(np.abs(approx - exact)) <= info["error_bound"]
+
+def test_parallel_betweenness_matches_serial():
+    # 始点ブロックより多いノード数にしてプロセスプールの経路を通す
+    graph = _graph(n_nodes=300, n_edges=900)
+    serial, _ = compute_betweenness(graph, mode="exact")
+    parallel, _ = compute_betweenness(graph, mode="exact", n_jobs=2)
+    np.testing.assert_allclose(parallel, serial, rtol=1e-12, atol=1e-15)
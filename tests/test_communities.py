@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from networkx.algorithms import community
+from app.network.communities import modularity, detect_communities
+from app.network.graph_metrics import SparseGraph
+from conftest import random_graph, planted_graph
+
+@pytest.mark.parametrize("resolution", [0.5, 1.0, 2.0])
+def test_modularity_matches_networkx(resolution):
+    graph = SparseGraph.from_edges(*random_graph(integer_weights=False))
+    labels = np.arange(graph.n_nodes) % 5
+    partition = [set(graph.nodes[labels == c]) for c in range(5)]
+    expected = community.modularity(graph.to_networkx(), partition, weight="weight", resolution=resolution)
+    assert modularity(graph.adjacency, labels, resolution=resolution) == pytest.approx(expected, rel=1e-12)
+
+def test_louvain_recovers_planted_communities():
+    graph = SparseGraph.from_edges(*planted_graph())
+    groups, info = detect_communities(graph, engine="louvain", seed=1)
+    planted = np.array([int(name[2:]) // 15 for name in graph.nodes])
+
+    assert info["n_communities"] == 4
+    # 同じグループのノードは同じコミュニティになる
+    for g in range(4):
+        assert len(np.unique(groups[planted == g])) == 1
+    assert info["modularity"] == pytest.approx(modularity(graph.adjacency, planted), rel=1e-12)
+
+def test_louvain_modularity_is_comparable_to_networkx():
+    graph = SparseGraph.from_edges(*random_graph(n_nodes=80, n_edges=240, integer_weights=False))
+    groups, info = detect_communities(graph, engine="louvain", seed=0)
+    reference = community.modularity(
+        graph.to_networkx(), community.louvain_communities(graph.to_networkx(), weight="weight", seed=0), weight="weight"
+    )
+    assert info["modularity"] == pytest.approx(modularity(graph.adjacency, groups), rel=1e-12)
+    assert info["modularity"] >= reference - 0.02
+    # 同じ seed なら同じ結果
+    again, _ = detect_communities(graph, engine="louvain", seed=0)
+    np.testing.assert_array_equal(groups, again)
+
+def test_greedy_matches_networkx_weighted():
+    graph = SparseGraph.from_edges(*random_graph(integer_weights=False))
+    groups, info = detect_communities(graph, engine="greedy")
+    expected = community.greedy_modularity_communities(graph.to_networkx(), weight="weight")
+    got = [set(graph.nodes[groups == c]) for c in range(info["n_communities"])]
+    assert got == [set(c) for c in expected]
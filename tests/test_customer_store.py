@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+from app.posdata.customer_store import CustomerFeatureStore
+from conftest import dedupe_purchases
+
+pytest.importorskip("pyarrow")
+
+def _features(store):
+    return store.features().sort_values("カード番号").reset_index(drop=True)
+
+def test_cumulative_append_equals_full_run(pos_df, tmp_path):
+    january = pos_df[pos_df["利用日時"] < "2024-02"]
+    january.to_csv(tmp_path / "january.csv", index=False)
+    pos_df.to_csv(tmp_path / "cumulative.csv", index=False)
+
+    incremental = CustomerFeatureStore()
+    incremental.append_csv(tmp_path / "january.csv", chunksize=1000)
+    incremental.append_csv(tmp_path / "cumulative.csv", chunksize=1000)
+    full = CustomerFeatureStore()
+    full.append_csv(tmp_path / "cumulative.csv")
+    pd.testing.assert_frame_equal(_features(incremental), _features(full))
+
+    deduped = dedupe_purchases(pos_df).groupby("カード番号")["利用金額"]
+    expected = pd.DataFrame({"利用回数": deduped.count(), "総利用金額": deduped.sum(), "最大利用金額": deduped.max()})
+    got = _features(full).set_index("カード番号")[expected.columns]
+    pd.testing.assert_frame_equal(got.sort_index(), expected.sort_index(), check_dtype=False, check_names=False)
+
+def test_store_round_trip(pos_df, tmp_path):
+    pos_df.to_csv(tmp_path / "pos.csv", index=False)
+    store = CustomerFeatureStore()
+    store.append_csv(tmp_path / "pos.csv", chunksize=2000)
+    store.save(tmp_path / "store.parquet")
+    loaded = CustomerFeatureStore.load(tmp_path / "store.parquet")
+    pd.testing.assert_frame_equal(_features(loaded), _features(store))
+
+    # 取り込み済みの購買だけのデータを追加しても特徴量は変わらない
+    appended = loaded.append_frame(pos_df.sample(500, random_state=2))
+    assert appended["new_keys"] == 0
+    pd.testing.assert_frame_equal(_features(loaded), _features(store))
@@ -0,0 +1,53 @@
+import io
+import zipfile
+import pandas as pd
+import pytest
+import networkx as nx
+from app.network.graph_index import GraphIndex
+from app.network.export import export_network
+from conftest import rules_network
+
+@pytest.fixture
+def graph_index():
+    return GraphIndex.from_network_json(rules_network())
+
+def _expected_edges(graph):
+    return {
+        frozenset((graph.nodes[u], graph.nodes[v])): w
+        for u, v, w in zip(graph.src, graph.dst, graph.weight)
+    }
+
+@pytest.mark.parametrize("fmt, reader", [("gexf", nx.read_gexf), ("graphml", nx.read_graphml)])
+def test_export_round_trip(graph_index, fmt, reader):
+    data = b"".join(export_network(graph_index, fmt))
+    G = reader(io.BytesIO(data))
+    graph = graph_index.graph
+
+    labels = {node: attrs["label"] for node, attrs in G.nodes(data=True)}
+    assert sorted(labels.values()) == sorted(graph.nodes.tolist())
+    expected_edges = _expected_edges(graph)
+    got_edges = {frozenset((labels[u], labels[v])): w for u, v, w in G.edges(data="weight")}
+    assert got_edges.keys() == expected_edges.keys()
+    for edge, weight in expected_edges.items():
+        assert got_edges[edge] == pytest.approx(weight, rel=1e-15)
+
+    betweenness = dict(zip(graph.nodes.tolist(), graph_index.attributes["betweenness"]))
+    for node, attrs in G.nodes(data=True):
+        assert attrs["betweenness"] == pytest.approx(betweenness[attrs["label"]], rel=1e-15)
+
+def test_gephi_csv_round_trip(graph_index):
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(export_network(graph_index, "gephi_csv"))))
+    assert sorted(archive.namelist()) == ["edges.csv", "nodes.csv"]
+    nodes = pd.read_csv(archive.open("nodes.csv"))
+    edges = pd.read_csv(archive.open("edges.csv"), float_precision="round_trip")
+    graph = graph_index.graph
+
+    assert nodes["Id"].tolist() == graph.nodes.tolist()
+    assert nodes["group"].tolist() == graph_index.attributes["group"].tolist()
+    got_edges = {frozenset((s, t)): w for s, t, w in zip(edges["Source"], edges["Target"], edges["Weight"])}
+    assert got_edges == _expected_edges(graph)
+    assert set(edges["Type"]) == {"Undirected"}
+
+def test_unknown_format_raises(graph_index):
+    with pytest.raises(ValueError):
+        export_network(graph_index, "dot")
@@ -0,0 +1,61 @@
+from collections import OrderedDict
+import numpy as np
+import pytest
+import networkx as nx
+from app.network import graph_index as graph_index_module
+from app.network.graph_index import GraphIndex, ego_network, induced_subgraph, register_graph_index, get_graph_index
+from conftest import rules_network
+
+@pytest.fixture
+def network_data():
+    return rules_network()
+
+def _networkx(data, min_lift=None):
+    G = nx.Graph()
+    G.add_nodes_from(node["id"] for node in data["nodes"])
+    G.add_weighted_edges_from(
+        (link["source"], link["target"], link["value"])
+        for link in data["links"] if min_lift is None or link["value"] >= min_lift
+    )
+    return G
+
+@pytest.mark.parametrize("depth, min_lift", [(1, None), (2, None), (2, 2.5)])
+def test_ego_network_matches_networkx(network_data, depth, min_lift):
+    center = network_data["nodes"][0]["id"]
+    G = _networkx(network_data, min_lift)
+    data = ego_network(GraphIndex.from_network_json(network_data), center, depth=depth, min_lift=min_lift)
+
+    expected = nx.single_source_shortest_path_length(G, center, cutoff=depth)
+    assert {node["id"]: node["hops"] for node in data["nodes"]} == expected
+    ego = G.subgraph(expected)
+    assert {frozenset((l["source"], l["target"])) for l in data["links"]} == {frozenset(e) for e in ego.edges}
+    local = nx.betweenness_centrality(ego, weight="weight")
+    for node in data["nodes"]:
+        assert node["local_betweenness"] == pytest.approx(local[node["id"]], abs=1e-12)
+
+def test_induced_subgraph_keeps_global_metrics(network_data):
+    index = GraphIndex.from_network_json(network_data)
+    shops = [node["id"] for node in network_data["nodes"][:10]]
+    data, missing = induced_subgraph(index, shops + ["存在しない店舗"])
+
+    assert missing == ["存在しない店舗"]
+    assert [node["id"] for node in data["nodes"]] == shops
+    expected = _networkx(network_data).subgraph(shops)
+    assert {frozenset((l["source"], l["target"])) for l in data["links"]} == {frozenset(e) for e in expected.edges}
+    by_id = {node["id"]: node for node in network_data["nodes"]}
+    for node in data["nodes"]:
+        assert node["betweenness"] == by_id[node["id"]]["betweenness"]
+        assert node["group"] == by_id[node["id"]]["group"]
+
+def test_unknown_center_returns_none(network_data):
+    assert ego_network(GraphIndex.from_network_json(network_data), "存在しない店舗") is None
+
+def test_registry_evicts_least_recently_used(network_data, monkeypatch):
+    monkeypatch.setattr(graph_index_module, "_graph_indexes", OrderedDict())
+    monkeypatch.setattr(graph_index_module, "GRAPH_INDEX_MAX", 2)
+    for process_id in ("a", "b"):
+        register_graph_index(process_id, network_data)
+    assert get_graph_index("a") is not None
+    register_graph_index("c", network_data)
+    assert get_graph_index("b") is None
+    assert get_graph_index("a") is not None and get_graph_index("c") is not None
@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+from scipy import sparse
+from app.posdata.pair_rules import build_pos_incidence
+from app.posdata.itemset_miner import (
+    mine_frequent_itemsets, mine_itemset_rules, join_itemset, split_itemset
+)
+from conftest import dedupe_purchases
+
+mlxtend = pytest.importorskip("mlxtend.frequent_patterns")
+
+MIN_SUPPORT = 0.002
+
+def test_mine_frequent_itemsets_matches_apriori_max_len_3(pos_df):
+    df = dedupe_purchases(pos_df)
+    X, shop_names = build_pos_incidence(df)
+    frequent, n_transactions = mine_frequent_itemsets(X, min_support=MIN_SUPPORT, max_len=3)
+    got = {frozenset(shop_names[i] for i in itemset): count / n_transactions for itemset, count in frequent.items()}
+
+    basket = pd.crosstab(df["カード番号"], df["ショップ名略称"]) > 0
+    freq = mlxtend.apriori(basket, min_support=MIN_SUPPORT, use_colnames=True, max_len=3)
+    expected = dict(zip(freq["itemsets"], freq["support"]))
+
+    assert max(len(itemset) for itemset in got) == 3
+    assert got.keys() == expected.keys()
+    for itemset, support in expected.items():
+        assert got[itemset] == pytest.approx(support, rel=1e-12)
+
+@pytest.mark.parametrize("names", [
+    ["B&B", "A & Co", "C"],
+    ["x\\", "&", " & "],
+])
+def test_join_itemset_sorts_and_round_trips(names):
+    label = join_itemset(names)
+    assert split_itemset(label) == sorted(names)
+    assert join_itemset(reversed(names)) == label
+
+def test_itemset_rule_labels_are_sorted_by_name():
+    # 店舗コード順と名前順が逆になるようにする
+    item_names = ["C", "B & B", "A"]
+    X = sparse.csr_matrix([[1, 1, 1]] * 4 + [[1, 0, 0], [0, 0, 1]])
+    rules = mine_itemset_rules(X, item_names, min_support=0.1, max_len=3)
+
+    multi = rules[rules["antecedent_len"] == 2]
+    assert len(multi) > 0
+    for label in multi["antecedents"]:
+        names = split_itemset(label)
+        assert names == sorted(names)
+        assert set(names) <= set(item_names)
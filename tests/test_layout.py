@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from app.network import layout
+from app.network.layout import compute_layout, force_layout, layout_options_from_form
+from app.network.graph_metrics import SparseGraph
+from conftest import planted_graph
+
+GROUP_SIZE = 15
+
+def _graph_and_groups():
+    graph = SparseGraph.from_edges(*planted_graph(group_size=GROUP_SIZE))
+    groups = np.array([int(name[2:]) // GROUP_SIZE for name in graph.nodes])
+    return graph, groups
+
+def _mean_distance(pos, mask):
+    dist = np.sqrt(((pos[:, None, :] - pos[None, :, :]) ** 2).sum(axis=-1))
+    return dist[mask & ~np.eye(len(pos), dtype=bool)].mean()
+
+def test_layout_separates_communities():
+    graph, groups = _graph_and_groups()
+    pos, info = compute_layout(graph, groups, iterations=100, seed=1)
+    same = groups[:, None] == groups[None, :]
+    assert info["approximate"] is False
+    assert _mean_distance(pos, same) < 0.5 * _mean_distance(pos, ~same)
+    # 辺の平均の長さは d3-force のリンク距離に合わせてある
+    delta = pos[graph.src] - pos[graph.dst]
+    assert np.sqrt((delta ** 2).sum(axis=1)).mean() == pytest.approx(30.0)
+    np.testing.assert_allclose(pos.mean(axis=0), 0, atol=1e-9)
+
+def test_layout_is_cached_and_reproducible():
+    graph, groups = _graph_and_groups()
+    pos, info = compute_layout(graph, groups, iterations=30, seed=7)
+    again, again_info = compute_layout(graph, groups, iterations=30, seed=7)
+    assert not info["cached"] and again_info["cached"]
+    np.testing.assert_array_equal(pos, again)
+    # キャッシュの配列を書き換えても次の結果は変わらない
+    again[:] = 0
+    np.testing.assert_array_equal(compute_layout(graph, groups, iterations=30, seed=7)[0], pos)
+    fresh, _ = force_layout(graph, groups, iterations=30, seed=7)
+    np.testing.assert_allclose(layout.scale_positions(graph, fresh), pos)
+
+def test_sampled_repulsion_for_large_graphs(monkeypatch):
+    graph, groups = _graph_and_groups()
+    monkeypatch.setattr(layout, "LAYOUT_EXACT_REPULSION_MAX", 10)
+    monkeypatch.setattr(layout, "_REPULSION_SAMPLE", 20)
+    pos, approximate = force_layout(graph, groups, iterations=50, seed=1)
+    assert approximate
+    assert np.all(np.isfinite(pos))
+
+def test_layout_options_from_form():
+    assert layout_options_from_form({}) == {"enabled": True, "iterations": layout.LAYOUT_ITERATIONS, "seed": 42}
+    assert layout_options_from_form({"layout": "false"})["enabled"] is False
+    with pytest.raises(ValueError):
+        layout_options_from_form({"layout_iterations": "-1"})
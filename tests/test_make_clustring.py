@@ -0,0 +1,135 @@
+import logging
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import pytest
+from app.clustering import make_clustring
+from sklearn.cluster import KMeans
+from sklearn.metrics import adjusted_rand_score, silhouette_score
+from sklearn.preprocessing import StandardScaler
+from app.clustering.make_clustring import (
+    cluster_main, cluster_main_streaming, sweep_k, k_range_from_form, infer_schema, infer_feature_spec, apply_feature_spec
+)
+
+@pytest.fixture(autouse=True)
+def no_llm(monkeypatch):
+    # クラスタ名は LLM を呼ばずにダミー名にする
+    monkeypatch.setenv("OPENAI_API_KEY", "")
+
+@pytest.fixture
+def customers():
+    """4つのはっきり分かれた顧客グループ（数値列・日付列・カテゴリ列）"""
+    rng = np.random.default_rng(0)
+    n_per_group = 300
+    centers = np.array([[5, 2000], [30, 20000], [5, 40000], [40, 5000]], dtype=float)
+    groups = np.repeat(np.arange(len(centers)), n_per_group)
+    values = centers[groups] * rng.normal(1.0, 0.05, (len(groups), 2))
+    birth_year = np.where(groups % 2 == 0, 1960, 1995) + rng.integers(0, 3, len(groups))
+    df = pd.DataFrame({
+        "利用回数": values[:, 0],
+        "総利用金額": values[:, 1],
+        "誕生日": pd.to_datetime(dict(year=birth_year, month=1, day=1)).dt.strftime("%Y-%m-%d"),
+        "性別": np.where(groups < 2, "男性", "女性")
+    })
+    order = rng.permutation(len(df))
+    return df.iloc[order].reset_index(drop=True), groups[order]
+
+def test_streaming_matches_in_memory_clusters(customers, tmp_path):
+    df, groups = customers
+    df.to_csv(tmp_path / "customers.csv", index=False)
+    output = tmp_path / "result.csv"
+    streamed = cluster_main_streaming(tmp_path / "customers.csv", "customers.csv", n_clusters=4,
+                                      chunksize=250, output_path=output, epochs=2)
+    in_memory = cluster_main(df.copy(), n_clusters=4)
+
+    assert streamed["n_rows"] == len(df)
+    assert sum(streamed["cluster_sizes"].values()) == len(df)
+    written = pd.read_csv(output)
+    assert len(written) == len(df)
+    assert list(written.columns) == streamed["model"]["features"] + ["クラスタ", "クラスタ名"]
+    assert adjusted_rand_score(groups, written["クラスタ"]) == 1.0
+    assert adjusted_rand_score(groups, in_memory["agg_df"]["クラスタ"]) == 1.0
+    # 特徴量の作り方・スケーリングは全件を一度に処理した場合と同じ
+    assert streamed["model"]["features"] == in_memory["model"]["features"]
+    np.testing.assert_allclose(streamed["model"]["scaler_mean"], in_memory["model"]["scaler_mean"], rtol=1e-9)
+    np.testing.assert_allclose(streamed["model"]["scaler_scale"], in_memory["model"]["scaler_scale"], rtol=1e-9)
+
+def test_streaming_with_chunks_smaller_than_k(tmp_path):
+    # 初期化に足りない行数のミニバッチは次のバッチと合わせて学習する
+    df = pd.DataFrame({"利用回数": [1, 2, 3, 50, 51, 52, 100, 101, 102, 103], "総利用金額": np.arange(10) * 10})
+    df.to_csv(tmp_path / "small.csv", index=False)
+    result = cluster_main_streaming(tmp_path / "small.csv", "small.csv", n_clusters=3, chunksize=2,
+                                    output_path=tmp_path / "result.csv")
+    labels = pd.read_csv(tmp_path / "result.csv")["クラスタ"]
+    assert len(labels) == 10 and labels.nunique() == 3
+    assert sorted(result["cluster_sizes"].values()) == sorted(labels.value_counts().tolist())
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_sweep_k_matches_individual_fits(customers, n_jobs):
+    df, groups = customers
+    X = StandardScaler().fit_transform(df[["利用回数", "総利用金額"]])
+    recommended, scores, candidates, _ = sweep_k(X, k_range=(2, 6), n_jobs=n_jobs, sample_size=len(X))
+
+    assert recommended == 4
+    assert [score["k"] for score in scores] == [2, 3, 4, 5, 6]
+    for score in scores:
+        model = KMeans(n_clusters=score["k"], random_state=42, n_init="auto").fit(X)
+        np.testing.assert_array_equal(candidates[score["k"]], model.labels_)
+        assert score["inertia"] == pytest.approx(model.inertia_)
+        assert score["silhouette"] == pytest.approx(silhouette_score(X, model.labels_))
+
+def test_auto_k_is_used_by_cluster_main(customers):
+    df, groups = customers
+    result = cluster_main(df.copy(), k_range=(2, 6))
+    assert result["k_sweep"]["recommended_k"] == 4
+    assert adjusted_rand_score(groups, result["agg_df"]["クラスタ"]) == 1.0
+
+def test_k_range_from_form():
+    assert k_range_from_form({"n_clusters": "4"}) is None
+    assert k_range_from_form({"n_clusters": "auto", "k_min": "2", "k_max": "5"}) == (2, 5)
+    with pytest.raises(ValueError):
+        k_range_from_form({"n_clusters": "auto", "k_min": "5", "k_max": "3"})
+
+@pytest.fixture
+def schema_cache(monkeypatch):
+    cache = OrderedDict()
+    monkeypatch.setattr(make_clustring, "_schema_cache", cache)
+    return cache
+
+def test_infer_schema_kinds(schema_cache):
+    df = pd.DataFrame({
+        "利用回数": [1, 2, 3],
+        "総利用金額": ["100", "200", "300"],
+        "誕生日": ["1980-01-01", "1990-05-05", "2000-12-31"],
+        "入会日": ["2020-01-01", "2021-01-01", "2022-01-01"],
+        "最頻曜日": ["月", "火", "月"],
+        "性別": ["男性", "女性", "男性"],
+        "メモ": [None, None, None]
+    })
+    assert infer_schema(df) == [
+        ("numeric", "利用回数"), ("numeric", "総利用金額"), ("age", "誕生日"),
+        ("date_parts", "入会日"), ("category", "最頻曜日"), ("category", "性別")
+    ]
+    assert len(schema_cache) == 1
+
+def test_schema_is_cached_by_columns_and_dtypes(schema_cache, monkeypatch):
+    df = pd.DataFrame({"利用回数": ["1", "2"], "性別": ["男性", "女性"]})
+    schema = infer_schema(df)
+    calls = []
+    monkeypatch.setattr(make_clustring, "infer_column_kind", lambda series, col: calls.append(col))
+    assert infer_schema(df.copy()) == schema
+    assert calls == []
+    infer_schema(df.astype({"利用回数": "int64"}))
+    assert calls == ["利用回数", "性別"]
+
+def test_values_outside_the_sample_are_coerced_and_logged(schema_cache, caplog):
+    # 抽出した値（1000件）はすべて数値だが、抽出外に変換できない値がある
+    values = [str(i) for i in range(2 * make_clustring.SCHEMA_SAMPLE_ROWS)]
+    values[1] = "不明"
+    df = pd.DataFrame({"利用回数": values})
+    spec = infer_feature_spec(df)
+    assert spec == [("numeric", "利用回数", None)]
+    with caplog.at_level(logging.WARNING):
+        features = apply_feature_spec(df, spec)
+    assert features["利用回数"].isna().sum() == 1
+    assert f"1 / {len(values)}" in caplog.text
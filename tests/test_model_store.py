@@ -0,0 +1,77 @@
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import pytest
+from app.clustering import model_store
+from app.clustering.make_clustring import cluster_main, cluster_main_streaming
+from app.clustering.model_store import ClusterModel, load_cluster_model, save_cluster_model
+
+@pytest.fixture(autouse=True)
+def isolated_store(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "")
+    monkeypatch.setattr(model_store, "CLUSTER_MODEL_DIR", str(tmp_path / "models"))
+    monkeypatch.setattr(model_store, "_loaded_models", OrderedDict())
+
+def _customers(seed, n_per_group=200):
+    rng = np.random.default_rng(seed)
+    centers = np.array([[5, 2000], [30, 20000], [5, 40000]], dtype=float)
+    groups = np.repeat(np.arange(len(centers)), n_per_group)
+    values = centers[groups] * rng.normal(1.0, 0.05, (len(groups), 2))
+    df = pd.DataFrame({"利用回数": values[:, 0], "総利用金額": values[:, 1], "性別": np.where(groups == 1, "男性", "女性")})
+    order = rng.permutation(len(df))
+    return df.iloc[order].reset_index(drop=True), groups[order]
+
+def test_assign_matches_training_labels_after_round_trip(tmp_path):
+    df, _ = _customers(0)
+    result = cluster_main(df.copy(), n_clusters=3)
+    save_cluster_model("m1", ClusterModel.from_result(result["model"]))
+    model_store._loaded_models.clear()
+    model = load_cluster_model("m1")
+
+    labels, distances = model.assign(df, batch_size=7)
+    np.testing.assert_array_equal(labels, result["agg_df"]["クラスタ"].to_numpy())
+    np.testing.assert_array_equal(model.label_names(labels), result["agg_df"]["クラスタ名"].to_numpy())
+    X = model.transform(df)
+    np.testing.assert_allclose(distances, np.linalg.norm(X - model.centroids[labels], axis=1))
+
+def test_assign_requires_training_columns():
+    df, _ = _customers(0)
+    model = ClusterModel.from_result(cluster_main(df.copy(), n_clusters=3)["model"])
+    with pytest.raises(ValueError):
+        model.assign(df.drop(columns=["性別"]))
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_warm_start_keeps_cluster_numbers_and_names(tmp_path, streaming):
+    first, _ = _customers(0)
+    previous = ClusterModel.from_result(cluster_main(first.copy(), n_clusters=3)["model"])
+    previous.cluster_names = {"0": "A", "1": "B", "2": "C"}
+    # 同じ分布の新しいデータで前回の重心から学習し直す
+    second, _ = _customers(1)
+    options = {"spec": previous.spec, "init_centroids": previous.centroids_original(), "cluster_names": previous.cluster_names}
+    if streaming:
+        second.to_csv(tmp_path / "second.csv", index=False)
+        result = cluster_main_streaming(tmp_path / "second.csv", "second.csv", n_clusters=3, chunksize=100,
+                                        output_path=tmp_path / "out.csv", **options)
+        labels = pd.read_csv(tmp_path / "out.csv")["クラスタ"].to_numpy()
+    else:
+        result = cluster_main(second.copy(), **options)
+        labels = result["agg_df"]["クラスタ"].to_numpy()
+
+    assert result["model"]["warm_start"]
+    assert result["cluster_names"] == previous.cluster_names
+    # 前回のモデルで割り当てた番号と同じ番号になる
+    np.testing.assert_array_equal(labels, previous.assign(second)[0])
+    updated = ClusterModel.from_result(result["model"], previous=previous)
+    assert updated.n_fits == 2 and updated.created_at == previous.created_at
+
+def test_loaded_models_are_bounded(monkeypatch):
+    df, _ = _customers(0, n_per_group=20)
+    model = ClusterModel.from_result(cluster_main(df.copy(), n_clusters=3)["model"])
+    monkeypatch.setattr(model_store, "CLUSTER_MODEL_CACHE_MAX", 2)
+    for model_id in ("a", "b", "c"):
+        save_cluster_model(model_id, model)
+    assert list(model_store._loaded_models) == ["b", "c"]
+    # 削除されたモデルはファイルから読み込み直す
+    assert load_cluster_model("a") is not None
+    assert list(model_store._loaded_models) == ["c", "a"]
+    assert load_cluster_model("存在しない") is None
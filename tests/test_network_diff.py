@@ -0,0 +1,54 @@
+import pytest
+from app.network.graph_index import GraphIndex
+from app.network.network_diff import diff_networks, match_communities
+from conftest import rules_network
+
+def _index(links, betweenness, groups):
+    nodes = [{"id": name, "betweenness": betweenness[name], "group": groups[name]} for name in betweenness]
+    return GraphIndex.from_network_json({
+        "nodes": nodes,
+        "links": [{"source": s, "target": t, "value": v} for s, t, v in links]
+    })
+
+def test_diff_reports_edge_node_and_rank_changes():
+    before = _index(
+        [("A", "B", 2.0), ("B", "C", 3.0), ("C", "D", 1.5)],
+        {"A": 0.0, "B": 0.6, "C": 0.4, "D": 0.0},
+        {"A": 0, "B": 0, "C": 1, "D": 1}
+    )
+    # コミュニティ番号は入れ替わっているが、A・B と D・E のまとまりは同じ
+    after = _index(
+        [("B", "A", 2.5), ("B", "C", 3.0), ("D", "E", 2.0)],
+        {"A": 0.0, "B": 0.3, "C": 0.0, "D": 0.5, "E": 0.0},
+        {"A": 1, "B": 1, "C": 1, "D": 0, "E": 0}
+    )
+    diff = diff_networks(before, after, metric="betweenness")
+
+    assert diff["edges"]["added"] == {"source": ["D"], "target": ["E"], "lift": [2.0]}
+    assert diff["edges"]["removed"] == {"source": ["C"], "target": ["D"], "lift": [1.5]}
+    assert diff["edges"]["changed"] == {
+        "source": ["A"], "target": ["B"], "lift_before": [2.0], "lift_after": [2.5], "delta": [0.5]
+    }
+    assert diff["nodes"]["added"] == ["E"] and diff["nodes"]["removed"] == []
+    ranks = dict(zip(diff["nodes"]["rank_changes"]["id"], diff["nodes"]["rank_changes"]["rank_change"]))
+    assert ranks == {"D": 2, "B": -1, "C": -1}
+    # 対応付け後にコミュニティが変わったのは C だけ
+    assert diff["nodes"]["community_changes"]["id"] == ["C"]
+    assert diff["summary"]["edge_jaccard"] == pytest.approx(2 / 4)
+
+def test_identical_networks_have_no_changes():
+    data = rules_network()
+    diff = diff_networks(GraphIndex.from_network_json(data), GraphIndex.from_network_json(data), metric="degree")
+    summary = diff["summary"]
+    assert summary["edge_jaccard"] == 1.0
+    assert summary["added_edges"] == summary["removed_edges"] == summary["changed_edges"] == 0
+    assert summary["reassigned_nodes"] == 0 and diff["nodes"]["rank_changes"]["id"] == []
+
+def test_match_communities_uses_largest_overlap():
+    mapping = match_communities([0, 0, 0, 1, 1], [5, 5, 7, 7, 7])
+    assert mapping.to_dict() == {5: 0, 7: 1}
+
+def test_unknown_metric_raises():
+    data = rules_network()
+    with pytest.raises(ValueError):
+        diff_networks(GraphIndex.from_network_json(data), GraphIndex.from_network_json(data), metric="pagerank")
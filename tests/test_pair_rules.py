@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+import pytest
+from app.posdata.pair_rules import calc_pair_rules
+from conftest import dedupe_purchases
+
+mlxtend = pytest.importorskip("mlxtend.frequent_patterns")
+
+MIN_SUPPORT = 0.002
+
+def _basket(df):
+    """mlxtend に渡すカード×店舗の True/False 表（以前の calc_asociation と同じ作り方）"""
+    return pd.crosstab(df["カード番号"], df["ショップ名略称"]) > 0
+
+def test_calc_pair_rules_matches_mlxtend(pos_df):
+    df = dedupe_purchases(pos_df)
+    freq = mlxtend.apriori(_basket(df), min_support=MIN_SUPPORT, use_colnames=True, max_len=2)
+    expected = mlxtend.association_rules(freq, metric="lift", min_threshold=1, num_itemsets=len(freq))
+    expected["antecedents"] = expected["antecedents"].map(lambda s: next(iter(s)))
+    expected["consequents"] = expected["consequents"].map(lambda s: next(iter(s)))
+
+    rules = calc_pair_rules(df, min_support=MIN_SUPPORT)
+
+    assert len(rules) == len(expected) > 0
+    columns = ["support", "confidence", "lift", "leverage", "antecedent support", "consequent support"]
+    merged = rules.merge(expected, on=["antecedents", "consequents"], suffixes=("", "_mlxtend"))
+    assert len(merged) == len(expected)
+    for col in columns:
+        np.testing.assert_allclose(merged[col], merged[f"{col}_mlxtend"], rtol=1e-12)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from app.network.payload import (
+    columnar_network, encode_network_binary, decode_network_binary, network_format_from_args
+)
+from conftest import rules_network
+
+def test_columnar_round_trip():
+    data = rules_network()
+    table = columnar_network(data)
+    assert table["n_nodes"] == len(data["nodes"]) and table["n_links"] == len(data["links"])
+
+    ids = table["nodes"]["id"]
+    nodes = [dict(zip(table["nodes"], values)) for values in zip(*table["nodes"].values())]
+    links = [
+        {"source": ids[s], "target": ids[t], "value": v}
+        for s, t, v in zip(table["links"]["source"], table["links"]["target"], table["links"]["value"])
+    ]
+    assert nodes == data["nodes"]
+    assert links == data["links"]
+    assert table["meta"] == data["meta"]
+
+def test_binary_round_trip():
+    data = rules_network()
+    table = columnar_network(data)
+    header, arrays = decode_network_binary(encode_network_binary(data))
+
+    assert header["ids"] == table["nodes"]["id"]
+    assert header["n_links"] == table["n_links"]
+    assert all(spec["offset"] % 8 == 0 for spec in header["arrays"])
+    for key, values in table["nodes"].items():
+        if key == "id":
+            continue
+        np.testing.assert_allclose(arrays[f"nodes.{key}"], np.asarray(values, dtype=np.float32), rtol=1e-7)
+    np.testing.assert_array_equal(arrays["nodes.group"], table["nodes"]["group"])
+    np.testing.assert_array_equal(arrays["links.source"], table["links"]["source"])
+    np.testing.assert_array_equal(arrays["links.target"], table["links"]["target"])
+    np.testing.assert_allclose(arrays["links.value"], np.asarray(table["links"]["value"], dtype=np.float32))
+
+def test_decode_rejects_other_data():
+    with pytest.raises(ValueError):
+        decode_network_binary(b"{}")
+
+def test_format_from_args():
+    assert network_format_from_args({}) == "dict"
+    assert network_format_from_args({"format": "binary"}) == "binary"
+    with pytest.raises(ValueError):
+        network_format_from_args({"format": "xml"})
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+from app.posdata.pos_stream import stream_pos_file
+from app.posdata.pair_rules import calc_pair_rules
+from conftest import dedupe_purchases
+
+MIN_SUPPORT = 0.002
+
+def _sorted_rules(rules):
+    return rules.sort_values(["antecedents", "consequents"]).reset_index(drop=True)
+
+def test_streamed_rules_match_in_memory(pos_df, tmp_path):
+    pos_df.to_csv(tmp_path / "pos.csv", index=False)
+    association, _ = stream_pos_file(tmp_path / "pos.csv", chunksize=700)
+
+    assert association.n_rows == len(pos_df)
+    assert association.n_unique == len(dedupe_purchases(pos_df))
+    got = _sorted_rules(association.to_rules(min_support=MIN_SUPPORT))
+    expected = _sorted_rules(calc_pair_rules(dedupe_purchases(pos_df), min_support=MIN_SUPPORT))
+    assert len(got) == len(expected) > 0
+    pd.testing.assert_frame_equal(got, expected, check_exact=False, rtol=1e-12)
+
+def test_streamed_customer_summary_matches_groupby(pos_df, tmp_path):
+    pos_df.loc[pos_df.sample(40, random_state=3).index, "利用日時"] = "不明"
+    pos_df.to_csv(tmp_path / "pos.csv", index=False)
+    _, summary = stream_pos_file(tmp_path / "pos.csv", chunksize=700)
+    got = summary.customer_data().set_index("カード番号").sort_index()
+
+    grouped = pos_df.groupby("カード番号")["利用金額"]
+    hours = pd.to_datetime(pos_df["利用日時"], errors="coerce").dt.hour
+    counts = pd.crosstab(pos_df["カード番号"], hours).reindex(columns=range(24), fill_value=0)
+    np.testing.assert_array_equal(got["利用回数"], grouped.count().sort_index())
+    np.testing.assert_allclose(got["総利用金額"], grouped.sum().sort_index())
+    np.testing.assert_allclose(got["最大利用金額"], grouped.max().sort_index())
+    np.testing.assert_array_equal(got["最頻時間帯"], counts.sort_index().to_numpy().argmax(axis=1))
@@ -0,0 +1,40 @@
+import os
+import stat
+import pandas as pd
+import pytest
+from app.posdata import result_cache
+from app.posdata.result_cache import result_cache_key, load_cached_result, store_cached_result
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    path = tmp_path / "pos_result_cache"
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_DIR", str(path))
+    return path
+
+def _result():
+    return {"clustering_data": {"agg_df": pd.DataFrame({"カード番号": ["1", "2"], "cluster": [0, 1]})}, "category": ["a"]}
+
+def test_key_depends_on_file_and_params():
+    key = result_cache_key(b"abc", {"x": "カード番号"}, {"min_support": 0.001})
+    assert key == result_cache_key(b"abc", {"x": "カード番号"}, {"min_support": 0.001})
+    assert key != result_cache_key(b"abd", {"x": "カード番号"}, {"min_support": 0.001})
+    assert key != result_cache_key(b"abc", {"x": "カード番号"}, {"min_support": 0.002})
+
+def test_round_trip_in_private_directory(cache_dir):
+    key = result_cache_key(b"abc", {}, {})
+    assert load_cached_result(key) is None
+    store_cached_result(key, _result())
+
+    assert stat.S_IMODE(os.stat(cache_dir).st_mode) & 0o077 == 0
+    loaded = load_cached_result(key)
+    pd.testing.assert_frame_equal(loaded["clustering_data"]["agg_df"], _result()["clustering_data"]["agg_df"])
+    assert loaded["category"] == ["a"]
+
+def test_writable_directory_is_not_used(cache_dir):
+    key = result_cache_key(b"abc", {}, {})
+    store_cached_result(key, _result())
+    os.chmod(cache_dir, 0o777)
+
+    assert load_cached_result(key) is None
+    store_cached_result(result_cache_key(b"other", {}, {}), _result())
+    assert sorted(os.listdir(cache_dir)) == [key]
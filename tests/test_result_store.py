@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+from app.clustering import result_store
+from app.clustering.result_store import ClusterResult, ClusterResultFile
+
+QUERIES = [
+    {},
+    {"clusters": ["高頻度"]},
+    {"clusters": ["休眠, 顧客", "低頻度"], "sort": "a", "ascending": False, "offset": 50, "limit": 300},
+    {"filters": [("b", "ge", "25"), ("a", "lt", "0")], "sort": "b", "columns": ["b", "クラスタ名"], "offset": 700, "limit": 500},
+    {"filters": [("クラスタ名", "contains", "頻")], "limit": None},
+    {"clusters": ["存在しないクラスタ"]}
+]
+
+@pytest.fixture
+def results(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 5000
+    frame = pd.DataFrame({
+        "a": rng.normal(size=n).round(3),
+        "b": rng.integers(0, 50, n),
+        "クラスタ": rng.integers(0, 4, n)
+    })
+    frame["クラスタ名"] = frame["クラスタ"].map({0: "高頻度", 1: "低頻度", 2: "休眠, 顧客", 3: "高頻度"})
+    frame.loc[rng.choice(n, 50), "a"] = np.nan
+    path = tmp_path / "result.csv"
+    frame.to_csv(path, index=False, encoding="utf-8-sig")
+    return ClusterResult(frame), ClusterResultFile(path, chunksize=700)
+
+def test_file_result_summary_matches_memory(results):
+    memory, on_disk = results
+    assert on_disk.n_rows == memory.n_rows
+    assert on_disk.columns == memory.columns
+    assert on_disk.cluster_sizes() == memory.cluster_sizes()
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_file_result_query_matches_memory(results, query):
+    memory, on_disk = results
+    total, expected = memory.query(**query)
+    got_total, got = on_disk.query(**query)
+    assert got_total == total
+    pd.testing.assert_frame_equal(got.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False)
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_write_csv_matches_query(results, query, tmp_path):
+    memory, on_disk = results
+    query = {key: value for key, value in query.items() if key not in ("offset", "limit")}
+    _, expected = memory.query(**query, limit=None)
+    for result in results:
+        path = tmp_path / "selected.csv"
+        result.write_csv(path, **query)
+        got = pd.read_csv(path, encoding="utf-8-sig")
+        pd.testing.assert_frame_equal(got.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False)
+
+def test_unknown_column_is_rejected(results):
+    for result in results:
+        with pytest.raises(ValueError):
+            result.query(sort="存在しない列")
+
+def test_filter_and_sort_columns_are_read_once(results, monkeypatch):
+    _, on_disk = results
+    column_reads = []
+    read = on_disk._read
+
+    def counting_read(**kwargs):
+        # ページの行はチャンクで読み、列全体の読み込みだけを数える
+        if "chunksize" not in kwargs:
+            column_reads.extend(kwargs["usecols"])
+        return read(**kwargs)
+
+    monkeypatch.setattr(on_disk, "_read", counting_read)
+    query = {"filters": [("b", "ge", "25")], "sort": "a", "columns": ["a"], "limit": 10}
+    first_total, _ = on_disk.query(**query)
+    second_total, _ = on_disk.query(**dict(query, offset=10))
+    assert sorted(column_reads) == ["a", "b"]
+    assert first_total == second_total
+
+def test_column_cache_is_bounded(results, monkeypatch):
+    _, on_disk = results
+    monkeypatch.setattr(result_store, "RESULT_COLUMN_CACHE_MAX", 2)
+    for col in ("a", "b", "クラスタ"):
+        on_disk.query(sort=col, limit=1)
+    assert list(on_disk._column_cache) == ["b", "クラスタ"]
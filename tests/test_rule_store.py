@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+from app.posdata.rule_store import RuleStatsStore
+from app.posdata.pair_rules import calc_pair_rules
+from conftest import dedupe_purchases
+
+MIN_SUPPORT = 0.002
+
+def _sorted_rules(rules):
+    return rules.sort_values(["antecedents", "consequents"]).reset_index(drop=True)
+
+def test_incremental_store_equals_full_run(pos_df, tmp_path):
+    # 1月分のファイルのあとに 1〜3月の累積ファイルを追加する
+    january = pos_df[pos_df["利用日時"] < "2024-02"]
+    january.to_csv(tmp_path / "january.csv", index=False)
+    pos_df.to_csv(tmp_path / "cumulative.csv", index=False)
+
+    incremental = RuleStatsStore()
+    incremental.append_csv(tmp_path / "january.csv", chunksize=1000)
+    incremental.append_csv(tmp_path / "cumulative.csv", chunksize=1000)
+    full = RuleStatsStore()
+    full.append_csv(tmp_path / "cumulative.csv")
+
+    got = _sorted_rules(incremental.to_rules(min_support=MIN_SUPPORT))
+    pd.testing.assert_frame_equal(got, _sorted_rules(full.to_rules(min_support=MIN_SUPPORT)))
+    expected = _sorted_rules(calc_pair_rules(dedupe_purchases(pos_df), min_support=MIN_SUPPORT))
+    assert len(got) == len(expected) > 0
+    pd.testing.assert_frame_equal(got, expected, check_exact=False, rtol=1e-12)
+
+def test_store_round_trip(pos_df, tmp_path):
+    pos_df.to_csv(tmp_path / "pos.csv", index=False)
+    store = RuleStatsStore()
+    store.append_csv(tmp_path / "pos.csv", chunksize=2000)
+    store.save(tmp_path / "store.npz")
+    loaded = RuleStatsStore.load(tmp_path / "store.npz")
+
+    assert loaded.summary() == store.summary()
+    pd.testing.assert_frame_equal(
+        _sorted_rules(loaded.to_rules(min_support=MIN_SUPPORT)),
+        _sorted_rules(store.to_rules(min_support=MIN_SUPPORT))
+    )
+    # 読み込んだストアへ同じファイルを追加しても集計は変わらない
+    loaded.append_csv(tmp_path / "pos.csv")
+    assert np.array_equal(loaded.item_counts, store.item_counts)
@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+from app.posdata.segmented_rules import segmented_pair_rules, WEEKDAY_NAMES
+from app.posdata.pair_rules import calc_pair_rules
+from conftest import dedupe_purchases
+
+MIN_SUPPORT = 0.005
+
+def _sorted_rules(rules):
+    return rules.sort_values(["antecedents", "consequents"]).reset_index(drop=True)
+
+def _assert_matches_per_segment(df, results, segment_values):
+    assert set(results) == set(segment_values.dropna().astype(str))
+    for segment, (rules, revenue) in results.items():
+        part = df[segment_values.astype(str) == segment]
+        expected = calc_pair_rules(part, min_support=MIN_SUPPORT)
+        assert len(rules) == len(expected) > 0
+        pd.testing.assert_frame_equal(_sorted_rules(rules), _sorted_rules(expected), check_exact=False, rtol=1e-12)
+        for shop, amount in part.groupby("ショップ名略称")["利用金額"].sum().items():
+            assert revenue[shop] == pytest.approx(amount)
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_segmented_rules_match_per_segment_recompute(pos_df, n_jobs):
+    df = dedupe_purchases(pos_df)
+    df["性別"] = (df["カード番号"].astype(int) % 3 == 0).map({True: "女性", False: "男性"})
+    results = segmented_pair_rules(df, "性別", min_support=MIN_SUPPORT, n_jobs=n_jobs)
+    _assert_matches_per_segment(df, results, df["性別"])
+
+def test_weekday_segment_is_derived_from_timestamp(pos_df):
+    df = dedupe_purchases(pos_df)
+    weekday = pd.to_datetime(df["利用日時"]).dt.weekday.map(dict(enumerate(WEEKDAY_NAMES)))
+    results = segmented_pair_rules(df, "曜日", min_support=MIN_SUPPORT)
+    _assert_matches_per_segment(df, results, weekday)
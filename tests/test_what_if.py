@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from app.network.centrality import compute_betweenness
+from app.network.graph_metrics import SparseGraph, closeness_centrality
+from app.network.graph_index import GraphIndex
+from app.network.what_if import remove_nodes_incremental, merge_nodes, simulate_what_if
+from conftest import random_graph, rules_network
+
+def test_remove_nodes_incremental_matches_full_recompute():
+    sources, targets, weights = random_graph(n_nodes=60, n_edges=180, seed=3)
+    # 葉のノードを付けておき、削除の影響が一部の始点に限られるようにする
+    sources += ["店舗000", "店舗001"]
+    targets += ["葉A", "葉B"]
+    weights = np.concatenate([weights, [1.0, 2.0]])
+    graph = SparseGraph.from_edges(sources, targets, weights)
+    betweenness, _ = compute_betweenness(graph, mode="exact")
+    closeness = closeness_centrality(graph)
+    # 葉と、最短経路の途中にほとんど現れないノードを削除する
+    leaf = int(np.flatnonzero(graph.nodes == "葉A")[0])
+    quiet = next(int(i) for i in np.argsort(betweenness, kind="stable") if i != leaf)
+    removed = [leaf, quiet]
+
+    result = remove_nodes_incremental(graph, betweenness, closeness, removed)
+    assert result is not None
+    new_graph, new_betweenness, new_closeness, _ = result
+
+    expected_betweenness, _ = compute_betweenness(new_graph, mode="exact")
+    np.testing.assert_allclose(new_betweenness, expected_betweenness, rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(new_closeness, closeness_centrality(new_graph), rtol=1e-9, atol=1e-12)
+
+@pytest.mark.parametrize("n_remove", [1, 3])
+def test_simulate_what_if_matches_recompute(n_remove):
+    data = rules_network(n_nodes=40, n_edges=90, seed=2)
+    index = GraphIndex.from_network_json(data)
+    remove = index.graph.nodes[np.argsort(index.attributes["betweenness"], kind="stable")[:n_remove]].tolist()
+    result = simulate_what_if(index, remove=remove, limit=0)
+
+    new_graph = index.graph.subgraph(np.setdiff1d(np.arange(index.graph.n_nodes), index.index.get_indexer(remove)))
+    expected, _ = compute_betweenness(new_graph, mode="exact")
+    expected = dict(zip(new_graph.nodes.tolist(), expected))
+    got = dict(zip(result["nodes"]["id"], result["nodes"]["betweenness_after"]))
+    assert got.keys() == expected.keys()
+    for name, value in expected.items():
+        assert got[name] == pytest.approx(value, abs=1e-12)
+    assert result["summary"]["mode"] == "incremental"
+    assert result["summary"]["nodes_after"] == index.graph.n_nodes - n_remove
+
+def test_merge_nodes_keeps_max_lift():
+    graph = SparseGraph.from_edges(["A", "B", "A", "C"], ["C", "C", "B", "D"], [1.5, 2.5, 3.0, 1.2])
+    merged = merge_nodes(graph, [{"into": "AB", "members": ["A", "B"]}])
+    edges = {frozenset((merged.nodes[u], merged.nodes[v])): w for u, v, w in zip(merged.src, merged.dst, merged.weight)}
+    assert edges == {frozenset(("AB", "C")): 2.5, frozenset(("C", "D")): 1.2}
+
+def test_unknown_shop_raises():
+    index = GraphIndex.from_network_json(rules_network())
+    with pytest.raises(ValueError):
+        simulate_what_if(index, remove=["存在しない店舗"])
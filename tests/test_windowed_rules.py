@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+from app.posdata.windowed_rules import window_starts, windowed_pair_rules
+from app.posdata.pair_rules import calc_pair_rules
+from conftest import dedupe_purchases
+
+MIN_SUPPORT = 0.005
+
+def _sorted_rules(rules):
+    return rules.sort_values(["antecedents", "consequents"]).reset_index(drop=True)
+
+@pytest.mark.parametrize("n_days,window_days,stride_days", [
+    (90, 14, 10), (90, 7, 1), (10, 3, 3), (11, 4, 3), (5, 7, 2), (30, 30, 7)
+])
+def test_window_starts_cover_every_day(n_days, window_days, stride_days):
+    starts = window_starts(n_days, window_days, stride_days)
+    covered = set()
+    for start in starts:
+        covered.update(range(start, min(start + window_days, n_days)))
+    assert covered == set(range(n_days))
+    assert starts == sorted(set(starts))
+    assert starts[-1] == max(n_days - window_days, 0)
+
+def test_windowed_rules_match_per_window_recompute(pos_df):
+    df = dedupe_purchases(pos_df)
+    days = pd.to_datetime(df["利用日時"]).dt.normalize()
+    windows = windowed_pair_rules(df, window_days=14, stride_days=10, min_support=MIN_SUPPORT)
+
+    assert windows[-1][1] == days.max()
+    for window_start, window_end, rules, revenue in windows:
+        in_window = df[(days >= window_start) & (days <= window_end)]
+        expected = calc_pair_rules(in_window, min_support=MIN_SUPPORT)
+        assert len(rules) == len(expected) > 0
+        pd.testing.assert_frame_equal(_sorted_rules(rules), _sorted_rules(expected), check_exact=False, rtol=1e-12)
+        expected_revenue = in_window.groupby("ショップ名略称")["利用金額"].sum()
+        for shop, amount in expected_revenue.items():
+            assert revenue[shop] == pytest.approx(amount)